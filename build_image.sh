@@ -57,6 +57,7 @@ uboot_env=
 check_commands="sgdisk:gdisk"
 sbom_config="$(realpath baseos_sbom.yaml)"
 sbom_external=
+sbom_pid=
 
 # parse args
 while [ $# -ne 0 ]
@@ -293,6 +294,7 @@ setup_extlinux() {
 # Main
 #######
 cleanup() {
+    [ -n "$sbom_pid" ] && kill "$sbom_pid" 2>/dev/null && wait "$sbom_pid"
     [ -n "$workdir" ] || return
     [ -d "$workdir/mnt" ] && sudo umount "$workdir/mnt"
     rm -rf --one-file-system "$workdir"
@@ -628,13 +630,27 @@ board_has_swu() {
     return 1
 }
 
-build_sbom() {
-    echo "Creating SBOM"
+prepare_sbom() {
+    # Everything but the image checksums is added to the sbom in background
+    # while the image is being built, see build_sbom
+    echo "Preparing SBOM"
 
-    "$scriptdir/build_sbom.sh" -i "$output" -c "$sbom_config" \
+    "$scriptdir/build_sbom.sh" --prepare "$workdir/sbom.prepared" \
+            -i "$output" -c "$sbom_config" \
             -o "$outdir/$output" \
             ${sbom_external:+-e "$sbom_external"} \
-            -e "$rootfs.spdx.json" \
+            -e "$rootfs.spdx.json" &
+    sbom_pid=$!
+}
+
+build_sbom() {
+    echo "Creating SBOM"
+
+    local pid="$sbom_pid"
+    sbom_pid=""
+    wait "$pid" \
+        || error "Could not prepare sbom"
+    "$scriptdir/build_sbom.sh" --finalize "$workdir/sbom.prepared" \
         || error "Could not build sbom"
 
     if [ -z "$sbom_external" ] && board_has_swu; then
@@ -643,6 +659,7 @@ build_sbom() {
     fi
 }
 
+[ -n "$sbom" ] && prepare_sbom
 create_disk
 create_mount_partition
 extract_rootfs
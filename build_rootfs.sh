@@ -31,6 +31,9 @@ USAGE:
     --sbom-config <config>     -- config used to generate SBOM
                        default value is baseos_sbom.yaml
     --sbom-external <sbom>     -- add sbom file
+    --sbom-scanner <syft|apk>  -- how the rootfs is scanned for the SBOM
+                       apk reads the apk database without syft
+                       default value is syft
     -h|--help                  -- this output
 
   OUTPUT:
@@ -61,6 +64,8 @@ extra_repos=
 nosbom=
 sbom_config="$(realpath baseos_sbom.yaml)"
 sbom_external=
+sbom_scanner=syft
+sbom_pid=
 DOCKER=${DOCKER:-podman}
 if ! command -v "$DOCKER" >/dev/null; then
     DOCKER=docker
@@ -166,6 +171,18 @@ do
             || error "sbom-external $2 does not exist"
         shift
         ;;
+    "--sbom-scanner")
+        [ $# -lt 2 ] && error "$1 requires an argument"
+        case "$2" in
+        "syft"|"apk")
+            sbom_scanner="$2"
+            ;;
+        *)
+            error "unknown sbom scanner($2)"
+            ;;
+        esac
+        shift
+        ;;
     "-h"|"--help")
         usage
         exit 0
@@ -351,6 +368,7 @@ exit_handler()
 
     set +e
 
+    [ -n "$sbom_pid" ] && kill "$sbom_pid" 2>/dev/null && wait "$sbom_pid"
     cd "$outdir" && rm_scripts
     if [ $ret != 0 ]; then
         echo "error occured."
@@ -368,13 +386,30 @@ int_handler()
     exit $ret
 }
 
+prepare_sbom()
+{
+    # The rootfs tarball and SOURCE_DATE_EPOCH make the sbom reproducible.
+    # It is created in workdir and only moved to outdir with the tarball.
+    # With --sbom-scanner apk, packages are read from the apk database of
+    # the tarball without syft.
+    # The config and external sbom are processed in background while the
+    # tarball is compressed, build_sbom scans it once it exists.
+    "$scriptdir/build_sbom.sh" --prepare "$workdir/sbom.prepared" \
+            -i "$output" -c "$sbom_config" -f "$output" \
+            --scanner "$sbom_scanner" ${sbom_external:+-e "$sbom_external"} \
+            --reproducible -o "$workdir/$output" &
+    sbom_pid=$!
+}
+
 build_sbom()
 {
-    "$scriptdir/build_sbom.sh" -i "$output" -c "$sbom_config" -f "$output" \
-            ${sbom_external:+-e "$sbom_external"} \
+    local pid="$sbom_pid"
+
+    sbom_pid=""
+    wait "$pid" \
+        || error "Could not prepare sbom"
+    "$scriptdir/build_sbom.sh" --finalize "$workdir/sbom.prepared" \
         || error "Could not build sbom"
-    mv -f "$workdir/$output.spdx.json" "$outdir" \
-        || error "Could not move sbom to $outdir"
 }
 
 #######
@@ -488,11 +523,6 @@ if [ "${cache%.tar}" != "$cache" ] && [ -z "$cache_ro" ]; then
         || error "Could not create cache $cache"
 fi
 
-$comp "$workdir/rootfs.tar" \
-        || error "Failed compressing rootfs"
-
-rootfs_footprint=$(cat "$workdir/rootfs_footprint_kbyte")000
-tarball_size=$(stat -c %s "$workdir/rootfs.$extension")
 if [ "${output%ATVERSION*}" != "$output" ]; then
     [ -e "$workdir/atmark-release" ] \
         || error "ATVERSION required for output name, but atmark-release was not created"
@@ -500,6 +530,14 @@ if [ "${output%ATVERSION*}" != "$output" ]; then
     output="${output%ATVERSION*}${atmark_version}${output#*ATVERSION}"
 fi
 
+[ -z "$nosbom" ] && prepare_sbom
+
+$comp "$workdir/rootfs.tar" \
+        || error "Failed compressing rootfs"
+
+rootfs_footprint=$(cat "$workdir/rootfs_footprint_kbyte")000
+tarball_size=$(stat -c %s "$workdir/rootfs.$extension")
+
 mv -f "$workdir/rootfs.$extension" "$workdir/$output" \
     || error "Failed renaming rootfs"
 
@@ -528,6 +566,9 @@ echo "============================================"
     || error "Could not move signature to $outdir"
 mv -f "$workdir/$output" "$workdir/footprint.csv" "$outdir" \
     || error "Could not move rootfs to $outdir"
+[ -n "$nosbom" ] \
+    || mv -f "$workdir/$output.spdx.json" "$outdir" \
+    || error "Could not move sbom to $outdir"
 mv -f "$workdir/rootfs_apk_list" "$outdir/${output%.tar*}.package_list.txt" \
     || error "Could not move package list to $outdir"
 
@@ -0,0 +1,254 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# pyright: reportPrivateImportUsage=false
+
+import base64
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import quote
+from uuid import uuid4
+
+from spdx_tools.spdx.model import (
+    Actor,
+    ActorType,
+    Checksum,
+    ChecksumAlgorithm,
+    CreationInfo,
+    Document,
+    ExternalPackageRef,
+    ExternalPackageRefCategory,
+    File,
+    Package,
+    PackageVerificationCode,
+    Relationship,
+    RelationshipType,
+    SpdxNoAssertion,
+)
+from spdx_tools.spdx.validation.uri_validators import validate_download_location
+
+from license_resolver import LicenseResolver
+from rename_license import LicenseNormalizer
+from sbom_graph import SbomGraph
+from utility import get_source_date, get_spdx_id, get_verification_code, open_tarball_stream, with_occurrences
+
+# Members of the rootfs read by the scanner, with or without leading ./
+APK_INSTALLED_DB = "lib/apk/db/installed"
+ALPINE_RELEASE = "etc/alpine-release"
+
+
+class ApkPackage:
+    def __init__(self) -> None:
+        # First value of each "X:value" line, e.g. P (name), V (version), L (license)
+        self.fields: Dict[str, str] = {}
+        # (path, apk checksum) of the R: lines
+        self.files: List[Tuple[str, str]] = []
+
+
+def parse_apk_installed(content: str) -> List[ApkPackage]:
+    # One paragraph per package. Files are R: lines under the last F: (directory)
+    # line, each followed by the Z: line holding its checksum. M: and a: lines
+    # are the owner and mode of the directory and file above them.
+    packages = []
+    package = ApkPackage()
+    directory = ""
+    for line in content.splitlines():
+        if not line:
+            if package.fields:
+                packages.append(package)
+            package = ApkPackage()
+            directory = ""
+            continue
+        key, _, value = line.partition(":")
+        if key == "F":
+            directory = value
+        elif key == "R":
+            package.files.append((f"{directory}/{value}" if directory else value, ""))
+        elif key == "Z" and package.files:
+            package.files[-1] = (package.files[-1][0], value)
+        elif key in ("M", "a"):
+            continue
+        else:
+            package.fields.setdefault(key, value)
+    if package.fields:
+        packages.append(package)
+    return packages
+
+
+def apk_checksum_to_sha1(checksum: str) -> Optional[str]:
+    # apk stores "Q1" followed by the base64 of the sha1
+    if not checksum.startswith("Q1"):
+        return None
+    return base64.b64decode(checksum[2:]).hex()
+
+
+class ApkSbom:
+    # Alternative to FileSbom for alpine rootfs tarballs: the packages are read
+    # from the apk database while streaming the tarball, nothing is extracted
+    # and syft is not needed.
+    def __init__(self, filepath: str, license_resolver: Optional[LicenseResolver] = None) -> None:
+        self.license_resolver = license_resolver or LicenseResolver()
+        self.license_normalizer = LicenseNormalizer(self.license_resolver)
+        self.timings: Dict[str, float] = {}
+        self.file_name = os.path.basename(filepath)
+        self.alpine_release: Optional[str] = None
+
+        start = time.perf_counter()
+        installed = self.read_apk_installed(filepath)
+        self.timings["scan"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.target = Package(
+            spdx_id=get_spdx_id(f"DocumentRoot-File-{self.file_name}"),
+            name=self.file_name,
+            download_location=SpdxNoAssertion(),
+            files_analyzed=False,
+            license_concluded=SpdxNoAssertion(),
+            license_declared=SpdxNoAssertion(),
+            copyright_text=SpdxNoAssertion(),
+        )
+        self.graph = SbomGraph(packages=[self.target])
+        self.add_packages(parse_apk_installed(installed))
+        self.document = self.make_document()
+        self.graph.update_document(self.document)
+        self.document.relationships = [
+            Relationship("SPDXRef-DOCUMENT", RelationshipType.DESCRIBES, self.target.spdx_id),
+            *self.document.relationships,
+        ]
+        self.timings["parse"] = time.perf_counter() - start
+
+        self.packages = self.document.packages
+        self.relationships = self.document.relationships
+        self.files = self.document.files
+        self.extracted_licensing_info = self.document.extracted_licensing_info
+
+    def read_apk_installed(self, filepath: str) -> str:
+        installed = None
+        with open_tarball_stream(filepath) as tar:
+            for member in tar:
+                name = member.name[2:] if member.name.startswith("./") else member.name
+                if not member.isfile() or name not in (APK_INSTALLED_DB, ALPINE_RELEASE):
+                    continue
+                f = tar.extractfile(member)
+                if f is None:
+                    continue
+                content = f.read().decode(errors="replace")
+                if name == ALPINE_RELEASE:
+                    self.alpine_release = content.strip()
+                else:
+                    installed = content
+        if installed is None:
+            logging.error("%s not found in %s, use the syft scanner for this file",
+                          APK_INSTALLED_DB, self.file_name)
+            sys.exit(1)
+        return installed
+
+    def get_purl(self, apk: ApkPackage) -> str:
+        qualifiers = []
+        if "A" in apk.fields:
+            qualifiers.append(f"arch={quote(apk.fields['A'])}")
+        if "o" in apk.fields:
+            qualifiers.append(f"upstream={quote(apk.fields['o'])}")
+        if self.alpine_release:
+            qualifiers.append(f"distro=alpine-{quote(self.alpine_release)}")
+        purl = f"pkg:apk/alpine/{quote(apk.fields['P'])}@{quote(apk.fields['V'])}"
+        return f"{purl}?{'&'.join(qualifiers)}" if qualifiers else purl
+
+    def get_download_location(self, apk: ApkPackage) -> Union[str, SpdxNoAssertion]:
+        # U: is whatever url the APKBUILD set, checked like FileSbom.check_package_element()
+        url = apk.fields.get("U")
+        if not url or validate_download_location(url):
+            return SpdxNoAssertion()
+        return url
+
+    def get_files(self, apk: ApkPackage) -> List[File]:
+        files = []
+        for path, checksum in apk.files:
+            sha1 = apk_checksum_to_sha1(checksum)
+            # Files without a sha1 cannot be described in SPDX 2.2
+            if sha1 is None:
+                continue
+            files.append(File(
+                name=os.path.basename(path),
+                spdx_id=get_spdx_id("File", uuid=True, content=[self.file_name, path]),
+                checksums=[Checksum(ChecksumAlgorithm.SHA1, sha1)],
+                license_concluded=SpdxNoAssertion(),
+                license_info_in_file=[SpdxNoAssertion()],
+                copyright_text=SpdxNoAssertion(),
+            ))
+        return files
+
+    def add_packages(self, apks: List[ApkPackage]) -> None:
+        # Rename the licenses of all packages at once, like PackagesSbom
+        licenses, _ = self.license_normalizer.normalize("alpine", [apk.fields.get("L", "") for apk in apks])
+        relationships = []
+        # Ids only depend on the package, identical entries are told apart by their occurrence
+        contents = with_occurrences([self.file_name, apk.fields["P"], apk.fields["V"]] for apk in apks)
+        for apk, license, content in zip(apks, licenses, contents):
+            name, version = apk.fields["P"], apk.fields["V"]
+            files = self.get_files(apk)
+            license_declared = self.license_resolver.resolve(license) if license else SpdxNoAssertion()
+            package = Package(
+                spdx_id=get_spdx_id(f"Package-apk-{name}", uuid=True, content=content),
+                name=name,
+                version=version,
+                download_location=self.get_download_location(apk),
+                files_analyzed=bool(files),
+                verification_code=(
+                    PackageVerificationCode(get_verification_code([file.checksums[0].value for file in files]))
+                    if files else None
+                ),
+                license_concluded=SpdxNoAssertion(),
+                license_declared=license_declared,
+                # Keep the original license when it cannot be inferred, like PackagesSbom
+                license_comment=(
+                    f"The following licenses could not be estimated '{apk.fields['L']}'"
+                    if license_declared == SpdxNoAssertion() and apk.fields.get("L") else None
+                ),
+                copyright_text=SpdxNoAssertion(),
+                summary=apk.fields.get("T"),
+                external_references=[ExternalPackageRef(
+                    ExternalPackageRefCategory.PACKAGE_MANAGER, "purl", self.get_purl(apk),
+                )],
+            )
+            self.graph.add_packages([package])
+            self.graph.add_files(files)
+            relationships.append(Relationship(self.target.spdx_id, RelationshipType.CONTAINS, package.spdx_id))
+            relationships += [
+                Relationship(package.spdx_id, RelationshipType.CONTAINS, file.spdx_id) for file in files
+            ]
+        self.graph.add_relationships(relationships)
+
+    def make_document(self) -> Document:
+        # Only written as is when scanning files without --input, like a syft document
+        date = get_source_date() or datetime.now()
+        creation_info = CreationInfo(
+            spdx_version="SPDX-2.2",
+            spdx_id="SPDXRef-DOCUMENT",
+            name=self.file_name,
+            data_license="CC0-1.0",
+            document_namespace=f"https://spdx.org/spdxdocs/{self.file_name}-{uuid4()}",
+            creators=[Actor(ActorType.TOOL, "make-sbom")],
+            created=datetime(date.year, date.month, date.day, date.hour, date.minute, date.second),
+        )
+        return Document(creation_info)
+
+    def get_relationships(self, spdx_id: str) -> List[Relationship]:
+        return [
+            Relationship(
+                spdx_element_id=spdx_id,
+                relationship_type=RelationshipType.CONTAINS,
+                related_spdx_element_id=self.target.spdx_id,
+            )
+        ]
+
+    def get_graph(self, spdx_id: str) -> SbomGraph:
+        graph = SbomGraph()
+        graph.merge(self.graph)
+        graph.add_relationships(self.get_relationships(spdx_id))
+        return graph
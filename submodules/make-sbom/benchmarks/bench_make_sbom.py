@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# Benchmark of the make-sbom pipeline stages with synthetic inputs.
+#
+# Generates alpine and dpkg-licenses package lists, a canned syft output
+# (served by a local stand-in for syft), a rootfs tarball holding an apk
+# database and package files, and an external sbom for each size,
+# then records wall time and peak python memory (tracemalloc) of each stage.
+# Results are written as json so that they can be compared across commits:
+#   PYTHONPATH=../deps ./bench_make_sbom.py --sizes 100,1000 -o before.json
+
+import base64
+import csv
+import hashlib
+import io
+import json
+import os
+import platform
+import stat
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser, Namespace
+from typing import Any, Callable, Dict, List
+
+SCRIPTDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(SCRIPTDIR))
+
+
+from apk_sbom import ApkSbom  # noqa: E402
+from external_sbom import ExternalSbom  # noqa: E402
+from file_catalog import FileCatalog  # noqa: E402
+from file_sbom import FileSbom  # noqa: E402
+from license_index import load_index  # noqa: E402
+from packages_sbom import PackagesSbom  # noqa: E402
+from sbom_graph import SbomGraph  # noqa: E402
+from sbom_writer import validate_document, write_document_to_file  # noqa: E402
+from yaml_sbom import YamlSbom  # noqa: E402
+
+DEFAULT_SIZES = "100,1000,10000"
+# Validating a document takes quadratic time in spdx-tools: the stages which
+# validate one (validate, ExternalSbom) are only measured up to this size
+DEFAULT_VALIDATE_MAX_SIZE = 1000
+# Package files in the canned syft output, the last one has an all zero checksum
+FILES_PER_PACKAGE = 3
+
+ALPINE_LICENSES = ["MIT", "GPL-2.0-only", "GPL-2.0-or-later", "Apache-2.0", "BSD-3-Clause",
+                   "MIT AND BSD-2-Clause", "LGPL-2.1-or-later", "Zlib", "custom:multiple", "GPL2+"]
+DEBIAN_LICENSES = ["GPL-2+", "GPL-2 LGPL-2.1", "BSD3", "Apache-2", "MIT", "public-domain",
+                   "GPL-2+ with Linux-syscall-note", "LGPL-2.1+ GPL-3+", "Expat", "Zlib"]
+
+SYFT_STANDIN = """#!/bin/sh
+# stand-in for syft: print the canned scan result
+case "$1" in
+--version) echo "syft 0.0.0-benchmark" ;;
+*) cat "$BENCH_SYFT_OUTPUT" ;;
+esac
+"""
+
+CONFIG = """Document:
+  documentNamespace: https://example.com/benchmark.spdx.json
+  creators:
+    - Organization: Atmark Techno
+Package:
+  mainPackage:
+    downloadLocation: https://example.com/benchmark
+    version: 1
+    licenseConcluded: MIT
+    licenseDeclared: MIT
+    copyrightText: Copyright Atmark Techno
+"""
+
+
+def get_option() -> Namespace:
+    parser = ArgumentParser(description="benchmark make-sbom stages with synthetic inputs")
+    parser.add_argument(
+        "-s", "--sizes", default=DEFAULT_SIZES,
+        help="comma separated number of packages to generate. Default is %(default)s",
+    )
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=1,
+        help="number of timed runs of each stage, the fastest one is kept. Default is %(default)s",
+    )
+    parser.add_argument(
+        "--validate-max-size", type=int, default=DEFAULT_VALIDATE_MAX_SIZE,
+        help="largest size the stages validating a document are measured for. Default is %(default)s",
+    )
+    parser.add_argument("-o", "--output", help="json file to write results to. Default is stdout")
+    return parser.parse_args()
+
+
+def write_alpine_list(path: str, size: int) -> None:
+    with open(path, "w") as f:
+        for i in range(size):
+            license = ALPINE_LICENSES[i % len(ALPINE_LICENSES)]
+            f.write(f"pkg{i}-1.{i % 7}.{i % 13}-r{i % 3} aarch64 {{pkg{i}}} ({license}) [installed]\n")
+
+
+def write_debian_list(path: str, size: int) -> None:
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+        writer.writerow(["St", "Name", "Version", "Arch", "Description", "Licenses"])
+        for i in range(size):
+            license = DEBIAN_LICENSES[i % len(DEBIAN_LICENSES)]
+            writer.writerow(["ii", f"pkg{i}:arm64", f"1.{i % 7}-{i % 5}", "arm64", f"package {i}", license])
+
+
+def write_syft_output(path: str, target: str, size: int) -> None:
+    root = "SPDXRef-DocumentRoot-File-" + os.path.basename(target)
+    packages = [{
+        "SPDXID": root, "name": target, "downloadLocation": "NOASSERTION", "filesAnalyzed": False,
+        "licenseConcluded": "NOASSERTION", "licenseDeclared": "NOASSERTION", "copyrightText": "NOASSERTION",
+    }]
+    files = []
+    relationships = [{"spdxElementId": "SPDXRef-DOCUMENT", "relationshipType": "DESCRIBES",
+                      "relatedSpdxElement": root}]
+    for i in range(size):
+        package_id = f"SPDXRef-Package-apk-pkg{i}-{i:08x}"
+        # one package out of 3 has files not analyzed, its files are pruned
+        files_analyzed = i % 3 != 0
+        packages.append({
+            "SPDXID": package_id, "name": f"pkg{i}", "versionInfo": f"1.{i % 7}-r0",
+            "downloadLocation": "https://example.com" if i % 2 else "not a url",
+            "filesAnalyzed": files_analyzed, "licenseConcluded": "NOASSERTION",
+            "licenseDeclared": ALPINE_LICENSES[i % 8], "copyrightText": "NOASSERTION",
+            "externalRefs": [{"referenceCategory": "PACKAGE_MANAGER", "referenceType": "purl",
+                              "referenceLocator": f"pkg:apk/alpine/pkg{i}@1.{i % 7}-r0?arch=aarch64"}],
+            **({"packageVerificationCode": {"packageVerificationCodeValue": "0" * 40}} if files_analyzed else {}),
+        })
+        relationships.append({"spdxElementId": root, "relationshipType": "CONTAINS",
+                              "relatedSpdxElement": package_id})
+        for j in range(FILES_PER_PACKAGE):
+            file_id = f"SPDXRef-File-pkg{i}-{j}"
+            checksum = "0" * 40 if j == FILES_PER_PACKAGE - 1 else f"{i:020x}{j:020x}"
+            files.append({
+                "SPDXID": file_id, "fileName": f"/usr/lib/pkg{i}/file{j}",
+                "checksums": [{"algorithm": "SHA1", "checksumValue": checksum}],
+                "licenseConcluded": "NOASSERTION", "copyrightText": "NOASSERTION",
+                "licenseInfoInFiles": ["NOASSERTION"],
+            })
+            relationships.append({"spdxElementId": package_id, "relationshipType": "CONTAINS",
+                                  "relatedSpdxElement": file_id})
+    with open(path, "w") as f:
+        json.dump({
+            "spdxVersion": "SPDX-2.2", "dataLicense": "CC0-1.0", "SPDXID": "SPDXRef-DOCUMENT",
+            "name": target, "documentNamespace": "https://example.com/syft/" + os.path.basename(target),
+            "creationInfo": {"created": "2024-01-01T00:00:00Z", "creators": ["Tool: syft-0.0.0-benchmark"]},
+            "packages": packages, "files": files, "relationships": relationships,
+        }, f)
+
+
+def write_apk_rootfs(path: str, size: int) -> None:
+    # rootfs tarball holding the apk database and the package files,
+    # as read by ApkSbom and FileCatalog
+    lines = []
+    contents = {}
+    for i in range(size):
+        lines += [f"P:pkg{i}", f"V:1.{i % 7}-r0", "A:aarch64", f"L:{ALPINE_LICENSES[i % len(ALPINE_LICENSES)]}",
+                  f"o:pkg{i}", "U:https://example.com", f"F:usr/lib/pkg{i}"]
+        for j in range(FILES_PER_PACKAGE):
+            content = f"{i}/{j}".encode() * 256
+            contents[f"usr/lib/pkg{i}/file{j}"] = content
+            digest = base64.b64encode(hashlib.sha1(content).digest()).decode()
+            lines += [f"R:file{j}", f"Z:Q1{digest}"]
+        lines.append("")
+    contents["lib/apk/db/installed"] = "\n".join(lines).encode()
+    with tarfile.open(path, "w") as tar:
+        for name, content in sorted(contents.items()):
+            member = tarfile.TarInfo(name)
+            member.size = len(content)
+            tar.addfile(member, io.BytesIO(content))
+
+
+def write_external_sbom(path: str, size: int) -> None:
+    main_id = "SPDXRef-external.bin"
+    packages = [{
+        "SPDXID": main_id, "name": "external.bin", "versionInfo": "1", "downloadLocation": "NOASSERTION",
+        "filesAnalyzed": False, "licenseConcluded": "MIT", "licenseDeclared": "MIT", "copyrightText": "NOASSERTION",
+    }]
+    relationships = [{"spdxElementId": "SPDXRef-DOCUMENT", "relationshipType": "DESCRIBES",
+                      "relatedSpdxElement": main_id}]
+    for i in range(size):
+        package_id = f"SPDXRef-ext{i}"
+        packages.append({
+            "SPDXID": package_id, "name": f"ext{i}", "versionInfo": f"2.{i % 11}",
+            "downloadLocation": "NOASSERTION", "filesAnalyzed": False,
+            "licenseConcluded": DEBIAN_LICENSES[4], "licenseDeclared": "NOASSERTION", "copyrightText": "NOASSERTION",
+        })
+        relationships.append({"spdxElementId": main_id, "relationshipType": "CONTAINS",
+                              "relatedSpdxElement": package_id})
+    with open(path, "w") as f:
+        json.dump({
+            "spdxVersion": "SPDX-2.2", "dataLicense": "CC0-1.0", "SPDXID": "SPDXRef-DOCUMENT",
+            "name": "external.bin", "documentNamespace": "https://example.com/external.spdx.json",
+            "creationInfo": {"created": "2024-01-01T00:00:00Z", "creators": ["Organization: Atmark Techno"]},
+            "packages": packages, "relationships": relationships,
+        }, f)
+
+
+def measure(stage: str, size: int, repeat: int, function: Callable[[], Any],
+            setup: Callable[[], Any] = lambda: None) -> Dict[str, Any]:
+    # tracemalloc slows python down a lot, so time and memory are measured in separate runs.
+    # setup() runs before each of them, untimed, e.g. to clear caches
+    seconds = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    setup()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {"stage": stage, "size": size, "seconds": round(min(seconds), 6), "peak_memory": peak}
+    print(f"{stage:>16} {size:>7}: {result['seconds']:10.3f}s {peak / 2**20:10.1f}MiB", file=sys.stderr)
+    return result
+
+
+def skip(stage: str, size: int) -> None:
+    print(f"{stage:>16} {size:>7}: skipped, see --validate-max-size", file=sys.stderr)
+
+
+def bench_size(workdir: str, size: int, repeat: int, validate_max_size: int) -> List[Dict[str, Any]]:
+    config = os.path.join(workdir, "config.yaml")
+    alpine = os.path.join(workdir, "alpine.package_list.txt")
+    debian = os.path.join(workdir, "debian.package_list.txt")
+    rootfs = os.path.join(workdir, "rootfs.tar")
+    apk_rootfs = os.path.join(workdir, "apk-rootfs.tar")
+    external = os.path.join(workdir, "external.spdx.json")
+    output = os.path.join(workdir, "output.spdx.json")
+    write_alpine_list(alpine, size)
+    write_debian_list(debian, size)
+    write_external_sbom(external, size)
+    write_syft_output(os.environ["BENCH_SYFT_OUTPUT"], rootfs, size)
+    write_apk_rootfs(apk_rootfs, size)
+    with open(rootfs, "wb"):
+        pass
+
+    results = []
+    cwd = os.getcwd()
+    # YamlSbom only takes input from the current directory
+    os.chdir(workdir)
+    try:
+        results.append(measure("YamlSbom", size, repeat, lambda: YamlSbom("image.bin", config)))
+    finally:
+        os.chdir(cwd)
+    results.append(measure("PackagesSbom-apk", size, repeat, lambda: PackagesSbom(alpine)))
+    results.append(measure("PackagesSbom-deb", size, repeat, lambda: PackagesSbom(debian)))
+    results.append(measure("FileSbom", size, repeat, lambda: FileSbom(rootfs)))
+    results.append(measure("ApkSbom", size, repeat, lambda: ApkSbom(apk_rootfs)))
+    results.append(measure("FileCatalog", size, repeat, lambda: FileCatalog(apk_rootfs, os.cpu_count() or 1)))
+    if size <= validate_max_size:
+        results.append(measure("ExternalSbom", size, repeat,
+                               lambda: SbomGraph().merge(ExternalSbom(external).get_graph("SPDXRef-image.bin"))))
+    else:
+        skip("ExternalSbom", size)
+
+    os.chdir(workdir)
+    try:
+        yaml_sbom = YamlSbom("image.bin", config)
+    finally:
+        os.chdir(cwd)
+    graph = yaml_sbom.get_graph()
+    graph.merge(PackagesSbom(alpine).get_graph(yaml_sbom.spdx_id))
+    graph.merge(FileSbom(rootfs).get_graph(yaml_sbom.spdx_id))
+    document = yaml_sbom.document
+    graph.update_document(document)
+    # Validation usually costs more than serialization, keep them apart
+    if size <= validate_max_size:
+        results.append(measure("validate", size, repeat, lambda: validate_document(document)))
+    else:
+        skip("validate", size)
+    results.append(measure("write", size, repeat, lambda: write_document_to_file(document, output, validate=False)))
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=SCRIPTDIR, capture_output=True,
+                              check=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    args = get_option()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    with tempfile.TemporaryDirectory(prefix="make-sbom-bench-") as workdir:
+        bindir = os.path.join(workdir, "bin")
+        os.mkdir(bindir)
+        syft = os.path.join(bindir, "syft")
+        with open(syft, "w") as f:
+            f.write(SYFT_STANDIN)
+        os.chmod(syft, os.stat(syft).st_mode | stat.S_IEXEC)
+        os.environ["PATH"] = f"{bindir}:{os.environ['PATH']}"
+        os.environ["BENCH_SYFT_OUTPUT"] = os.path.join(workdir, "syft.spdx.json")
+
+        # The license index is loaded once per process, measure it on its own
+        results = [measure("license-index", 0, args.repeat, load_index, load_index.cache_clear)]
+        with open(os.path.join(workdir, "image.bin"), "wb") as f:
+            f.write(os.urandom(1024 * 1024))
+        with open(os.path.join(workdir, "config.yaml"), "w") as f:
+            f.write(CONFIG)
+        for size in sizes:
+            results += bench_size(workdir, size, args.repeat, args.validate_max_size)
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# Licenses of the packages installed in a debian rootfs, read from the dpkg
+# status and the copyright files of the rootfs directory or tarball itself,
+# in the same form as the Licenses column of dpkg-licenses -c
+
+import logging
+import os
+import posixpath
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from hashlib import sha256
+from typing import Dict, List, Optional, Tuple, Union
+
+from utility import open_compressed, open_tarball_stream
+
+DPKG_STATUS = "var/lib/dpkg/status"
+DOC_DIR = "usr/share/doc"
+COPYRIGHT_RE = re.compile(r"usr/share/doc/[^/]+/copyright")
+# Short names of the License: fields of machine-readable (DEP-5) copyright files
+DEP5_LICENSE_RE = re.compile(r"^License:[ \t]*(\S.*?)[ \t]*$", re.MULTILINE)
+DEP5_OPERATORS_RE = re.compile(r",?\s+(?:and|or)\s+|\s*,\s*", re.IGNORECASE)
+# Other copyright files refer to licenses as "/usr/share/common-licenses/GPL-2."
+COMMON_LICENSES_RE = re.compile(r"/usr/share/common-licenses/([\w.+-]*\w\+?)")
+# Same as dpkg-licenses when no license is found
+UNKNOWN_LICENSE = "unknown"
+# Copyright files sent to a worker at once
+CHUNK_FILES = 64
+MAX_SYMLINKS = 40
+
+
+def parse_dpkg_status(content: str) -> List[Tuple[str, str]]:
+    # (name, version) of the installed packages, one paragraph per package
+    packages = []
+    for paragraph in content.split("\n\n"):
+        fields = {}
+        for line in paragraph.splitlines():
+            # continuation lines (description, conffiles...) are not needed
+            if not line or line[0].isspace():
+                continue
+            key, _, value = line.partition(":")
+            fields[key] = value.strip()
+        if fields.get("Package") and fields.get("Status", "").endswith(" installed"):
+            packages.append((fields["Package"], fields.get("Version", "")))
+    return packages
+
+
+def parse_copyright(content: Union[str, bytes]) -> str:
+    # Licenses in order of appearance separated by spaces, "GPL-2+ with
+    # Linux-syscall-note" kept whole: LicenseNormalizer.debian_normalize() splits them
+    if isinstance(content, bytes):
+        content = content.decode(errors="replace")
+    if content.lstrip().startswith(("Format:", "Format-Specification:")):
+        names = [
+            name
+            for short_name in DEP5_LICENSE_RE.findall(content)
+            for name in DEP5_OPERATORS_RE.split(short_name)
+            if name
+        ]
+    else:
+        names = COMMON_LICENSES_RE.findall(content)
+    return " ".join(dict.fromkeys(names)) or UNKNOWN_LICENSE
+
+
+def read_copyright(filepath: Optional[str]) -> str:
+    if filepath is None:
+        return UNKNOWN_LICENSE
+    with open(filepath, "rb") as f:
+        return parse_copyright(f.read())
+
+
+def resolve_path(links: Dict[str, str], path: str) -> str:
+    # Follows the symlinks of a path relative to the rootfs, absolute links
+    # point inside the rootfs, e.g. usr/share/doc/libfoo-dev -> libfoo1
+    for _ in range(MAX_SYMLINKS):
+        parts = path.split("/")
+        for index in range(1, len(parts) + 1):
+            link = "/".join(parts[:index])
+            if link in links:
+                target = links[link]
+                directory = "" if target.startswith("/") else posixpath.dirname(link)
+                path = posixpath.normpath(posixpath.join("/", directory, target, *parts[index:])).lstrip("/")
+                break
+        else:
+            return path
+    return path
+
+
+def is_tarball(filepath: str) -> bool:
+    # Tar headers have "ustar" at offset 257, after decompression
+    with open_compressed(filepath) as f:
+        header = f.read(512)
+    return header[257:262] == b"ustar"
+
+
+def is_debian_rootfs(filepath: str) -> bool:
+    return os.path.isdir(filepath) or is_tarball(filepath)
+
+
+def get_debian_rootfs_digest(root: str) -> str:
+    # Everything read by DebianLicenses from a rootfs directory
+    digest = sha256()
+    for directory, dirnames, files in os.walk(os.path.join(root, DOC_DIR)):
+        dirnames.sort()
+        for name in sorted(files):
+            if name == "copyright":
+                filepath = os.path.join(directory, name)
+                digest.update(os.path.relpath(filepath, root).encode() + b"\0")
+                if os.path.isfile(filepath):
+                    with open(filepath, "rb") as f:
+                        digest.update(f.read())
+    with open(os.path.join(root, DPKG_STATUS), "rb") as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+class DebianLicenses:
+    # Replaces the dpkg-licenses -c package list: the copyright files are
+    # parsed by a process pool, only paths or contents and the resulting
+    # licenses go through the pipes.
+    def __init__(self, filepath: str, jobs: int = 1) -> None:
+        self.filename = os.path.basename(filepath)
+        self.timings: Dict[str, float] = {}
+        start = time.perf_counter()
+        if os.path.isdir(filepath):
+            self.packages = self.read_directory(filepath, max(1, jobs))
+        else:
+            self.packages = self.read_tarball(filepath, max(1, jobs))
+        self.timings["licenses"] = time.perf_counter() - start
+        logging.info("read licenses of %d debian packages from %s", len(self.packages), self.filename)
+
+    def read_directory(self, root: str, jobs: int) -> List[Tuple[str, str, str]]:
+        status = os.path.join(root, DPKG_STATUS)
+        if not os.path.isfile(status):
+            self.missing_status()
+        with open(status, errors="replace") as f:
+            packages = parse_dpkg_status(f.read())
+        links: Dict[str, str] = {}
+        doc_dir = os.path.join(root, DOC_DIR)
+        with os.scandir(doc_dir) if os.path.isdir(doc_dir) else nullcontext([]) as entries:
+            for entry in entries:
+                if entry.is_symlink():
+                    links[f"{DOC_DIR}/{entry.name}"] = os.readlink(entry.path)
+                elif entry.is_dir() and os.path.islink(os.path.join(entry.path, "copyright")):
+                    links[f"{DOC_DIR}/{entry.name}/copyright"] = os.readlink(os.path.join(entry.path, "copyright"))
+        copyrights = []
+        for name, _ in packages:
+            filepath = os.path.join(root, resolve_path(links, f"{DOC_DIR}/{name}/copyright"))
+            copyrights.append(filepath if os.path.isfile(filepath) else None)
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            licenses = list(executor.map(read_copyright, copyrights, chunksize=CHUNK_FILES))
+        return [(name, version, license) for (name, version), license in zip(packages, licenses)]
+
+    def read_tarball(self, filepath: str, jobs: int) -> List[Tuple[str, str, str]]:
+        # The tarball can only be read in order: copyright files are kept
+        # until the status says which ones are needed
+        status = None
+        contents: Dict[str, bytes] = {}
+        links: Dict[str, str] = {}
+        with open_tarball_stream(filepath) as tar:
+            for member in tar:
+                path = posixpath.normpath(posixpath.join("/", member.name)).lstrip("/")
+                if member.issym() and path.startswith(DOC_DIR):
+                    links[path] = member.linkname
+                    continue
+                if not member.isfile() or (path != DPKG_STATUS and not COPYRIGHT_RE.fullmatch(path)):
+                    continue
+                f = tar.extractfile(member)
+                if f is None:
+                    continue
+                if path == DPKG_STATUS:
+                    status = f.read().decode(errors="replace")
+                else:
+                    contents[path] = f.read()
+        if status is None:
+            self.missing_status()
+        packages = parse_dpkg_status(status)
+        copyrights = [contents.get(resolve_path(links, f"{DOC_DIR}/{name}/copyright")) for name, _ in packages]
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            licenses = list(executor.map(parse_copyright, [content or "" for content in copyrights],
+                                         chunksize=CHUNK_FILES))
+        return [(name, version, license) for (name, version), license in zip(packages, licenses)]
+
+    def missing_status(self):
+        logging.error("%s not found in %s, not a debian rootfs", DPKG_STATUS, self.filename)
+        sys.exit(1)
@@ -4,31 +4,77 @@
 
 
 import logging
-from typing import Any, List
+import os
+import pickle
+from typing import Any, List, Optional, Set, Tuple
 
 from spdx_tools.spdx.model import Relationship, RelationshipType
 from spdx_tools.spdx.parser.error import SPDXParsingError
-from spdx_tools.spdx.parser.parse_anything import parse_file
 
-from utility import get_spdx_id
+from sbom_cache import SbomCache
+from sbom_graph import SbomGraph
+from sbom_writer import get_element_key
+from utility import get_file_sha256, get_spdx_id, parse_spdx_file
 
 
 class ExternalSbom:
-    def __init__(self, filepath: str) -> None:
-        self.document = self.spdx_parse(filepath)
+    def __init__(self, filepath: str, cache: Optional[SbomCache] = None) -> None:
+        self.cache = cache
+        # Set when the document is valid on its own, see get_validated_elements()
+        self.validated = False
+        self.document = self.load(filepath)
         self.packages = self.remove_file_name(self.document.packages)
         self.files = self.document.files
         self.extracted_licensing_info = self.document.extracted_licensing_info
 
+    def load(self, filepath: str):
+        # The same external sbom is reused by many builds: the parsed and
+        # validated document is cached by digest of the file
+        if self.cache is None:
+            return self.validate(self.spdx_parse(filepath))
+        from importlib.metadata import version
+
+        key = self.cache.key(get_file_sha256(filepath), version("spdx-tools"), version("license-expression"))
+        data = self.cache.get(key)
+        if data is not None:
+            try:
+                document = pickle.loads(data)
+                logging.info("reusing cached validated sbom for %s", os.path.basename(filepath))
+                self.validated = True
+                return document
+            except Exception:
+                logging.warning("Ignoring unreadable cached sbom for %s", os.path.basename(filepath))
+        document = self.validate(self.spdx_parse(filepath))
+        # Invalid documents are not cached, so that the errors are reported on every run
+        if self.validated:
+            self.cache.put(key, pickle.dumps(document, protocol=pickle.HIGHEST_PROTOCOL))
+        return document
+
     def spdx_parse(self, filepath: str):
         try:
             # Try to parse the input file. If successful, returns a Document, otherwise raises an SPDXParsingError
-            document: Any = parse_file(filepath)
+            document: Any = parse_spdx_file(filepath)
         except SPDXParsingError:
             logging.exception("Failed to parse spdx file")
             exit()
         return document
 
+    def validate(self, document):
+        # Validating each document on its own is much cheaper than validating
+        # everything once merged, as validation time grows with the square of its size
+        from spdx_tools.spdx.validation.document_validator import validate_full_spdx_document
+
+        self.validated = not validate_full_spdx_document(document)
+        return document
+
+    def get_validated_elements(self) -> Set[Tuple[str, str]]:
+        # Elements that need no validation in the merged document, as long as they do not change
+        if not self.validated:
+            return set()
+        return {
+            get_element_key(element) for element in [*self.packages, *self.files, *self.remove_root_relationship()]
+        }
+
     def remove_file_name(self, packages):
         for package in packages:
             package.file_name = None
@@ -47,6 +93,14 @@ class ExternalSbom:
         ]
         return relationships
 
+    def get_graph(self, spdx_id: str) -> SbomGraph:
+        return SbomGraph(
+            packages=self.packages,
+            files=self.files,
+            relationships=self.get_relationships(spdx_id),
+            extracted_licensing_info=self.extracted_licensing_info,
+        )
+
     def remove_root_relationship(self) -> List[Relationship]:
         # Delete SPDXRef-DOCUMENT relationship as it replaces it.
         return [
@@ -0,0 +1,122 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# pyright: reportPrivateImportUsage=false
+
+import hashlib
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Container, Deque, Dict, List, Tuple
+
+from spdx_tools.spdx.model import (
+    Checksum,
+    ChecksumAlgorithm,
+    File,
+    PackageVerificationCode,
+    Relationship,
+    RelationshipType,
+    SpdxNoAssertion,
+)
+
+from image_layers import normalize_path
+from sbom_graph import SbomGraph
+from utility import CHUNK_SIZE, get_spdx_id, get_stream_checksums, get_verification_code, open_tarball_stream
+
+# sha1 first: it is the checksum required by SPDX 2.2
+CATALOG_ALGORITHMS = ["sha1", "sha256"]
+# Members up to this size are read whole and hashed by the thread pool,
+# larger ones are hashed chunk by chunk while reading the tarball
+LARGE_MEMBER_SIZE = 16 * CHUNK_SIZE
+
+
+def get_checksums(data: bytes) -> Dict[str, str]:
+    # hashlib releases the GIL on large buffers, so threads hash in parallel
+    return {algorithm: hashlib.new(algorithm, data).hexdigest() for algorithm in CATALOG_ALGORITHMS}
+
+
+class FileCatalog:
+    # Every regular file of a tarball with its checksums, read in a single
+    # streaming pass. Reading the tarball is sequential, so only the hashing
+    # is spread over the thread pool, with a bound on the data held in memory.
+    def __init__(self, filepath: str, jobs: int = 1) -> None:
+        self.timings: Dict[str, float] = {}
+        self.file_name = os.path.basename(filepath)
+        # Path in the tarball of each file, which is named after its basename like scanned files
+        self.paths: Dict[str, str] = {}
+        start = time.perf_counter()
+        self.files = self.catalog(filepath, max(1, jobs))
+        self.timings["catalog"] = time.perf_counter() - start
+
+    def catalog(self, filepath: str, jobs: int) -> List[File]:
+        files: List[File] = []
+        pending: Deque[Tuple[str, "Future[Dict[str, str]]", int]] = deque()
+        pending_size = 0
+        max_pending_size = jobs * LARGE_MEMBER_SIZE
+
+        def collect_oldest() -> None:
+            nonlocal pending_size
+            path, future, size = pending.popleft()
+            pending_size -= size
+            files.append(self.make_file(path, future.result()))
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor, open_tarball_stream(filepath) as tar:
+            for member in tar:
+                # directories, links, devices... have no content to hash
+                if not member.isfile():
+                    continue
+                path = normalize_path(member.name)
+                f = tar.extractfile(member)
+                if f is None:
+                    continue
+                if member.size > LARGE_MEMBER_SIZE:
+                    # keep files in tarball order
+                    while pending:
+                        collect_oldest()
+                    files.append(self.make_file(path, get_stream_checksums(f, CATALOG_ALGORITHMS)))
+                    continue
+                data = f.read()
+                pending.append((path, executor.submit(get_checksums, data), len(data)))
+                pending_size += len(data)
+                while pending_size > max_pending_size:
+                    collect_oldest()
+            while pending:
+                collect_oldest()
+        return files
+
+    def make_file(self, path: str, checksums: Dict[str, str]) -> File:
+        # Same id as the file listed by ApkSbom for the same path,
+        # a path only appears once in a tarball
+        spdx_id = get_spdx_id("File", uuid=True, content=[self.file_name, path])
+        self.paths[spdx_id] = path
+        return File(
+            name=os.path.basename(path),
+            spdx_id=spdx_id,
+            checksums=[
+                Checksum(ChecksumAlgorithm[algorithm.upper()], checksums[algorithm])
+                for algorithm in CATALOG_ALGORITHMS
+            ],
+            license_concluded=SpdxNoAssertion(),
+            license_info_in_file=[SpdxNoAssertion()],
+            copyright_text=SpdxNoAssertion(),
+        )
+
+    def get_verification_code(self) -> PackageVerificationCode:
+        return PackageVerificationCode(get_verification_code(file.checksums[0].value for file in self.files))
+
+    def get_graph(self, spdx_id: str, known_files: Container[str] = (), known_paths: Container[str] = ()) -> SbomGraph:
+        # Files already listed are skipped: by spdx_id for the packages of ApkSbom,
+        # which have the same ids, and by path for syft (FileSbom.get_file_paths()).
+        # The package spdx_id must be set as files analyzed with get_verification_code()
+        files = [
+            file for file in self.files
+            if file.spdx_id not in known_files and self.paths[file.spdx_id] not in known_paths
+        ]
+        return SbomGraph(
+            files=files,
+            relationships=[
+                Relationship(spdx_id, RelationshipType.CONTAINS, file.spdx_id) for file in files
+            ],
+        )
@@ -3,27 +3,79 @@
 #  SPDX-License-Identifier: MIT
 
 import os
+import re
 import subprocess
-import json
 import logging
 import sys
+import tempfile
+import time
 
-from typing import List, Any
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional, Set, Tuple
 
-from spdx_tools.spdx.parser.jsonlikedict.json_like_dict_parser import JsonLikeDictParser
 from spdx_tools.spdx.validation.uri_validators import validate_download_location
 from spdx_tools.spdx.model import (
+    Document,
     Package,
-    File,
     SpdxNoAssertion,
     Relationship,
     RelationshipType,
 )
 
+from image_layers import ImageArchive, ImageLayer, LayerPaths, normalize_path
+from sbom_cache import SbomCache
+from sbom_graph import SbomGraph, relationship_triple
+from utility import CHUNK_SIZE, get_file_sha256, get_spdx_id, iter_json_members
+
+SYFT_OUTPUT_FORMAT = "spdx-json@2.2"
+# Members of syft output parsed one element at a time
+SYFT_ELEMENT_ARRAYS = ["packages", "files", "relationships", "hasExtractedLicensingInfos"]
+INVERTED_RELATIONSHIP_TYPES = {
+    RelationshipType.DESCRIBES: RelationshipType.DESCRIBED_BY,
+    RelationshipType.CONTAINS: RelationshipType.CONTAINED_BY,
+}
+
+
+def source_paths(source_info: Optional[str]) -> List[str]:
+    # syft sourceInfo ends with the files a package was found in, e.g.
+    # "acquired package info from installed apk DB: /lib/apk/db/installed"
+    if not source_info or ": " not in source_info:
+        return []
+    return [path.strip() for path in source_info.rsplit(": ", 1)[1].split(",") if path.strip()]
+
+
+@lru_cache(maxsize=None)
+def syft_version() -> str:
+    # Same for every scan of the process
+    try:
+        syft_output = subprocess.run(['syft', '--version'], capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        logging.error("Could not get syft version")
+        sys.exit(1)
+    return syft_output.stdout.decode().strip()
+
+
+class TeeReader:
+    # Stream which also writes what is read from it to another one
+    def __init__(self, stream: IO[bytes], copy: IO[bytes]) -> None:
+        self.stream = stream
+        self.copy = copy
+
+    def read(self, size: int = CHUNK_SIZE) -> bytes:
+        data = self.stream.read(size)
+        self.copy.write(data)
+        return data
+
 
 class FileSbom:
-    def __init__(self, filepath: str) -> None:
+    def __init__(self, filepath: str, cache: Optional[SbomCache] = None) -> None:
         self.target = None
+        self.cache = cache
+        # Time spent in each step, reported by make_sbom.py --profile
+        self.timings: Dict[str, float] = {}
+        # normalize_path() of the syft fileName of each file, which is named after its basename
+        self.file_paths: Dict[str, str] = {}
         self.document = self.get_tarball_sbom(filepath)
         self.packages = self.document.packages
         self.relationships = self.document.relationships
@@ -31,40 +83,262 @@ class FileSbom:
         self.extracted_licensing_info = self.document.extracted_licensing_info
 
     def get_tarball_sbom(self, filepath: str):
+        # syft output is parsed while syft is running, so scan includes parsing
+        start = time.perf_counter()
+        # Layers are only worth scanning separately when their scans are cached
+        image = ImageArchive.open(filepath) if self.cache is not None else None
+        if image is not None:
+            with image:
+                document = self.scan_image(image, filepath)
+        else:
+            with self.scan(filepath) as syft_output:
+                document = self.parse(syft_output, filepath)
+        self.graph.update_document(document)
+        self.timings["scan"] = time.perf_counter() - start
+        return document
+
+    def parse(self, syft_output: IO[bytes], filepath: str, hidden: Optional[LayerPaths] = None) -> Document:
+        # syft output can be very large: instead of holding its text, its json
+        # and its Document at once, elements are parsed one at a time while
+        # reading it. Files which are removed anyway (zero checksum, or contained
+        # by a package whose files were not analyzed) are never parsed.
+        # For image layers, files and packages found in files hidden by the
+        # layers above are dropped the same way.
+        from spdx_tools.spdx.parser.jsonlikedict.creation_info_parser import CreationInfoParser
+        from spdx_tools.spdx.parser.jsonlikedict.extracted_licensing_info_parser import ExtractedLicensingInfoParser
+        from spdx_tools.spdx.parser.jsonlikedict.file_parser import FileParser
+        from spdx_tools.spdx.parser.jsonlikedict.package_parser import PackageParser
+        from spdx_tools.spdx.parser.jsonlikedict.relationship_parser import RelationshipParser
+
         file_name = os.path.basename(filepath)
-        try:
-            syft_output = subprocess.run(['syft', '-o', 'spdx-json@2.2', filepath], capture_output=True, check=True)
-        except subprocess.CalledProcessError as err:
-            logging.error(err.stderr.decode())
-            sys.exit(1)
-        syft_dict = json.loads(syft_output.stdout)
-        document = JsonLikeDictParser().parse(syft_dict)
-
-        # packages
-        for package in document.packages:
-            package = self.check_package_element(package)
-            if file_name == package.name:
-                self.target = package
-            elif filepath == package.name:
-                self.target = package
-                self.target.name = file_name
-            if not package.files_analyzed:
-                document = self.remove_package_unknown_file(package, document)
-
-        # files
-        for file in document.files[:]:
-            file.name = os.path.basename(file.name)
-            file.license_info_in_file = [SpdxNoAssertion()]
-            cksum = file.checksums[0].value
-            if cksum == '0' * len(cksum):
-                self.remove_file(document, file)
+        package_parser = PackageParser()
+        file_parser = FileParser()
+        relationship_parser = RelationshipParser()
+        extracted_licensing_info_parser = ExtractedLicensingInfoParser()
+        document_dict: Dict[str, Any] = {}
+        self.graph = SbomGraph()
+        # spdx ids of packages whose files were not analyzed
+        self.unanalyzed: Set[str] = set()
+        # spdx ids contained by these packages, removed if they are files listed later
+        self.unanalyzed_contents: Set[str] = set()
+        self.removed_files: Set[str] = set()
+        self.removed_packages: Set[str] = set()
+        self.has_files: List[Tuple[str, List[str]]] = []
+
+        for name, element in iter_json_members(syft_output, SYFT_ELEMENT_ARRAYS):
+            if name == "packages":
+                if hidden is not None and any(hidden.hides(path) for path in source_paths(element.get("sourceInfo"))):
+                    # Found again in a layer above, whose package owns the same contents
+                    self.removed_packages.add(element["SPDXID"])
+                    if not element.get("filesAnalyzed", True):
+                        self.unanalyzed.add(element["SPDXID"])
+                    continue
+                package = self.check_package_element(package_parser.parse_package(element))
+                if file_name == package.name:
+                    self.target = package
+                elif filepath == package.name:
+                    self.target = package
+                    self.target.name = file_name
+                if not package.files_analyzed:
+                    self.unanalyzed.add(package.spdx_id)
+                if element.get("hasFiles"):
+                    self.has_files.append((package.spdx_id, element["hasFiles"]))
+                self.graph.add_packages([package])
+            elif name == "files":
+                cksum = (element.get("checksums") or [{}])[0].get("checksumValue", "")
+                if cksum == '0' * len(cksum) or element.get("SPDXID") in self.unanalyzed_contents or \
+                        (hidden is not None and hidden.hides(element.get("fileName", ""))):
+                    self.remove_file(element.get("SPDXID"))
+                    continue
+                file = file_parser.parse_file(element)
+                self.file_paths[file.spdx_id] = normalize_path(file.name)
+                file.name = os.path.basename(file.name)
+                file.license_info_in_file = [SpdxNoAssertion()]
+                self.graph.add_files([file])
+            elif name == "relationships":
+                self.add_relationship(relationship_parser.parse_relationship(element))
+            elif name == "hasExtractedLicensingInfos":
+                self.graph.add_extracted_licensing_info(
+                    [extracted_licensing_info_parser.parse_extracted_licensing_info(element)]
+                )
+            else:
+                # syft writes no snippets nor annotations
+                document_dict[name] = element
+        self.add_derived_relationships(document_dict.get("SPDXID"), document_dict.get("documentDescribes", []))
+        # Only finds files when relationships are listed before packages, syft lists them last
+        for spdx_id in self.unanalyzed:
+            self.remove_package_unknown_file(spdx_id)
+        return Document(CreationInfoParser().parse_creation_info(document_dict))
+
+    def add_relationship(self, relationship: Relationship) -> None:
+        related_id = str(relationship.related_spdx_element_id)
+        if related_id in self.removed_files:
+            return
+        if relationship.spdx_element_id in self.unanalyzed and \
+                relationship.relationship_type == RelationshipType.CONTAINS:
+            if related_id in self.graph.file_index:
+                self.remove_file(related_id)
+                return
+            if related_id not in self.graph.package_index:
+                self.unanalyzed_contents.add(related_id)
+        if related_id in self.removed_packages or relationship.spdx_element_id in self.removed_packages:
+            return
+        self.graph.add_relationships([relationship])
+
+    def add_derived_relationships(self, document_id: str, described_ids: List[str]) -> None:
+        # Like spdx-tools, documentDescribes and the hasFiles of packages are
+        # also relationships, unless they are listed already
+        existing = {relationship_triple(relationship) for relationship in self.graph.relationships}
+        derived = [(document_id, RelationshipType.DESCRIBES, spdx_id) for spdx_id in described_ids]
+        derived += [
+            (package_id, RelationshipType.CONTAINS, file_id)
+            for package_id, file_ids in self.has_files
+            for file_id in file_ids
+        ]
+        for spdx_id, relationship_type, related_id in derived:
+            inverted_type = INVERTED_RELATIONSHIP_TYPES[relationship_type]
+            if (spdx_id, relationship_type.name, related_id) in existing or \
+                    (related_id, inverted_type.name, spdx_id) in existing:
+                continue
+            existing.add((spdx_id, relationship_type.name, related_id))
+            self.add_relationship(Relationship(spdx_id, relationship_type, related_id))
+
+    def scan_image(self, image: ImageArchive, filepath: str) -> Document:
+        # Layers are scanned from the top: what a layer overwrites or deletes
+        # is dropped from the scans of the layers below. The cached scan of a
+        # layer only depends on the layer, so rebuilding an image with new
+        # top layers only scans these layers.
+        file_name = os.path.basename(filepath)
+        image_root = Package(
+            spdx_id=get_spdx_id(f"DocumentRoot-Image-{re.sub(r'[^A-Za-z0-9.]', '-', file_name)}"),
+            name=file_name,
+            download_location=SpdxNoAssertion(),
+            files_analyzed=False,
+            license_concluded=SpdxNoAssertion(),
+            license_declared=SpdxNoAssertion(),
+            copyright_text=SpdxNoAssertion(),
+        )
+        graph = SbomGraph(packages=[image_root])
+        hidden = LayerPaths()
+        document = None
+        layers = image.layers[::-1]
+        with tempfile.TemporaryDirectory() as directory:
+            for index, layer in enumerate(layers):
+                with self.scan_layer(image, layer, directory) as syft_output:
+                    layer_document = self.parse(syft_output, str(layer.digest), hidden)
+                self.merge_layer(graph, layer, layer_document, image_root)
+                document = document or layer_document
+                # nothing is below the last layer
+                if index + 1 < len(layers):
+                    hidden.update(self.layer_paths(image, layer, directory))
+                image.remove(layer)
+        assert document is not None
+        document.creation_info.name = filepath
+        graph.add_relationships([
+            Relationship(document.creation_info.spdx_id, RelationshipType.DESCRIBES, image_root.spdx_id)
+        ])
+        self.graph = graph
+        self.target = image_root
+        logging.info("scanned %d layers of %s", len(layers), file_name)
         return document
 
-    def remove_file(self, document: Any, file: File):
-        for relation in document.relationships[:]:
-            if file.spdx_id == relation.related_spdx_element_id:
-                document.relationships.remove(relation)
-        document.files.remove(file)
+    @contextmanager
+    def scan_layer(self, image: ImageArchive, layer: ImageLayer, directory: str) -> Iterator[IO[bytes]]:
+        assert self.cache is not None
+        if layer.digest is None:
+            # the digest of the layer content is only known once extracted
+            image.extract(layer, directory)
+        with self.cached_scan(str(layer.digest), f"layer {layer.digest} of {os.path.basename(image.filepath)}",
+                              lambda: image.extract(layer, directory)) as syft_output:
+            yield syft_output
+
+    def layer_paths(self, image: ImageArchive, layer: ImageLayer, directory: str) -> LayerPaths:
+        assert self.cache is not None
+        key = self.cache.key("layer-paths", str(layer.digest))
+        data = self.cache.get(key)
+        if data is not None:
+            return LayerPaths.from_json(data)
+        paths = LayerPaths.from_tarball(image.extract(layer, directory))
+        self.cache.put(key, paths.to_json())
+        return paths
+
+    def merge_layer(self, graph: SbomGraph, layer: ImageLayer, document: Document, image_root: Package) -> None:
+        # The root of the layer scan, described by its document, is contained
+        # by the image. Its id is named after the temporary file syft scanned,
+        # it is replaced by one named after the layer digest.
+        # Elements found in several layers are only kept once.
+        for relationship in self.graph.relationships_from(document.creation_info.spdx_id, RelationshipType.DESCRIBES):
+            layer_root = self.graph.get_package(str(relationship.related_spdx_element_id))
+            if layer_root is None:
+                continue
+            scanned_id = layer_root.spdx_id
+            self.graph.remove_relationships_to(scanned_id)
+            layer_root.name = str(layer.digest)
+            layer_root.spdx_id = get_spdx_id(f"DocumentRoot-Layer-{str(layer.digest).replace(':', '-')}")
+            self.graph.add_packages([layer_root])
+            self.graph.replace_package(scanned_id, layer_root.spdx_id)
+            self.graph.add_relationships([
+                Relationship(image_root.spdx_id, RelationshipType.CONTAINS, layer_root.spdx_id)
+            ])
+        existing = {relationship_triple(relationship) for relationship in graph.relationships}
+        license_ids = {info.license_id for info in graph.extracted_licensing_info}
+        graph.add_packages(package for package in self.graph.packages if package.spdx_id not in graph.package_index)
+        graph.add_files(file for file in self.graph.files if file.spdx_id not in graph.file_index)
+        graph.add_relationships(
+            relationship for relationship in self.graph.relationships
+            if relationship_triple(relationship) not in existing
+        )
+        graph.add_extracted_licensing_info(
+            info for info in self.graph.extracted_licensing_info if info.license_id not in license_ids
+        )
+
+    @contextmanager
+    def scan(self, filepath: str) -> Iterator[IO[bytes]]:
+        if self.cache is None:
+            with self.run_syft(filepath) as syft_output:
+                yield syft_output
+            return
+        with self.cached_scan(get_file_sha256(filepath), os.path.basename(filepath), lambda: filepath) as syft_output:
+            yield syft_output
+
+    @contextmanager
+    def cached_scan(self, digest: str, name: str, get_path: Callable[[], str]) -> Iterator[IO[bytes]]:
+        # Same input, syft version and output format always give the same scan result,
+        # get_path() is only called when syft has to run
+        assert self.cache is not None
+        key = self.cache.key(digest, syft_version(), SYFT_OUTPUT_FORMAT)
+        cached = self.cache.open(key)
+        if cached is not None:
+            logging.info("reusing cached syft scan for %s", name)
+            with cached:
+                yield cached
+            return
+        # The entry is written while syft output is parsed, and dropped
+        # if syft fails (run_syft() exits first)
+        with self.cache.writer(key) as entry, self.run_syft(get_path()) as syft_output:
+            yield TeeReader(syft_output, entry)
+
+    @contextmanager
+    def run_syft(self, filepath: str) -> Iterator[IO[bytes]]:
+        # stderr goes to a file: reading both pipes from a single thread could deadlock
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(
+                ['syft', '-o', SYFT_OUTPUT_FORMAT, filepath], stdout=subprocess.PIPE, stderr=stderr
+            )
+            assert process.stdout is not None
+            try:
+                yield process.stdout
+            finally:
+                process.stdout.close()
+                if process.wait() != 0:
+                    stderr.seek(0)
+                    logging.error(stderr.read().decode())
+                    sys.exit(1)
+
+    def remove_file(self, spdx_id: str):
+        # Relationships to the file listed later are skipped
+        self.removed_files.add(spdx_id)
+        self.graph.remove_file(spdx_id)
 
     def check_package_element(self, package: Package):
         if not package.files_analyzed:
@@ -73,23 +347,10 @@ class FileSbom:
             package.download_location = SpdxNoAssertion()
         return package
 
-    def remove_package_unknown_file(self, package: Package,
-                                    document: Any):
-        remove_files = []
-        remove_relations = []
-        for relation in document.relationships:
-            if package.spdx_id == relation.spdx_element_id and \
-                relation.relationship_type == RelationshipType.CONTAINS:
-                for file in document.files:
-                    if relation.related_spdx_element_id == file.spdx_id:
-                        remove_files.append(file)
-                        remove_relations.append(relation)
-
-        for remove_file in remove_files:
-            document.files.remove(remove_file)
-        for remove_relation in remove_relations:
-            document.relationships.remove(remove_relation)
-        return document
+    def remove_package_unknown_file(self, spdx_id: str):
+        for relation in self.graph.relationships_from(spdx_id, RelationshipType.CONTAINS):
+            if self.graph.get_file(relation.related_spdx_element_id) is not None:
+                self.remove_file(relation.related_spdx_element_id)
 
     def is_valid_download_location(self, url: str):
         if len(validate_download_location(url)) > 0:
@@ -98,11 +359,21 @@ class FileSbom:
 
     def get_relationships(self, spdx_id: str) -> List[Relationship]:
         if self.target:
-            self.relationships.append(
+            return [
                 Relationship(
                     spdx_element_id=spdx_id,
                     relationship_type=RelationshipType.CONTAINS,
                     related_spdx_element_id=self.target.spdx_id,
                 )
-            )
-        return self.relationships
+            ]
+        return []
+
+    def get_file_paths(self) -> Set[str]:
+        # Paths of the files kept in the scan result
+        return {self.file_paths[file.spdx_id] for file in self.graph.files if file.spdx_id in self.file_paths}
+
+    def get_graph(self, spdx_id: str) -> SbomGraph:
+        graph = SbomGraph()
+        graph.merge(self.graph)
+        graph.add_relationships(self.get_relationships(spdx_id))
+        return graph
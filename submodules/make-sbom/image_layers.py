@@ -0,0 +1,203 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# Layers of docker (docker save) and OCI image archives, so that they can be
+# scanned one at a time and their scans cached by layer digest
+
+import json
+import logging
+import os
+import posixpath
+import shutil
+import tarfile
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from utility import GZIP_MAGIC, ZSTD_MAGIC, get_file_sha256, open_compressed, open_tarball_stream
+
+WHITEOUT_PREFIX = ".wh."
+OPAQUE_WHITEOUT = ".wh..wh..opq"
+
+
+def normalize_path(path: str) -> str:
+    # Tarball members and syft file names, e.g. ./usr/bin/ls or /usr/bin/ls
+    return posixpath.normpath(posixpath.join("/", path)).lstrip("/")
+
+
+class LayerPaths:
+    # Paths of a layer, and of the layers above it once merged with update():
+    # the same paths of lower layers are overwritten or deleted
+    def __init__(self, paths: Iterable[str] = (), deleted: Iterable[str] = (),
+                 opaque: Iterable[str] = ()) -> None:
+        self.paths: Set[str] = set(paths)
+        # deleted paths and everything below them, from .wh.<name> files
+        self.deleted: Set[str] = set(deleted)
+        # directories whose lower contents are hidden, from .wh..wh..opq files
+        self.opaque: Set[str] = set(opaque)
+
+    @classmethod
+    def from_tarball(cls, filepath: str) -> "LayerPaths":
+        layer_paths = cls()
+        with open_tarball_stream(filepath) as tar:
+            for member in tar:
+                path = normalize_path(member.name)
+                directory, name = posixpath.split(path)
+                if name == OPAQUE_WHITEOUT:
+                    layer_paths.opaque.add(directory)
+                elif name.startswith(WHITEOUT_PREFIX):
+                    layer_paths.deleted.add(posixpath.join(directory, name[len(WHITEOUT_PREFIX):]))
+                elif not member.isdir():
+                    layer_paths.paths.add(path)
+        return layer_paths
+
+    @classmethod
+    def from_json(cls, data: bytes) -> "LayerPaths":
+        return cls(**json.loads(data))
+
+    def to_json(self) -> bytes:
+        return json.dumps({
+            "paths": sorted(self.paths), "deleted": sorted(self.deleted), "opaque": sorted(self.opaque)
+        }).encode()
+
+    def update(self, other: "LayerPaths") -> None:
+        self.paths |= other.paths
+        self.deleted |= other.deleted
+        self.opaque |= other.opaque
+
+    def hides(self, path: str) -> bool:
+        # Whiteout files are not files of the image either
+        path = normalize_path(path)
+        if path in self.paths or posixpath.basename(path).startswith(WHITEOUT_PREFIX):
+            return True
+        parent = path
+        while parent:
+            if parent in self.deleted or (parent != path and parent in self.opaque):
+                return True
+            parent = posixpath.dirname(parent)
+        return "" in self.opaque
+
+
+class ImageLayer:
+    def __init__(self, member: str, digest: Optional[str]) -> None:
+        self.member = member
+        # Not known from the archive metadata for some docker archives
+        self.digest = digest
+
+
+class ImageArchive:
+    # Random access to the blobs: layers are only extracted when their scan
+    # is not cached already
+    def __init__(self, filepath: str, tar: tarfile.TarFile, members: Dict[str, tarfile.TarInfo]) -> None:
+        self.filepath = filepath
+        self.tar = tar
+        self.members = members
+        self.layers: List[ImageLayer] = []
+        self.extracted: Dict[str, str] = {}
+
+    @classmethod
+    def open(cls, filepath: str) -> Optional["ImageArchive"]:
+        # None when filepath is not an image archive, e.g. a rootfs tarball
+        try:
+            tar = tarfile.open(filepath)
+        except (tarfile.TarError, OSError):
+            return None
+        members = {}
+        for member in tar:
+            path = normalize_path(member.name)
+            # Image archives only have a few files at the top and in blobs/<algorithm>/,
+            # or in <layer id>/ for the older docker format
+            depth = path.count("/")
+            if depth > 2 or (depth == 2 and not path.startswith("blobs/")):
+                tar.close()
+                return None
+            members[path] = member
+        image = cls(filepath, tar, members)
+        try:
+            if "manifest.json" in members:
+                image.layers = image.docker_layers()
+            elif "index.json" in members and "oci-layout" in members:
+                image.layers = image.oci_layers()
+        except (KeyError, TypeError, ValueError) as e:
+            logging.warning("could not read the layers of %s: %s", os.path.basename(filepath), e)
+            image.layers = []
+        if not image.layers:
+            image.close()
+            return None
+        return image
+
+    def __enter__(self) -> "ImageArchive":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.tar.close()
+
+    def read_json(self, path: str) -> Any:
+        f = self.tar.extractfile(self.members[normalize_path(path)])
+        if f is None:
+            raise KeyError(path)
+        with f:
+            return json.load(f)
+
+    def blob_path(self, digest: str) -> str:
+        algorithm, _, value = digest.partition(":")
+        return f"blobs/{algorithm}/{value}"
+
+    def docker_layers(self) -> List[ImageLayer]:
+        manifest = self.read_json("manifest.json")
+        if len(manifest) != 1:
+            logging.info("%s contains %d images, layers are not scanned separately",
+                         os.path.basename(self.filepath), len(manifest))
+            return []
+        layers = manifest[0]["Layers"]
+        # diff_ids are the digests of the uncompressed layers
+        diff_ids = self.read_json(manifest[0]["Config"]).get("rootfs", {}).get("diff_ids", [])
+        if len(diff_ids) != len(layers):
+            diff_ids = [None] * len(layers)
+        return [ImageLayer(normalize_path(layer), diff_id) for layer, diff_id in zip(layers, diff_ids)]
+
+    def oci_layers(self) -> List[ImageLayer]:
+        index = self.read_json("index.json")
+        # Follow nested indexes as long as they have a single manifest
+        while True:
+            manifests = index.get("manifests", [])
+            if len(manifests) != 1:
+                logging.info("%s contains %d manifests, layers are not scanned separately",
+                             os.path.basename(self.filepath), len(manifests))
+                return []
+            index = self.read_json(self.blob_path(manifests[0]["digest"]))
+            if "manifests" not in index:
+                break
+        return [ImageLayer(self.blob_path(layer["digest"]), layer["digest"]) for layer in index["layers"]]
+
+    def extract(self, layer: ImageLayer, directory: str) -> str:
+        # Layers are written as uncompressed tarballs: what syft scans for a rootfs
+        if layer.member in self.extracted:
+            return self.extracted[layer.member]
+        f = self.tar.extractfile(self.members[layer.member])
+        if f is None:
+            raise KeyError(layer.member)
+        name = layer.digest.partition(":")[2] if layer.digest else f"layer{len(self.extracted)}"
+        layer_file = os.path.join(directory, f"{name}.tar")
+        with f, open(layer_file, "wb") as out:
+            shutil.copyfileobj(f, out)
+        with open(layer_file, "rb") as out:
+            magic = out.read(len(ZSTD_MAGIC))
+        if magic.startswith(GZIP_MAGIC) or magic == ZSTD_MAGIC:
+            compressed = layer_file + ".compressed"
+            os.rename(layer_file, compressed)
+            with open_compressed(compressed) as f, open(layer_file, "wb") as out:
+                shutil.copyfileobj(f, out)
+            os.unlink(compressed)
+        if layer.digest is None:
+            layer.digest = f"sha256:{get_file_sha256(layer_file)}"
+        self.extracted[layer.member] = layer_file
+        return layer_file
+
+    def remove(self, layer: ImageLayer) -> None:
+        # Extracted layers can be as large as the image
+        layer_file = self.extracted.pop(layer.member, None)
+        if layer_file is not None:
+            os.unlink(layer_file)
@@ -0,0 +1,120 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# pyright: reportPrivateImportUsage=false
+
+import json
+import logging
+import re
+from hashlib import sha256
+from typing import Any, Dict, Optional, Tuple
+
+from spdx_tools.spdx.model import Package
+from spdx_tools.spdx.parser.error import SPDXParsingError
+
+from license_index import license_database_digest
+from rename_license import LICENSE_MAP
+from sbom_graph import SbomGraph
+from utility import get_file_sha256, get_spdx_id, parse_spdx_file
+
+# get_spdx_id(name, uuid=True) suffix
+UUID_RE = re.compile(r"-[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+# get_license_data_comment() in the creator comment of the previous sbom
+LICENSE_DATA_RE = re.compile(r"^license data: ([0-9a-f]{64})$", re.MULTILINE)
+
+
+def get_license_data_digest() -> str:
+    # The licenses of the packages come from license_map.yaml and from the
+    # SPDX license database license_index.json is built from
+    digest = sha256()
+    digest.update(get_file_sha256(LICENSE_MAP).encode() + b"\0")
+    digest.update(license_database_digest().encode())
+    return digest.hexdigest()
+
+
+def get_license_data_comment() -> str:
+    return f"license data: {get_license_data_digest()}"
+
+
+class PreviousSbom:
+    def __init__(self, filepath: str) -> None:
+        self.document = self.spdx_parse(filepath)
+        self.graph = SbomGraph.from_document(self.document)
+        self.package_list_index = self.get_package_list_index()
+        self.reused = 0
+
+    def spdx_parse(self, filepath: str):
+        try:
+            document: Any = parse_spdx_file(filepath)
+        except SPDXParsingError:
+            logging.exception("Failed to parse previous spdx file")
+            exit()
+        return document
+
+    def get_package_list_index(self) -> Dict[Tuple[str, str], Package]:
+        # Packages created by PackagesSbom are the only ones
+        # whose spdx_id is the package name followed by an uuid
+        index = {}
+        match = LICENSE_DATA_RE.search(self.document.creation_info.creator_comment or "")
+        if match is None or match.group(1) != get_license_data_digest():
+            logging.info("license data changed since the previous sbom, all packages are rebuilt")
+            return index
+        for package in self.graph.packages:
+            if UUID_RE.sub("", package.spdx_id) == get_spdx_id(package.name):
+                index[(package.name, package.version)] = package
+        return index
+
+    def get_package(self, name: str, version: str) -> Optional[Package]:
+        # An apk or deb of a given version always has the same license,
+        # so the previous package can be kept as is, including its spdx_id
+        package = self.package_list_index.get((name, version))
+        if package is not None:
+            self.reused += 1
+        return package
+
+    def get_delta(self, graph: SbomGraph) -> Dict[str, Any]:
+        def package_key(package):
+            return f"{package.name}@{package.version}" if package.version else package.name
+
+        def file_key(file):
+            return f"{file.name}:{file.checksums[0].value}" if file.checksums else file.name
+
+        def relationship_key(relationship):
+            return (relationship.spdx_element_id, relationship.relationship_type.name,
+                    str(relationship.related_spdx_element_id))
+
+        def delta(previous, current):
+            return {
+                "added": sorted(current - previous),
+                "removed": sorted(previous - current),
+                "unchanged": len(previous & current),
+            }
+
+        relationships = delta(
+            {relationship_key(relationship) for relationship in self.graph.relationships},
+            {relationship_key(relationship) for relationship in graph.relationships},
+        )
+        return {
+            "packages": {
+                **delta(
+                    {package_key(package) for package in self.graph.packages},
+                    {package_key(package) for package in graph.packages},
+                ),
+                "reused": self.reused,
+            },
+            "files": delta(
+                {file_key(file) for file in self.graph.files},
+                {file_key(file) for file in graph.files},
+            ),
+            "relationships": {
+                "added": len(relationships["added"]),
+                "removed": len(relationships["removed"]),
+                "unchanged": relationships["unchanged"],
+            },
+        }
+
+    def write_delta(self, graph: SbomGraph, output: str) -> None:
+        with open(output, "w") as f:
+            json.dump(self.get_delta(graph), f, indent=4)
+        logging.info("created " + output)
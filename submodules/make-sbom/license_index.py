@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# Compact index of the SPDX license symbols known to license_expression.
+# get_spdx_licensing() reads the whole scancode license database and builds
+# a matcher for every key and alias each time it is called. license_index.json
+# only keeps what SPDX expressions need, grouped by the first word of each key
+# and alias: an expression is parsed with the few symbols that can match it,
+# which gives the same result. It is built from the license-expression version
+# pinned in requirements.txt, regenerate it when updating the pin:
+#   python3 license_index.py
+
+import json
+import logging
+import os
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
+
+import license_expression
+from license_expression import LicenseExpression, LicenseSymbol, Licensing
+
+from utility import get_file_sha256
+
+LICENSE_INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)), "license_index.json")
+# Words of an expression, as split by the license_expression tokenizer
+LICENSE_WORD_RE = re.compile(r"[^\s()]+")
+
+
+def license_database() -> str:
+    return license_expression.vendored_scancode_licensedb_index_location
+
+
+def license_database_digest() -> str:
+    # Identifies the SPDX license database shipped with license_expression
+    return get_file_sha256(license_database())
+
+
+def first_word(name: str) -> str:
+    words = LICENSE_WORD_RE.findall(name.lower())
+    return words[0] if words else ""
+
+
+def build_index(license_index: Iterable[Dict[str, Any]], digest: str) -> Dict[str, Any]:
+    # Same symbols as license_expression.build_spdx_licensing()
+    symbols: List[List[Any]] = []
+    words: Dict[str, List[int]] = defaultdict(list)
+    for license in license_index:
+        if not license.get("spdx_license_key"):
+            continue
+        key = license["spdx_license_key"]
+        aliases = license.get("other_spdx_license_keys", [])
+        for word in sorted({first_word(name) for name in [key, *aliases] if name}):
+            words[word].append(len(symbols))
+        symbols.append([key, aliases, license.get("is_deprecated", False), license.get("is_exception", False)])
+    return {"database": digest, "symbols": symbols, "words": words}
+
+
+@lru_cache(maxsize=None)
+def load_index() -> Dict[str, Any]:
+    digest = license_database_digest()
+    try:
+        with open(LICENSE_INDEX) as f:
+            index = json.load(f)
+        if index["database"] == digest:
+            return index
+        logging.debug("%s is not up to date, indexing the license database", os.path.basename(LICENSE_INDEX))
+    except FileNotFoundError:
+        logging.debug("%s not found, indexing the license database", os.path.basename(LICENSE_INDEX))
+    with open(license_database()) as f:
+        return build_index(json.load(f), digest)
+
+
+def parse_license(expression: str, validate: bool = False) -> Optional[LicenseExpression]:
+    # Same as get_spdx_licensing().parse(expression, validate=validate),
+    # raises ExpressionError the same way
+    index = load_index()
+    candidates = sorted({
+        symbol for word in LICENSE_WORD_RE.findall(expression.lower()) for symbol in index["words"].get(word, ())
+    })
+    licensing = Licensing([
+        LicenseSymbol(key=key, aliases=aliases, is_deprecated=is_deprecated, is_exception=is_exception)
+        for key, aliases, is_deprecated, is_exception in (index["symbols"][symbol] for symbol in candidates)
+    ])
+    return licensing.parse(expression, validate=validate)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    with open(license_database()) as f:
+        index = build_index(json.load(f), license_database_digest())
+    with open(LICENSE_INDEX, "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+        f.write("\n")
+    logging.info("indexed %d licenses in %s", len(index["symbols"]), os.path.basename(LICENSE_INDEX))
+
+
+if __name__ == "__main__":
+    main()
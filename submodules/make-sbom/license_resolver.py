@@ -0,0 +1,58 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# pyright: reportPrivateImportUsage=false
+
+import logging
+import pickle
+from typing import Dict, Optional, Tuple, Union
+
+from license_expression import ExpressionError, LicenseExpression
+from spdx_tools.spdx.model import SpdxNoAssertion
+
+from license_index import license_database_digest, parse_license
+from sbom_cache import SbomCache
+
+
+class LicenseResolver:
+    def __init__(self, cache: Optional[SbomCache] = None) -> None:
+        self.cache = cache
+        self.memo: Dict[Tuple[str, bool], Optional[Union[LicenseExpression, SpdxNoAssertion]]] = {}
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        if self.cache is not None:
+            # The SPDX license database identifies the parse and validation results
+            self.key = self.cache.key("license-expression", license_database_digest())
+            self.load()
+
+    def load(self) -> None:
+        data = self.cache.get(self.key)
+        if data is None:
+            return
+        try:
+            self.memo.update(pickle.loads(data))
+        except Exception:
+            logging.warning("Ignoring unreadable license cache")
+
+    def save(self) -> None:
+        if self.cache is None or not self.dirty:
+            return
+        self.cache.put(self.key, pickle.dumps(self.memo))
+        self.dirty = False
+
+    def resolve(self, license: str, validate=True) -> Optional[Union[LicenseExpression, SpdxNoAssertion]]:
+        # Known failures are memoized too, as NOASSERTION
+        if (license, validate) in self.memo:
+            self.hits += 1
+            return self.memo[(license, validate)]
+        self.misses += 1
+        # Receive ExpressionError if license cannot be obtained
+        try:
+            spdx_license = parse_license(license, validate=validate)
+        except ExpressionError:
+            spdx_license = SpdxNoAssertion()
+        self.memo[(license, validate)] = spdx_license
+        self.dirty = True
+        return spdx_license
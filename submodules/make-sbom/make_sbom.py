@@ -7,17 +7,31 @@
 # pyright: reportPrivateImportUsage=false
 
 import logging
+import os
+import pickle
 from argparse import ArgumentParser, Namespace
-from os import path
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+from hashlib import sha256
+from os import cpu_count, path
+from typing import Any, Container, List, Optional, Set, Tuple, Union
 
-from spdx_tools.spdx.writer.write_anything import write_file
+from yaml import safe_load
 
+from apk_sbom import ApkSbom
+from debian_licenses import get_debian_rootfs_digest
 from external_sbom import ExternalSbom
+from file_catalog import FileCatalog
 from packages_sbom import PackagesSbom
-from file_sbom import FileSbom
-from yaml_sbom import YamlSbom
-from utility import get_spdx_id
+from file_sbom import SYFT_OUTPUT_FORMAT, FileSbom, syft_version
+from incremental_sbom import PreviousSbom, get_license_data_comment
+from license_resolver import LicenseResolver
+from profiler import Profiler
+from sbom_cache import SbomCache, DEFAULT_MAX_SIZE
+from sbom_graph import SbomGraph
+from sbom_writer import write_document_to_file
+from yaml_sbom import YamlSbom, set_file_checksums
+from utility import get_file_sha256, get_spdx_id, strip_compressed_extension
 from spdx_tools.spdx.model import (
     Document
 )
@@ -44,82 +58,494 @@ def get_option() -> Namespace:
     parser.add_argument(
         "-e",
         "--external_sbom",
-        help="external .sbom.json to add to the sbom you are creating (multiple allowed)",
+        help="external .sbom.json (or .sbom.json.gz, .sbom.json.zst) to add to the sbom you are creating "
+        "(multiple allowed)",
         action="append",
         default=[],
     )
-    parser.add_argument("-o", "--output", help="file name of the sbom to be created")
     parser.add_argument(
-        "-p", "--package", help="*package_list.txt created by build_rootfs"
+        "-o", "--output", help="file name of the sbom to be created, compressed if it ends with .gz or .zst"
+    )
+    parser.add_argument(
+        "-p", "--package",
+        help="*package_list.txt created by build_rootfs, or a debian rootfs directory or tarball to read "
+        "the installed packages and their licenses from"
     )
     parser.add_argument(
         "-f", "--file", help="create sbom include scan results to main sbom output if created",
         action="append", default=[],
     )
+    parser.add_argument(
+        "--scanner",
+        help="how --file is scanned: syft, or apk to read the apk database of alpine rootfs tarballs "
+        "without syft. Default is %(default)s",
+        choices=["syft", "apk"],
+        default="syft",
+    )
+    parser.add_argument(
+        "--catalog",
+        help="also list every regular file of the --file tarballs with its sha1 and sha256",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="directory used to cache scan results and validated external sboms between runs. Default is no cache",
+    )
+    parser.add_argument(
+        "--cache-max-size",
+        help="maximum size of the scan cache in MiB. Default is %(default)s",
+        type=int,
+        default=DEFAULT_MAX_SIZE // (1024 * 1024),
+    )
+    parser.add_argument(
+        "--incremental",
+        help="previous .spdx.json of the same input, packages that did not change are reused from it. "
+        "Only sboms created with --incremental record the license data needed to reuse their packages",
+    )
+    parser.add_argument(
+        "--delta-report",
+        help="with --incremental, write the differences from the previous sbom to this json file",
+    )
+    parser.add_argument(
+        "--deduplicate",
+        help="merge the packages found by several sources (package list, scans, external sboms) "
+        "with the same purl, name and checksum, or name and version",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--reproducible",
+        help="derive spdx ids from package contents and the creation date from SOURCE_DATE_EPOCH, "
+        "so that the same inputs give the same sbom. With --cache-dir, an up to date sbom is not created again",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-m",
+        "--manifest",
+        help="yaml list of sboms to create in this process, each with the options above",
+    )
+    parser.add_argument(
+        "--prepare",
+        help="only build the parts of the sbom that do not need the --input and --file files, "
+        "which may not exist yet, and save them to this file for --finalize",
+    )
+    parser.add_argument(
+        "--finalize",
+        help="complete the sbom saved by --prepare once its --input and --file files exist. "
+        "The other options of the sbom are the ones given to --prepare",
+    )
+    parser.add_argument(
+        "--index",
+        help="sqlite index to add the created sboms to, see sbom_index.py",
+    )
+    parser.add_argument(
+        "--profile",
+        help="write wall time, cpu time and peak memory of each stage to this json file",
+    )
+    parser.add_argument(
+        "--profile-cprofile",
+        help="with --profile, also dump cProfile stats of the slowest stage to this file",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="number of --file scans, or processes parsing debian copyright files, to run concurrently. "
+        "Default is the number of CPUs",
+        type=int,
+        default=cpu_count() or 1,
+    )
     return parser.parse_args()
 
-def output_sbom(document, output, file):
+
+def scan_files(files: List[str], cache, jobs: int, scanner: str = "syft",
+               license_resolver: Optional[LicenseResolver] = None) -> List[Union[FileSbom, ApkSbom]]:
+    if scanner == "apk":
+        # tarballs are decompressed by zstd, or by python without holding the GIL
+        def scan(file):
+            return ApkSbom(file, license_resolver)
+    else:
+        def scan(file):
+            return FileSbom(file, cache)
+    # syft runs as a separate process, so threads are enough to overlap scans.
+    # map() returns results in input order so the merged document stays deterministic.
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return list(executor.map(scan, files))
+
+
+def catalog_files(file: str, file_sbom: Union[FileSbom, ApkSbom], jobs: int) -> Optional[SbomGraph]:
+    # The files are contained by the root package of the scan
+    if file_sbom.target is None:
+        logging.warning("no package for %s in scan result, its files are not cataloged", path.basename(file))
+        return None
+    catalog = FileCatalog(file, jobs)
+    logging.info("cataloged %d files of %s", len(catalog.files), path.basename(file))
+    file_sbom.target.files_analyzed = True
+    file_sbom.target.verification_code = catalog.get_verification_code()
+    known_paths: Container[str] = ()
+    if isinstance(file_sbom, FileSbom):
+        # syft lists some of the files under its own ids, ApkSbom files have the catalog ids
+        known_paths = file_sbom.get_file_paths()
+    return catalog.get_graph(file_sbom.target.spdx_id, file_sbom.graph.file_index, known_paths)
+
+
+def get_output_path(output, file):
     if output is None:
-        out_file = f"{file}.spdx.json"
+        return f"{file}.spdx.json"
+    # .spdx.json.gz and .spdx.json.zst outputs are compressed
+    return (
+        output
+        if strip_compressed_extension(output).endswith(".spdx.json")
+        else f"{output}.spdx.json"
+    )
+
+
+def output_sbom(document, output, file, validated: Container[Tuple[str, str]] = frozenset()):
+    out_file = get_output_path(output, file)
+    write_document_to_file(document, out_file, validated=validated)
+    logging.info("created " + path.basename(out_file))
+    return out_file
+
+
+def get_inputs_digest(args: Namespace, config: str) -> str:
+    # Everything the content of a reproducible sbom depends on:
+    # the input files, the options, SOURCE_DATE_EPOCH and make-sbom itself
+    digest = sha256()
+
+    def add(*values: str) -> None:
+        for value in values:
+            digest.update(value.encode() + b"\0")
+
+    add(path.basename(args.input), get_file_sha256(args.input), get_file_sha256(config),
+        os.environ.get("SOURCE_DATE_EPOCH", ""), str(args.deduplicate))
+    # reproducible spdx ids depend on the names of the package list and scanned files
+    if args.package and path.isdir(args.package):
+        add("package", path.basename(args.package), get_debian_rootfs_digest(args.package))
     else:
-        out_file = (
-            output
-            if output.endswith(".spdx.json")
-            else f"{output}.spdx.json"
+        add("package", *((path.basename(args.package), get_file_sha256(args.package)) if args.package else ()))
+    add("incremental", get_file_sha256(args.incremental) if args.incremental else "")
+    for file in args.file:
+        add("file", path.basename(file), get_file_sha256(file))
+    if args.file:
+        add(args.scanner, str(args.catalog),
+            *((syft_version(), SYFT_OUTPUT_FORMAT) if args.scanner == "syft" else ()))
+    for sbom in args.external_sbom:
+        add("external_sbom", get_file_sha256(sbom))
+    sources = path.dirname(path.abspath(__file__))
+    for source in sorted(glob(path.join(sources, "*.py"))) + [path.join(sources, "license_map.yaml")]:
+        add(path.basename(source), get_file_sha256(source))
+    from importlib import metadata
+
+    for distribution in ("spdx-tools", "license-expression"):
+        add(distribution, metadata.version(distribution))
+    return digest.hexdigest()
+
+
+def output_up_to_date(outputs_cache: SbomCache, inputs_digest: str, out_file: str,
+                      delta_report: Optional[str] = None) -> bool:
+    # The cache maps the digest of the inputs to the digest of the sbom created from them,
+    # and to the delta report written with it
+    output_digest = outputs_cache.get(outputs_cache.key(inputs_digest))
+    if output_digest is None or not path.exists(out_file) or output_digest.decode() != get_file_sha256(out_file):
+        return False
+    if delta_report:
+        delta = outputs_cache.get(outputs_cache.key(inputs_digest, "delta report"))
+        if delta is None:
+            return False
+        with open(delta_report, "wb") as f:
+            f.write(delta)
+        logging.info("created " + delta_report)
+    return True
+
+
+class PreparedSbom:
+    # The parts of an sbom with --input which do not depend on the content of
+    # the input and scanned files: saved by --prepare while they are being built
+    def __init__(self, args: Namespace, document: Document, graph: SbomGraph,
+                 previous: Optional[PreviousSbom]) -> None:
+        self.args = args
+        # make_sbom() works with input in current directory
+        self.cwd = os.getcwd()
+        self.document = document
+        self.graph = graph
+        self.previous = previous
+        # get_element_key() of the elements of external sboms validated on their own
+        self.validated: Set[Tuple[str, str]] = set()
+
+    def save(self, filepath: str) -> None:
+        with open(filepath, "wb") as f:
+            pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(filepath: str) -> "PreparedSbom":
+        with open(filepath, "rb") as f:
+            return pickle.load(f)
+
+
+def prepare_sbom(args: Namespace, license_resolver: LicenseResolver, profiler: Profiler,
+                 external_cache: Optional[SbomCache] = None, jobs: int = 1) -> PreparedSbom:
+    # Nothing here reads the input file, its checksums are set by make_sbom()
+    filename = path.basename(args.input)
+    spdx_id = get_spdx_id(filename)
+    previous = None
+    if args.incremental:
+        with profiler.stage("previous"):
+            previous = PreviousSbom(args.incremental)
+    with profiler.stage("yaml"):
+        yaml_sbom = YamlSbom(filename, args.config or "config.yaml", args.reproducible, checksums=False)
+        if args.incremental:
+            # --incremental only reuses packages whose licenses were resolved the same way,
+            # recorded for the next --incremental run
+            creation_info = yaml_sbom.document.creation_info
+            creation_info.creator_comment = "\n".join(
+                comment for comment in (creation_info.creator_comment, get_license_data_comment()) if comment
+            )
+        prepared = PreparedSbom(args, yaml_sbom.document, yaml_sbom.get_graph(), previous)
+    logging.info("Building SBOM...")
+    if args.package:
+        logging.info("package information is created from package list")
+        logging.warning("not created purl in package information")
+        with profiler.stage("packages"):
+            packages_sbom = PackagesSbom(args.package, license_resolver, previous, args.reproducible, jobs)
+            prepared.graph.merge(packages_sbom.get_graph(spdx_id))
+    with profiler.stage("external"):
+        for sbom in args.external_sbom:
+            external_sbom = ExternalSbom(sbom, external_cache)
+            prepared.graph.merge(external_sbom.get_graph(spdx_id))
+            prepared.validated.update(external_sbom.get_validated_elements())
+    return prepared
+
+
+def check_input(args: Namespace) -> None:
+    if path.basename(args.input) is not args.input:
+        logging.error(
+            "-i, --input argument must be in the current directory"
         )
-    write_file(document, out_file)
-    logging.info("created " + path.basename(out_file))
+        exit()
+    yaml_config = args.config or "config.yaml"
+    if not path.exists(yaml_config):
+        logging.error(
+            "config file '%s' does not exist", yaml_config
+        )
+        exit()
 
-def main():
-    args = get_option()
-    log_level = logging.DEBUG if args.debug else logging.INFO
-    logging.basicConfig(level=log_level)
+
+# Options that can be set for each job of a --manifest
+MANIFEST_PATHS = ["input", "config", "package", "output", "incremental", "delta_report"]
+MANIFEST_PATH_LISTS = ["file", "external_sbom"]
+
+
+def is_manifest_path(value: Any) -> bool:
+    # yaml reads file names such as 2024 as numbers
+    return isinstance(value, (str, int, float)) and not isinstance(value, bool)
+
+
+def check_manifest_entry(entry: Any) -> Optional[str]:
+    # Returns what is wrong with the entry
+    if not isinstance(entry, dict):
+        return "not a mapping of options"
+    unknown = set(entry) - set(MANIFEST_PATHS) - set(MANIFEST_PATH_LISTS)
+    if unknown:
+        return f"unknown keys {', '.join(sorted(map(str, unknown)))}"
+    for key in MANIFEST_PATHS:
+        if entry.get(key) is not None and not is_manifest_path(entry[key]):
+            return f"{key} must be a path"
+    for key in MANIFEST_PATH_LISTS:
+        if entry.get(key) is not None and \
+                (not isinstance(entry[key], list) or not all(map(is_manifest_path, entry[key]))):
+            return f"{key} must be a list of paths"
+    if not entry.get("input") and not entry.get("file"):
+        return "input or file is required"
+    return None
+
+
+def read_manifest(manifest: str, deduplicate: bool, reproducible: bool, scanner: str,
+                  catalog: bool) -> List[Namespace]:
+    # The manifest is a list of jobs, paths are relative to the manifest:
+    # - input: baseos-x2-3.19.1-at.2.tar.zst
+    #   config: baseos_sbom.yaml
+    #   package: baseos-x2-3.19.1-at.2.package_list.txt
+    #   file: [baseos-x2-3.19.1-at.2.tar.zst]
+    #   external_sbom: [imx-boot.spdx.json]
+    #   output: baseos-x2-3.19.1-at.2.tar.zst.spdx.json
+    manifest_dir = path.dirname(path.abspath(manifest))
+    with open(manifest) as f:
+        entries = safe_load(f) or []
+    if not isinstance(entries, list):
+        logging.error("manifest %s must be a list of sboms to create", path.basename(manifest))
+        exit(1)
+
+    jobs = []
+    for number, entry in enumerate(entries, 1):
+        error = check_manifest_entry(entry)
+        if error:
+            logging.error("manifest %s entry %d: %s", path.basename(manifest), number, error)
+            exit(1)
+        job = Namespace(**{key: None for key in MANIFEST_PATHS}, **{key: [] for key in MANIFEST_PATH_LISTS},
+                        deduplicate=deduplicate, reproducible=reproducible, scanner=scanner,
+                        catalog=catalog)
+        for key in MANIFEST_PATHS:
+            if entry.get(key):
+                setattr(job, key, path.join(manifest_dir, str(entry[key])))
+        for key in MANIFEST_PATH_LISTS:
+            setattr(job, key, [path.join(manifest_dir, str(value)) for value in entry.get(key) or []])
+        jobs.append(job)
+    return jobs
+
+
+def make_sbom(args: Namespace, syft_cache: Optional[SbomCache], license_resolver: LicenseResolver,
+              profiler: Profiler, jobs: int, outputs_cache: Optional[SbomCache] = None,
+              external_cache: Optional[SbomCache] = None, prepared: Optional[PreparedSbom] = None) -> List[str]:
+    # Returns the sboms written, or found up to date.
+    # With prepared, only the parts which need the input and scanned files are done.
     document = None
+    inputs_digest = None
+    outputs = []
     if args.input:
-        filename = path.basename(args.input)
-        if filename is not args.input:
-            logging.error(
-                "-i, --input argument must be in the current directory"
-            )
-            exit()
+        check_input(args)
+        filename = args.input
         spdx_id = get_spdx_id(filename)
-        yaml_config = args.config or "config.yaml"
-        if not path.exists(yaml_config):
-            logging.error(
-                "config file '%s' does not exist", yaml_config
-            )
-            exit()
-        yaml_sbom = YamlSbom(filename, yaml_config)
-        document = yaml_sbom.document
-        # This library uses run-time type checks when assigning properties.
-        # Because in-place alterations like .append() circumvent these checks, we don't use them here.
-        document.packages = [*yaml_sbom.packages]
-    logging.info("Building SBOM...")
-    if document:
-        if args.package:
-            logging.info("package information is created from package list")
-            logging.warning("not created purl in package information")
-            packages_sbom = PackagesSbom(args.package)
-            document.packages += [*packages_sbom.packages]
-            document.relationships += [*packages_sbom.get_relationships(spdx_id)]
-        for sbom in args.external_sbom:
-            external_sbom = ExternalSbom(sbom)
-            document.packages += [*external_sbom.packages]
-            document.relationships += [*external_sbom.get_relationships(spdx_id)]
-            document.files += [*external_sbom.files]
-            document.extracted_licensing_info += [*external_sbom.extracted_licensing_info]
-    for file in args.file:
-        file_sbom = FileSbom(file)
+        if args.reproducible and outputs_cache:
+            inputs_digest = get_inputs_digest(args, args.config or "config.yaml")
+            out_file = get_output_path(args.output, filename)
+            delta_report = args.delta_report if args.incremental else None
+            if output_up_to_date(outputs_cache, inputs_digest, out_file, delta_report):
+                logging.info("%s is up to date", path.basename(out_file))
+                return [path.abspath(out_file)]
+        if prepared is None:
+            prepared = prepare_sbom(args, license_resolver, profiler, external_cache, jobs)
+        document = prepared.document
+        graph = prepared.graph
+        previous = prepared.previous
+        validated = prepared.validated
+        main_package = graph.get_package(spdx_id)
+        if main_package:
+            with profiler.stage("checksums"):
+                set_file_checksums(main_package, filename)
+    else:
+        logging.info("Building SBOM...")
+    with profiler.stage("scan"):
+        file_sboms = scan_files(args.file, syft_cache, jobs, args.scanner, license_resolver)
+    for file, file_sbom in zip(args.file, file_sboms):
+        profiler.detail("scans", {"file": path.basename(file), **file_sbom.timings})
+        catalog_graph = None
+        if args.catalog:
+            with profiler.stage("catalog"):
+                catalog_graph = catalog_files(file, file_sbom, jobs)
         if document:
-            document.packages += [*file_sbom.packages]
-            document.relationships += [*file_sbom.get_relationships(spdx_id)]
-            document.files += [*file_sbom.files]
-            document.extracted_licensing_info += [*file_sbom.extracted_licensing_info]
+            graph.merge(file_sbom.get_graph(spdx_id))
+            if catalog_graph:
+                graph.merge(catalog_graph)
         else:
-            file_doc = file_sbom.document
-            output_sbom(file_doc, None, file)
+            with profiler.stage("write"):
+                file_doc = file_sbom.document
+                if catalog_graph:
+                    file_doc.files = file_doc.files + catalog_graph.files
+                    file_doc.relationships = file_doc.relationships + catalog_graph.relationships
+                outputs.append(output_sbom(file_doc, None, file))
     if document:
-        output_sbom(document, args.output, filename)
+        if args.deduplicate:
+            with profiler.stage("deduplicate"):
+                # merged packages and their relationships are validated again, their content changed
+                duplicates = graph.deduplicate_packages()
+            if duplicates:
+                logging.info("merged %d duplicate packages", len(duplicates))
+            profiler.count(duplicates=len(duplicates))
+        if previous and args.delta_report:
+            previous.write_delta(graph, args.delta_report)
+        with profiler.stage("write"):
+            graph.update_document(document)
+            outputs.append(output_sbom(document, args.output, filename, validated))
+        if inputs_digest and outputs_cache:
+            outputs_cache.put(outputs_cache.key(inputs_digest), get_file_sha256(outputs[-1]).encode())
+            if previous and args.delta_report:
+                with open(args.delta_report, "rb") as f:
+                    outputs_cache.put(outputs_cache.key(inputs_digest, "delta report"), f.read())
+        profiler.count(
+            packages=len(document.packages),
+            files=len(document.files),
+            relationships=len(document.relationships),
+        )
+    return [path.abspath(output) for output in outputs]
+
+
+def make_manifest_sboms(args: Namespace, syft_cache: Optional[SbomCache],
+                        license_resolver: LicenseResolver, profiler: Profiler,
+                        outputs_cache: Optional[SbomCache] = None,
+                        external_cache: Optional[SbomCache] = None) -> List[str]:
+    cwd = os.getcwd()
+    outputs = []
+    config = args.config
+    for job in read_manifest(args.manifest, args.deduplicate, args.reproducible, args.scanner,
+                             args.catalog):
+        # --config applies to the jobs which do not set their own
+        job.config = job.config or (config and path.abspath(config))
+        profiler.job = path.basename(job.input or job.file[0])
+        # make_sbom() only works with input in current directory
+        if job.input:
+            os.chdir(path.dirname(job.input))
+            job.input = path.basename(job.input)
+        try:
+            outputs += make_sbom(job, syft_cache, license_resolver, profiler, args.jobs, outputs_cache,
+                                 external_cache)
+        finally:
+            os.chdir(cwd)
+    return outputs
+
+
+def main():
+    args = get_option()
+    log_level = logging.DEBUG if args.debug else logging.INFO
+    logging.basicConfig(level=log_level)
+    profiler = Profiler(bool(args.profile), args.profile_cprofile)
+    syft_cache = None
+    license_cache = None
+    outputs_cache = None
+    external_cache = None
+    if args.cache_dir:
+        syft_cache = SbomCache(args.cache_dir, "syft", args.cache_max_size * 1024 * 1024)
+        license_cache = SbomCache(args.cache_dir, "licenses", args.cache_max_size * 1024 * 1024)
+        outputs_cache = SbomCache(args.cache_dir, "outputs", args.cache_max_size * 1024 * 1024)
+        external_cache = SbomCache(args.cache_dir, "externals", args.cache_max_size * 1024 * 1024)
+    # Shared by all sboms created by this process
+    license_resolver = LicenseResolver(license_cache)
+
+    if args.prepare:
+        if not args.input or args.manifest:
+            logging.error("--prepare requires --input, without --manifest")
+            exit()
+        check_input(args)
+        prepare_sbom(args, license_resolver, profiler, external_cache, args.jobs).save(args.prepare)
+        logging.info("prepared sbom of %s", args.input)
+        outputs = []
+    elif args.finalize:
+        prepared = PreparedSbom.load(args.finalize)
+        os.chdir(prepared.cwd)
+        outputs = make_sbom(prepared.args, syft_cache, license_resolver, profiler, args.jobs, outputs_cache,
+                            external_cache, prepared)
+    elif args.manifest:
+        outputs = make_manifest_sboms(args, syft_cache, license_resolver, profiler, outputs_cache, external_cache)
+    else:
+        outputs = make_sbom(args, syft_cache, license_resolver, profiler, args.jobs, outputs_cache, external_cache)
+
+    if args.index:
+        from sbom_index import SbomIndex
+
+        with profiler.stage("index"):
+            index = SbomIndex(args.index)
+            try:
+                for output in outputs:
+                    index.ingest(output)
+            finally:
+                index.close()
+        logging.info("indexed %d sboms in %s", len(outputs), path.basename(args.index))
+
+    if syft_cache:
+        profiler.cache("syft", syft_cache.hits, syft_cache.misses)
+    if external_cache:
+        profiler.cache("externals", external_cache.hits, external_cache.misses)
+    profiler.cache("licenses", license_resolver.hits, license_resolver.misses)
+    if args.profile:
+        profiler.write(args.profile)
+
 
 if __name__ == "__main__":
     main()
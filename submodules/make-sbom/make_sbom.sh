@@ -23,13 +23,57 @@ USAGE:
     -e|--external_sbom <spdx.json>  -- external .sbom.json file(s) to add to
                                         the sbom you are creating
     -o|--output <sbom file name>    -- file name of the sbom to be created
+                                        compressed if it ends with .gz or .zst
     -p|--package <package_list>     -- *package_list.txt created by build_rootfs
                                         e.g. baseos-x2-3.18.4-at.5.package_list.txt
+                                        or a debian rootfs directory or
+                                        tarball, read without dpkg-licenses
     -f|--file <scan file>           -- created sbom from file(s).
+                                        docker/OCI image archives are scanned
+                                        layer by layer with --cache-dir
+    --scanner <syft|apk>            -- how files are scanned. apk reads the
+                                        packages of alpine rootfs tarballs
+                                        without syft. default value is syft
+    --catalog                       -- also list every regular file of the
+                                        scanned files with its checksums
+    --deduplicate                   -- merge the packages found by several
+                                        sources that are the same package
+    -m|--manifest <yaml>            -- create all the sboms listed in this file
+                                        in a single process (see make_sbom.py)
+    --incremental <spdx.json>       -- previous sbom of the same input, unchanged
+                                        packages are reused from it
+    --delta-report <json>           -- with --incremental, write the differences
+                                        from the previous sbom to this file
+    --reproducible                  -- same inputs and SOURCE_DATE_EPOCH always
+                                        give the same sbom, which is not
+                                        created again if it is up to date
+    --prepare <state>               -- only create the parts of the sbom that
+                                        do not need the input and scanned files,
+                                        which may not exist yet, in this file
+    --finalize <state>              -- create the sbom prepared in this file,
+                                        once the input and scanned files exist.
+                                        the options given to --prepare are used
+    --index <sqlite>                -- add the created sboms to this index
+    --profile <json>                -- write time and memory used by each stage
+                                        to this file
+    -j|--jobs <n>                   -- number of file scans to run concurrently
+                                        default value is the number of CPUs
+    --cache-dir <dir>               -- directory in which scan results are cached
+                                        between runs, up to 1GiB for each kind
+                                        of result. default is no cache
     -h|--help                       -- this output
 
   OUTPUT:
     created sbom.json (<input>.sbom.json)
+
+  $(basename "$0") index [-d <sqlite>] <ingest|package|license|file> ...
+
+    ingest or query an index of sboms, see sbom_index.py --help
+
+  ENVIRONMENT:
+    MAKE_SBOM_WHEELS=<dir>          -- python deps are installed from the wheels
+                                        of this directory, without network.
+                                        missing wheels are downloaded there first
 "
 }
 
@@ -45,11 +89,23 @@ required_input() {
 
 SCRIPTDIR="$(realpath "$(dirname "$0")")"
 
+if [ "$1" = "index" ]; then
+    # the index only needs the python standard library
+    shift
+    exec python3 "$SCRIPTDIR/sbom_index.py" "$@"
+fi
+
 switch=""
 input_seen=""
 config_seen=""
 output_seen=""
+manifest_seen=""
+input_path=""
+prepare_seen=""
+finalize_seen=""
 container_scan=""
+scanner=syft
+cache_dir=""
 
 for arg in "$@"; do
     # always consume exactly one argument to keep in sync
@@ -77,6 +133,45 @@ for arg in "$@"; do
         "-f" | "--file")
             switch=file
             ;;
+        "-m" | "--manifest")
+            switch=manifest
+            ;;
+        "--scanner")
+            switch=scanner
+            ;;
+        "--catalog")
+            set -- "$@" --catalog
+            ;;
+        "--deduplicate")
+            set -- "$@" --deduplicate
+            ;;
+        "--incremental")
+            switch=incremental
+            ;;
+        "--delta-report")
+            switch=delta_report
+            ;;
+        "--reproducible")
+            set -- "$@" --reproducible
+            ;;
+        "--prepare")
+            switch=prepare
+            ;;
+        "--finalize")
+            switch=finalize
+            ;;
+        "--index")
+            switch=index
+            ;;
+        "--profile")
+            switch=profile
+            ;;
+        "-j" | "--jobs")
+            switch=jobs
+            ;;
+        "--cache-dir")
+            switch=cache_dir
+            ;;
         "-h" | "--help")
             usage
             exit 0
@@ -92,7 +187,7 @@ for arg in "$@"; do
     case "$switch" in
     input)
         input_seen="$arg"
-        [ -e "$arg" ] || error "input $arg does not exist"
+        input_path="$arg"
         input_dir=$(dirname "$arg")
         input_base="$(basename "$arg")"
         set -- "$@" --input "$input_base"
@@ -118,13 +213,60 @@ for arg in "$@"; do
         input_seen=1
         set -- "$@" --file "$(realpath "$arg")"
         ;;
+    manifest)
+        manifest_seen=1
+        input_seen=1
+        [ -e "$arg" ] || error "manifest $arg does not exist"
+        # syft is required if any sbom scans files
+        grep -q "file:" "$arg" && container_scan=1
+        set -- "$@" --manifest "$(realpath "$arg")"
+        ;;
+    scanner)
+        scanner="$arg"
+        set -- "$@" --scanner "$arg"
+        ;;
+    incremental)
+        [ -e "$arg" ] || error "previous sbom $arg does not exist"
+        set -- "$@" --incremental "$(realpath "$arg")"
+        ;;
+    delta_report)
+        set -- "$@" --delta-report "$(realpath "$arg")"
+        ;;
+    prepare)
+        prepare_seen=1
+        set -- "$@" --prepare "$(realpath "$arg")"
+        ;;
+    finalize)
+        finalize_seen=1
+        [ -e "$arg" ] || error "prepared sbom $arg does not exist"
+        set -- "$@" --finalize "$(realpath "$arg")"
+        ;;
+    index)
+        set -- "$@" --index "$(realpath "$arg")"
+        ;;
+    profile)
+        set -- "$@" --profile "$(realpath "$arg")"
+        ;;
+    jobs)
+        set -- "$@" --jobs "$arg"
+        ;;
+    cache_dir)
+        cache_dir="$arg"
+        ;;
     esac
     switch=""
 done
 
 [ -z "$switch" ] || error "Processing --$switch but no arg given?"
+if [ -n "$finalize_seen" ]; then
+    # everything else was given to --prepare
+    input_seen=1 output_seen=1 config_seen=1
+fi
 [ -n "$input_seen" ] || required_input
-if [ -z "$output_seen" ]; then
+# the input is only created after --prepare
+[ -n "$prepare_seen" ] || [ -z "$input_path" ] || [ -e "$input_path" ] \
+    || error "input $input_path does not exist"
+if [ -z "$output_seen" ] && [ -z "$manifest_seen" ]; then
     # If output is not specified, SBOM is output to the current directory
     set -- "$@" --output "$PWD/$input_base.spdx.json"
 fi
@@ -132,25 +274,62 @@ if [ -z "$config_seen" ]; then
     # use config.yaml in script dir, which should always exist...
     set -- "$@" --config "$SCRIPTDIR/config.yaml"
 fi
+if [ -n "$cache_dir" ]; then
+    mkdir -p "$cache_dir" || error "Could not create cache dir $cache_dir"
+    set -- "$@" --cache-dir "$(realpath "$cache_dir")"
+fi
 
 deps="$SCRIPTDIR/deps"
 env_file="$deps/env"
 if [ -e "$env_file" ]; then
     . "$env_file"
 fi
-# shellcheck disable=SC3013 # dash, busybox ash and mksh all support -nt
-if ! [ -e "$deps/.stamp" ] ||
-    [ "$SCRIPTDIR/requirements.txt" -nt "$deps/.stamp" ] ||
-    ! PYTHONPATH="$deps" python3 -m spdx_tools.spdx.clitools.pyspdxtools --help >/dev/null 2>&1; then
+
+deps_digest() {
+    # changes with the requirements, the python version (compiled
+    # modules) or the packages installed in deps, without importing them
+    {
+        cat "$SCRIPTDIR/requirements.txt"
+        python3 -V 2>&1
+        ls "$deps" 2>/dev/null | grep '\.dist-info$'
+    } | sha256sum | cut -d' ' -f1
+}
+
+install_deps() {
+    if [ -n "$MAKE_SBOM_WHEELS" ]; then
+        # try offline first, then add the missing wheels to the cache
+        python3 -m pip install --no-index --find-links "$MAKE_SBOM_WHEELS" \
+            --target "$deps" -r "$SCRIPTDIR/requirements.txt" >/dev/null 2>&1 && return
+        rm -rf "$deps"
+        python3 -m pip wheel --wheel-dir "$MAKE_SBOM_WHEELS" -r "$SCRIPTDIR/requirements.txt" || return
+        python3 -m pip install --no-index --find-links "$MAKE_SBOM_WHEELS" \
+            --target "$deps" -r "$SCRIPTDIR/requirements.txt"
+        return
+    fi
+    python3 -m pip install --target "$deps" -r "$SCRIPTDIR/requirements.txt"
+}
+
+deps_importable() {
+    # the stamp does not see a broken install, e.g. a removed package
+    # directory: the modules make_sbom.py needs are looked up without
+    # importing them, which costs no more than starting python
+    PYTHONPATH="$deps" python3 -c '
+import sys
+from importlib.util import find_spec
+sys.exit(not all(find_spec(name) for name in ("spdx_tools", "license_expression", "box")))' 2>/dev/null
+}
+
+if ! [ -e "$deps/.stamp" ] || [ "$(cat "$deps/.stamp")" != "$(deps_digest)" ] \
+        || ! deps_importable; then
     # install if missing, or update if requirements changed,
-    # or could not use it
+    # or installed packages changed or cannot be imported
     rm -rf "$deps"
-    python3 -m pip install --target "$deps" -r "$SCRIPTDIR/requirements.txt" ||
-        error "Could not install python deps - missing python or pip?"
-    touch "$deps/.stamp"
+    install_deps || error "Could not install python deps - missing python or pip?"
+    deps_digest > "$deps/.stamp"
 fi
 
-if [ -n "$container_scan" ]; then
+# the apk scanner does not need syft
+if [ -n "$container_scan" ] && [ "$scanner" = syft ]; then
 	which_syft=$(which syft)
     if [ -z "${which_syft}" ]; then
 	    echo syft is not found and install start
@@ -174,6 +353,7 @@ fi
 if [ -n "$input_dir" ]; then
     cd "$input_dir" || exit
 fi
-PYTHONPATH="$deps" \
-    python3 "$SCRIPTDIR/make_sbom.py" \
+# exec so that killing a --prepare running in background stops python
+export PYTHONPATH="$deps"
+exec python3 "$SCRIPTDIR/make_sbom.py" \
     "$@"
@@ -6,25 +6,38 @@
 
 import logging
 import csv
+import io
+import os
 import re
 
-from license_expression import get_spdx_licensing, ExpressionError, LicenseExpression
+from license_expression import LicenseExpression
 from spdx_tools.spdx.model import (
     Package,
     SpdxNoAssertion,
     Relationship,
     RelationshipType,
 )
-from typing import List, Union
+from typing import Dict, List, Optional, Tuple, Union
 
-from rename_license import debian_license
-from utility import get_spdx_id
+from debian_licenses import DebianLicenses, is_debian_rootfs
+from incremental_sbom import PreviousSbom
+from license_resolver import LicenseResolver
+from rename_license import LicenseNormalizer
+from sbom_graph import SbomGraph
+from utility import construct_elements, get_spdx_id, open_compressed, with_occurrences
 
 
 class PackageInfo:
-    def __init__(self, name: str, version: str, license: Union[str, List[str]]) -> None:
+    # One per package of the list, kept small
+    __slots__ = ("license_resolver", "name", "version", "license", "license_concluded",
+                 "license_info_from_files", "license_comment")
+
+    def __init__(self, name: str, version: str, license: Union[str, List[str]],
+                 license_resolver: Optional[LicenseResolver] = None) -> None:
+        self.license_resolver = license_resolver or LicenseResolver()
         self.name = name
         self.version = version
+        self.license = license
         self.license_concluded = None
         self.license_info_from_files = None
         self.license_comment = None
@@ -46,11 +59,8 @@ class PackageInfo:
                     f"It was not possible to estimate all of the following licenses. '{' '.join(license)}'"
 
     def get_spdx_license(self, name: str, license: str, validate=True) -> str:
-        # Receive ExpressionError if license cannot be obtained
-        try:
-            spdx_license = get_spdx_licensing().parse(license, validate=validate)
-        except ExpressionError:
-            spdx_license = SpdxNoAssertion()
+        spdx_license = self.license_resolver.resolve(license, validate=validate)
+        if spdx_license == SpdxNoAssertion():
             logging.debug(f"Failed to parse {name} license: {license}")
         return spdx_license
 
@@ -60,8 +70,16 @@ class PackageInfo:
 
 
 class PackagesSbom:
-    def __init__(self, filepath: str) -> None:
+    def __init__(self, filepath: str, license_resolver: Optional[LicenseResolver] = None,
+                 previous: Optional[PreviousSbom] = None, reproducible: bool = False, jobs: int = 1) -> None:
+        self.license_resolver = license_resolver or LicenseResolver()
+        self.previous = previous
+        self.reproducible = reproducible
+        self.jobs = jobs
+        self.license_normalizer = LicenseNormalizer(self.license_resolver)
+        self.unmapped_licenses: Dict[str, List[str]] = {}
         self.packages = self.get_packages_sbom(filepath)
+        self.license_resolver.save()
 
     def get_relationships(self, spdx_id: str) -> List[Relationship]:
         return [
@@ -73,22 +91,24 @@ class PackagesSbom:
             for package in self.packages
         ]
 
+    def get_graph(self, spdx_id: str) -> SbomGraph:
+        return SbomGraph(packages=self.packages, relationships=self.get_relationships(spdx_id))
+
     def alpine_packages_parse(self, file_lines: List[str]) -> List[PackageInfo]:
         # Stored in a space-separated two-dimensional array
         # Data is stored as follows
         # ['abos-base-2.0-r1', 'aarch64', '{abos-base}', '(MIT)', '[installed]\n']
         extract_re = re.compile(r"([^ ]*)-(\d.*?-r\d+) [^(]*\(([^)]*)\)")
 
-        packages_info = []
+        packages = []
         for line in file_lines:
             package = extract_re.match(line)
             if package is None:
                 logging.warning("Could not parse line: %s", line)
                 continue
-            name, version, license = package.groups()
-            packages_info.append(PackageInfo(name, version, license))
+            packages.append(package.groups())
 
-        return packages_info
+        return self.get_packages_info("alpine", packages)
 
     def debian_packages_parse(self, file_lines: List[str]) -> List[PackageInfo]:
         # Data is stored as csv with such fields:
@@ -97,30 +117,50 @@ class PackagesSbom:
 
         reader = csv.DictReader(file_lines)
 
-        packages_info = []
+        packages = []
         for package in reader:
             # dpkg-license output may contain architecture, remove it
             name = package['Name'].replace(":armhf", "").replace(":arm64", "")
-            version = package['Version']
-            license = package['Licenses']
-
-            # If there are multiple licenses, change to list type and
-            # rename debian license name to SPDX license
-            if " " in license:
-                # Linux-syscall-note Split by whitespace character
-                # except with because the license requires with
-                extract_re = re.compile(r"(?<!\bwith)\s+(?!\bwith)")
-                license = [debian_license(license) for license in extract_re.split(license)]
-            else:
-                license = debian_license(license)
-
-            packages_info.append(PackageInfo(name, version, license))
-
-        return packages_info
-
-    def packages_parse(self, filepath: str) -> List[PackageInfo]:
-        with open(filepath) as file:
-            content = file.readlines()
+            packages.append((name, package['Version'], package['Licenses']))
+
+        return self.get_packages_info("debian", packages)
+
+    def get_packages_info(self, distribution: str, packages: List[Tuple[str, str, str]])\
+            -> List[Union[PackageInfo, Package]]:
+        # In incremental mode, packages unchanged since the previous sbom are reused as is
+        reused = {}
+        if self.previous is not None:
+            for index, (name, version, _) in enumerate(packages):
+                package = self.previous.get_package(name, version)
+                if package is not None:
+                    reused[index] = package
+            logging.info("reusing %d of %d packages from previous sbom", len(reused), len(packages))
+        changed = [package for index, package in enumerate(packages) if index not in reused]
+
+        # Rename the license names of the whole list to SPDX licenses at once
+        licenses, unmapped = self.license_normalizer.normalize(
+            distribution, [license for _, _, license in changed]
+        )
+        self.unmapped_licenses = {
+            license: [changed[index][0] for index in indexes]
+            for license, indexes in unmapped.items()
+        }
+        if self.unmapped_licenses:
+            logging.info("licenses not mapped to SPDX (see license_map.yaml): %s",
+                         ", ".join(sorted(self.unmapped_licenses)))
+
+        packages_info = iter([
+            PackageInfo(name, version, license, self.license_resolver)
+            for (name, version, _), license in zip(changed, licenses)
+        ])
+        return [reused[index] if index in reused else next(packages_info) for index in range(len(packages))]
+
+    def packages_parse(self, filepath: str) -> List[Union[PackageInfo, Package]]:
+        # debian rootfs directory or tarball, read without dpkg-licenses
+        if is_debian_rootfs(filepath):
+            return self.get_packages_info("debian", DebianLicenses(filepath, self.jobs).packages)
+        with open_compressed(filepath) as file, io.TextIOWrapper(file) as text:
+            content = text.readlines()
             # debian packages (dpkg-licenses -c) start with a csv header
             if content[0].startswith('"St",'):
                 return self.debian_packages_parse(content)
@@ -129,21 +169,35 @@ class PackagesSbom:
 
     def get_packages_sbom(self, filepath: str) -> List[Package]:
         packages_info = self.packages_parse(filepath)
-        packages = []
-
-        for package_info in packages_info:
-            packages += [
-                Package(
-                    spdx_id=get_spdx_id(package_info.name, uuid=True),
-                    name=package_info.name,
-                    download_location=SpdxNoAssertion(),
-                    version=package_info.version,
-                    license_concluded=package_info.license_concluded,
-                    license_info_from_files=package_info.license_info_from_files,
-                    license_declared=SpdxNoAssertion(),
-                    license_comment=package_info.license_comment,
-                    copyright_text=SpdxNoAssertion(),
-                    files_analyzed=False if package_info.license_info_from_files is None else True,
-                )
-            ]
-        return packages
+        # Packages reused from the previous sbom are kept as is
+        new_info = [package_info for package_info in packages_info if isinstance(package_info, PackageInfo)]
+        source = os.path.basename(filepath)
+        # In reproducible mode the id only depends on what the package list says about the package:
+        # adding or removing other packages does not change it. Identical entries are told apart
+        # by their occurrence.
+        contents = [
+            [source, package_info.name, package_info.version, str(package_info.license)] for package_info in new_info
+        ]
+        new_packages = iter(construct_elements(
+            Package,
+            {
+                "spdx_id": [
+                    get_spdx_id(package_info.name, uuid=True, content=content if self.reproducible else None)
+                    for package_info, content in zip(new_info, with_occurrences(contents))
+                ],
+                "name": [package_info.name for package_info in new_info],
+                "version": [package_info.version for package_info in new_info],
+                "license_concluded": [package_info.license_concluded for package_info in new_info],
+                # what Package() sets for None
+                "license_info_from_files": [package_info.license_info_from_files or [] for package_info in new_info],
+                "license_comment": [package_info.license_comment for package_info in new_info],
+                "files_analyzed": [package_info.license_info_from_files is not None for package_info in new_info],
+            },
+            download_location=SpdxNoAssertion(),
+            license_declared=SpdxNoAssertion(),
+            copyright_text=SpdxNoAssertion(),
+        ))
+        return [
+            next(new_packages) if isinstance(package_info, PackageInfo) else package_info
+            for package_info in packages_info
+        ]
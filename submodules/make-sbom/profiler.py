@@ -0,0 +1,107 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+import cProfile
+import json
+import logging
+import resource
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+
+def children_cpu_time() -> float:
+    # CPU time of finished child processes such as syft
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Profiler:
+    def __init__(self, enabled: bool = False, cprofile_output: Optional[str] = None) -> None:
+        self.enabled = enabled
+        self.cprofile_output = cprofile_output
+        self.stages: List[Dict[str, Any]] = []
+        self.counts: Dict[str, Any] = {}
+        self.caches: Dict[str, Dict[str, Any]] = {}
+        self.details: Dict[str, List[Dict[str, Any]]] = {}
+        self.slowest_profile: Optional[cProfile.Profile] = None
+        self.slowest_stage = ""
+        self.slowest_wall = -1.0
+        # Set to the sbom being created in --manifest mode
+        self.job: Optional[str] = None
+        if self.enabled:
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        profile = cProfile.Profile() if self.cprofile_output else None
+        tracemalloc.reset_peak()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        children_cpu = children_cpu_time()
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+            wall = time.perf_counter() - wall
+            _, peak = tracemalloc.get_traced_memory()
+            self.stages.append({
+                **({"job": self.job} if self.job else {}),
+                "name": name,
+                "wall_time": round(wall, 6),
+                "cpu_time": round(time.process_time() - cpu, 6),
+                "children_cpu_time": round(children_cpu_time() - children_cpu, 6),
+                "peak_memory": peak,
+            })
+            # Only the profile of the slowest stage is kept
+            if profile and wall > self.slowest_wall:
+                self.slowest_wall = wall
+                self.slowest_profile = profile
+                self.slowest_stage = name
+
+    def count(self, **counts: int) -> None:
+        if self.job:
+            self.counts.setdefault(self.job, {}).update(counts)
+        else:
+            self.counts.update(counts)
+
+    def cache(self, name: str, hits: int, misses: int) -> None:
+        lookups = hits + misses
+        self.caches[name] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+        }
+
+    def detail(self, name: str, values: Dict[str, Any]) -> None:
+        self.details.setdefault(name, []).append({
+            **({"job": self.job} if self.job else {}),
+            **{key: round(value, 6) if isinstance(value, float) else value
+               for key, value in values.items()},
+        })
+
+    def write(self, output: str) -> None:
+        if not self.enabled:
+            return
+        tracemalloc.stop()
+        report: Dict[str, Any] = {
+            "stages": self.stages,
+            "counts": self.counts,
+            "caches": self.caches,
+            **self.details,
+        }
+        if self.slowest_profile is not None:
+            self.slowest_profile.dump_stats(self.cprofile_output)
+            report["cprofile"] = {"stage": self.slowest_stage, "output": self.cprofile_output}
+            logging.info("created " + self.cprofile_output)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=4)
+        logging.info("created " + output)
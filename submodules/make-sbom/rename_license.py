@@ -1,68 +1,78 @@
-def debian_license(license: str) -> str:
-    if license == "Apache-1":
-        license = "Apache-1.0"
-    elif license == "Apache-2":
-        license = "Apache-2.0"
-    elif license == "BSD1":
-        license = "BSD-1-Clause"
-    elif license == "BSD2":
-        license = "BSD-2-Clause"
-    elif license == "BSD3":
-        license = "BSD-3-Clause"
-    elif license == "GFDL-1.1-invariants":
-        license = "GFDL-1.1-no-invariants-only"
-    elif license == "GFDL-1.1+-invariant":
-        license = "GFDL-1.1-no-invariants-or-later"
-    elif license == "GFDL-1.1-no-invariant":
-        license = "GFDL-1.1-no-invariants-only"
-    elif license == "GFDL-1.1+-no-invariant":
-        license = "GFDL-1.1-no-invariants-or-later"
-    elif license == "GFDL-1.1":
-        license = "GFDL-1.1-only"
-    elif license == "GFDL-1.1+":
-        license = "GFDL-1.1-or-later"
-    elif license == "GFDL-1.2-invariants":
-        license = "GFDL-1.2-no-invariants-only"
-    elif license == "GFDL-1.2+-invariant":
-        license = "GFDL-1.2-no-invariants-or-later"
-    elif license == "GFDL-1.2-no-invariant":
-        license = "GFDL-1.2-no-invariants-only"
-    elif license == "GFDL-1.2+-no-invariant":
-        license = "GFDL-1.2-no-invariants-or-later"
-    elif license == "GFDL-1.2":
-        license = "GFDL-1.2-only"
-    elif license == "GFDL-1.2+":
-        license = "GFDL-1.2-or-later"
-    elif license == "GFDL-1.3-invariants":
-        license = "GFDL-1.3-no-invariants-only"
-    elif license == "GFDL-1.3+-invariant":
-        license = "GFDL-1.3-no-invariants-or-later"
-    elif license == "GFDL-1.3-no-invariant":
-        license = "GFDL-1.3-no-invariants-only"
-    elif license == "GFDL-1.3+-no-invariant":
-        license = "GFDL-1.3-no-invariants-or-later"
-    elif license == "GFDL-1.3":
-        license = "GFDL-1.3-only"
-    elif license == "GFDL-1.3+":
-        license = "GFDL-1.3-or-later"
-    elif license == "GPL-2":
-        license = "GPL-2.0-only"
-    elif license == "GPL-2+":
-        license = "GPL-2.0-or-later"
-    elif license == "GPL-3":
-        license = "GPL-3.0-only"
-    elif license == "GPL-3+":
-        license = "GPL-3.0-or-later"
-    elif license == "LGPL-2":
-        license = "LGPL-2.0-only"
-    elif license == "LGPL-2+":
-        license = "LGPL-2.0-or-later"
-    elif license == "LGPL-2.1":
-        license = "LGPL-2.1-only"
-    elif license == "LGPL-2.1+":
-        license = "LGPL-2.1-or-later"
-    elif license == "LGPL-3":
-        license = "LGPL-3.0-only"
-    elif license == "LGPL-3+":
-        license = "LGPL-3.0-or-later"
-    return license
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# pyright: reportPrivateImportUsage=false
+
+import os
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple, Union
+
+from spdx_tools.spdx.model import SpdxNoAssertion
+from yaml import safe_load
+
+from license_resolver import LicenseResolver
+
+LICENSE_MAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "license_map.yaml")
+
+# Linux-syscall-note Split by whitespace character
+# except with because the license requires with
+DEBIAN_SPLIT_RE = re.compile(r"(?<!\bwith)\s+(?!\bwith)")
+# License names in an apk license expression
+ALPINE_NAME_RE = re.compile(r"[^\s()]+")
+OPERATORS = {"and", "or", "with"}
+
+
+class LicenseNormalizer:
+    def __init__(self, license_resolver: Optional[LicenseResolver] = None,
+                 license_map: str = LICENSE_MAP) -> None:
+        self.license_resolver = license_resolver or LicenseResolver()
+        with open(license_map) as f:
+            tables = safe_load(f) or {}
+        self.tables: Dict[str, Dict[str, str]] = {
+            "debian": tables.get("debian") or {},
+            "alpine": tables.get("alpine") or {},
+        }
+
+    def normalize(self, distribution: str, licenses: List[str])\
+            -> Tuple[List[Union[str, List[str]]], Dict[str, List[int]]]:
+        # Convert the licenses of a whole package list at once.
+        # Each distinct license string is only converted once, and the names that
+        # could not be mapped to SPDX are indexed with the positions using them.
+        normalize_license = {
+            "debian": self.debian_normalize,
+            "alpine": self.alpine_normalize,
+        }[distribution]
+        converted = {}
+        normalized = []
+        unmapped: Dict[str, List[int]] = defaultdict(list)
+        for index, license in enumerate(licenses):
+            if license not in converted:
+                converted[license] = normalize_license(license)
+            spdx_license, unmapped_names = converted[license]
+            normalized.append(spdx_license)
+            for name in unmapped_names:
+                unmapped[name].append(index)
+        return normalized, dict(unmapped)
+
+    def debian_normalize(self, license: str) -> Tuple[Union[str, List[str]], List[str]]:
+        # If there are multiple licenses, change to list type and
+        # rename debian license name to SPDX license
+        table = self.tables["debian"]
+        names = DEBIAN_SPLIT_RE.split(license) if " " in license else [license]
+        spdx_names = [table.get(name, name) for name in names]
+        unmapped = [name for name in names if name not in table and self.is_unknown(name)]
+        return (spdx_names if " " in license else spdx_names[0]), unmapped
+
+    def alpine_normalize(self, license: str) -> Tuple[str, List[str]]:
+        # Keep the expression as is and only rename each license name in it
+        table = self.tables["alpine"]
+        names = [name for name in ALPINE_NAME_RE.findall(license) if name.lower() not in OPERATORS]
+        unmapped = [name for name in names if name not in table and self.is_unknown(name)]
+        if not any(name in table for name in names):
+            return license, unmapped
+        return ALPINE_NAME_RE.sub(lambda m: table.get(m.group(), m.group()), license), unmapped
+
+    def is_unknown(self, name: str) -> bool:
+        return self.license_resolver.resolve(name) == SpdxNoAssertion()
@@ -0,0 +1,105 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from hashlib import sha256
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+# Default upper bound for the on-disk size of one cache namespace
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+
+class SbomCache:
+    def __init__(self, cache_dir: str, namespace: str, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        self.directory = os.path.join(cache_dir, namespace)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, *parts: str) -> str:
+        # Entries are content-addressed: the key is a digest of everything
+        # that can change the cached value (input digest, tool version, format...)
+        return sha256("\0".join(parts).encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        f = self.open(key)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        # Like get() for entries too large to be read at once
+        entry = self.path(key)
+        try:
+            f = open(entry, "rb")
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        # Refresh mtime so that eviction drops least recently used entries first
+        try:
+            os.utime(entry)
+        except FileNotFoundError:
+            # evicted by a concurrent writer after we read it
+            pass
+        self.hits += 1
+        logging.debug("cache hit %s", entry)
+        return f
+
+    def put(self, key: str, data: bytes) -> None:
+        with self.writer(key) as f:
+            f.write(data)
+
+    @contextmanager
+    def writer(self, key: str) -> Iterator[BinaryIO]:
+        # Like put() for data written piece by piece: the entry is only
+        # added if the block exits without exception
+        entry = self.path(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        # Write to a temporary file first so that concurrent readers
+        # never see a partially written entry
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(entry), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                yield f
+            os.replace(tmp, entry)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.evict()
+
+    def entries(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith(".tmp-"):
+                    continue
+                entry = os.path.join(root, name)
+                try:
+                    st = os.stat(entry)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry))
+        return entries
+
+    def evict(self) -> None:
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        # Drop the oldest entries until the namespace fits in max_size
+        for _, size, entry in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(entry)
+            except FileNotFoundError:
+                pass
+            total -= size
+            logging.debug("cache evicted %s", entry)
@@ -0,0 +1,236 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# pyright: reportPrivateImportUsage=false
+
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from spdx_tools.spdx.model import (
+    ExtractedLicensingInfo,
+    File,
+    Package,
+    Relationship,
+    RelationshipType,
+    SpdxNoAssertion,
+)
+
+
+def package_keys(package: Package) -> List[Tuple[str, ...]]:
+    # Any of these identifies the same package across sources
+    keys: List[Tuple[str, ...]] = [
+        ("purl", reference.locator)
+        for reference in package.external_references
+        if reference.reference_type == "purl"
+    ]
+    # Different packages can ship the same file, e.g. an empty archive:
+    # a checksum only identifies a package with the same name
+    keys += [
+        ("checksum", package.name, checksum.algorithm.name, checksum.value) for checksum in package.checksums
+    ]
+    # Without a version, the name alone says too little
+    if package.version:
+        keys.append(("version", package.name, package.version))
+    return keys
+
+
+def merge_package(package: Package, duplicate: Package) -> None:
+    # Keep what the duplicate knows and the package does not
+    package.external_references = package.external_references + [
+        reference for reference in duplicate.external_references
+        if reference not in package.external_references
+    ]
+    package.checksums = package.checksums + [
+        checksum for checksum in duplicate.checksums if checksum not in package.checksums
+    ]
+    if duplicate.files_analyzed and not package.files_analyzed:
+        # files contained by the duplicate now belong to the package
+        package.files_analyzed = True
+        package.verification_code = duplicate.verification_code
+    if package.download_location == SpdxNoAssertion():
+        package.download_location = duplicate.download_location
+    if package.license_declared == SpdxNoAssertion() and duplicate.license_declared is not None:
+        package.license_declared = duplicate.license_declared
+
+
+def relationship_triple(relationship: Relationship) -> Tuple[str, str, str]:
+    return (relationship.spdx_element_id, relationship.relationship_type.name,
+            str(relationship.related_spdx_element_id))
+
+
+class SbomGraph:
+    # Packages and files are indexed by spdx_id and relationships are kept
+    # in adjacency lists, so that lookup, pruning and merging stay linear
+    # in the number of elements instead of scanning whole lists every time.
+    def __init__(
+        self,
+        packages: Iterable[Package] = (),
+        files: Iterable[File] = (),
+        relationships: Iterable[Relationship] = (),
+        extracted_licensing_info: Iterable[ExtractedLicensingInfo] = (),
+    ) -> None:
+        self.package_index: Dict[str, Package] = {}
+        self.file_index: Dict[str, File] = {}
+        self.relationship_index: Dict[int, Relationship] = {}
+        self.outgoing: Dict[str, List[int]] = defaultdict(list)
+        self.incoming: Dict[str, List[int]] = defaultdict(list)
+        self.extracted_licensing_info: List[ExtractedLicensingInfo] = []
+        self.next_relationship = 0
+
+        self.add_packages(packages)
+        self.add_files(files)
+        self.add_relationships(relationships)
+        self.add_extracted_licensing_info(extracted_licensing_info)
+
+    @classmethod
+    def from_document(cls, document: Any) -> "SbomGraph":
+        return cls(
+            packages=document.packages,
+            files=document.files,
+            relationships=document.relationships,
+            extracted_licensing_info=document.extracted_licensing_info,
+        )
+
+    @property
+    def packages(self) -> List[Package]:
+        return list(self.package_index.values())
+
+    @property
+    def files(self) -> List[File]:
+        return list(self.file_index.values())
+
+    @property
+    def relationships(self) -> List[Relationship]:
+        return list(self.relationship_index.values())
+
+    def add_packages(self, packages: Iterable[Package]) -> None:
+        for package in packages:
+            if package.spdx_id in self.package_index:
+                raise ValueError(f"duplicate package {package.spdx_id}")
+            self.package_index[package.spdx_id] = package
+
+    def add_files(self, files: Iterable[File]) -> None:
+        for file in files:
+            if file.spdx_id in self.file_index:
+                raise ValueError(f"duplicate file {file.spdx_id}")
+            self.file_index[file.spdx_id] = file
+
+    def add_relationships(self, relationships: Iterable[Relationship]) -> None:
+        for relationship in relationships:
+            key = self.next_relationship
+            self.next_relationship += 1
+            self.relationship_index[key] = relationship
+            self.outgoing[relationship.spdx_element_id].append(key)
+            self.incoming[str(relationship.related_spdx_element_id)].append(key)
+
+    def add_extracted_licensing_info(self, extracted_licensing_info: Iterable[ExtractedLicensingInfo]) -> None:
+        self.extracted_licensing_info += extracted_licensing_info
+
+    def merge(self, other: "SbomGraph") -> None:
+        self.add_packages(other.package_index.values())
+        self.add_files(other.file_index.values())
+        self.add_relationships(other.relationship_index.values())
+        self.add_extracted_licensing_info(other.extracted_licensing_info)
+
+    def get_package(self, spdx_id: str) -> Optional[Package]:
+        return self.package_index.get(spdx_id)
+
+    def get_file(self, spdx_id: str) -> Optional[File]:
+        return self.file_index.get(spdx_id)
+
+    def relationship_keys(self, adjacency: Dict[str, List[int]], spdx_id: str) -> List[int]:
+        # Removed relationships are dropped lazily from the adjacency lists
+        keys = [key for key in adjacency.get(spdx_id, []) if key in self.relationship_index]
+        if keys:
+            adjacency[spdx_id] = keys
+        else:
+            adjacency.pop(spdx_id, None)
+        return keys
+
+    def relationships_from(self, spdx_id: str,
+                           relationship_type: Optional[RelationshipType] = None) -> List[Relationship]:
+        relationships = [self.relationship_index[key] for key in self.relationship_keys(self.outgoing, spdx_id)]
+        if relationship_type is None:
+            return relationships
+        return [relationship for relationship in relationships
+                if relationship.relationship_type == relationship_type]
+
+    def relationships_to(self, spdx_id: str,
+                         relationship_type: Optional[RelationshipType] = None) -> List[Relationship]:
+        relationships = [self.relationship_index[key] for key in self.relationship_keys(self.incoming, spdx_id)]
+        if relationship_type is None:
+            return relationships
+        return [relationship for relationship in relationships
+                if relationship.relationship_type == relationship_type]
+
+    def remove_relationships_to(self, spdx_id: str) -> None:
+        for key in self.relationship_keys(self.incoming, spdx_id):
+            del self.relationship_index[key]
+        self.incoming.pop(spdx_id, None)
+
+    def remove_file(self, spdx_id: str) -> None:
+        # Relationships pointing to the file would be dangling once it is gone
+        self.remove_relationships_to(spdx_id)
+        self.file_index.pop(spdx_id, None)
+
+    def remove_package(self, spdx_id: str) -> None:
+        self.remove_relationships_to(spdx_id)
+        self.package_index.pop(spdx_id, None)
+
+    def replace_package(self, spdx_id: str, replacement_id: str) -> None:
+        # Point the relationships of a package to its replacement, then drop it.
+        # Relationships that become loops or duplicates of existing ones are dropped.
+        existing = {
+            relationship_triple(relationship)
+            for relationship in self.relationships_from(replacement_id) + self.relationships_to(replacement_id)
+        }
+        keys = self.relationship_keys(self.outgoing, spdx_id) + self.relationship_keys(self.incoming, spdx_id)
+        for key in dict.fromkeys(keys):
+            relationship = self.relationship_index[key]
+            if relationship.spdx_element_id == spdx_id:
+                relationship.spdx_element_id = replacement_id
+                self.outgoing[replacement_id].append(key)
+            if relationship.related_spdx_element_id == spdx_id:
+                relationship.related_spdx_element_id = replacement_id
+                self.incoming[replacement_id].append(key)
+            triple = relationship_triple(relationship)
+            if relationship.spdx_element_id == relationship.related_spdx_element_id or triple in existing:
+                del self.relationship_index[key]
+                continue
+            existing.add(triple)
+        self.outgoing.pop(spdx_id, None)
+        self.incoming.pop(spdx_id, None)
+        self.package_index.pop(spdx_id, None)
+
+    def deduplicate_packages(self) -> Dict[str, str]:
+        # The same package often comes from several sources (package list,
+        # syft scan, external sboms). Packages sharing a purl, a name and
+        # a checksum or a name and version are collapsed into the first one seen.
+        index: Dict[Tuple[str, ...], str] = {}
+        duplicates: Dict[str, str] = {}
+        for package in self.packages:
+            keys = package_keys(package)
+            match = next((key for key in keys if key in index), None)
+            if match is None:
+                for key in keys:
+                    index[key] = package.spdx_id
+                continue
+            kept_id = index[match]
+            logging.info("merging package %s into %s (%s)", package.spdx_id, kept_id, ":".join(match))
+            merge_package(self.package_index[kept_id], package)
+            for key in keys:
+                index.setdefault(key, kept_id)
+            self.replace_package(package.spdx_id, kept_id)
+            duplicates[package.spdx_id] = kept_id
+        return duplicates
+
+    def update_document(self, document: Any) -> None:
+        # This library uses run-time type checks when assigning properties.
+        # Because in-place alterations like .append() circumvent these checks,
+        # the whole lists are assigned once here.
+        document.packages = self.packages
+        document.files = self.files
+        document.relationships = self.relationships
+        document.extracted_licensing_info = [*self.extracted_licensing_info]
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# SQLite index of the packages, licenses and files of many sboms, so that
+# questions about all past builds do not require parsing every .spdx.json:
+#   sbom_index.py -d sboms.sqlite ingest outdir/
+#   sbom_index.py -d sboms.sqlite package openssl --before 3.1.4-r1
+#   sbom_index.py -d sboms.sqlite license GPL-3.0
+#   sbom_index.py -d sboms.sqlite file --sha256 <digest>
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+from argparse import ArgumentParser, Namespace
+from itertools import zip_longest
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utility import get_file_sha256, open_compressed, strip_compressed_extension
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    digest TEXT NOT NULL,
+    name TEXT,
+    namespace TEXT,
+    created TEXT
+);
+CREATE TABLE IF NOT EXISTS packages (
+    id INTEGER PRIMARY KEY,
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    spdx_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    version TEXT,
+    license_concluded TEXT,
+    license_declared TEXT,
+    purl TEXT
+);
+CREATE TABLE IF NOT EXISTS licenses (
+    package_id INTEGER NOT NULL REFERENCES packages(id) ON DELETE CASCADE,
+    license TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    spdx_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    sha1 TEXT,
+    sha256 TEXT
+);
+CREATE INDEX IF NOT EXISTS packages_name ON packages(name, version);
+CREATE INDEX IF NOT EXISTS packages_document ON packages(document_id);
+CREATE INDEX IF NOT EXISTS licenses_license ON licenses(license);
+CREATE INDEX IF NOT EXISTS licenses_package ON licenses(package_id);
+CREATE INDEX IF NOT EXISTS files_sha256 ON files(sha256);
+CREATE INDEX IF NOT EXISTS files_sha1 ON files(sha1);
+CREATE INDEX IF NOT EXISTS files_name ON files(name);
+CREATE INDEX IF NOT EXISTS files_document ON files(document_id);
+"""
+
+# Words of license expressions which are not license identifiers
+LICENSE_OPERATORS = {"AND", "OR", "WITH", "and", "or", "with"}
+LICENSE_TOKEN_RE = re.compile(r"[^\s()]+")
+VERSION_PART_RE = re.compile(r"\d+|[a-zA-Z]+|~")
+
+
+def version_key(version: str) -> List[Tuple[int, Any]]:
+    # Numbers compare as numbers and letters as strings, "~" sorts before
+    # anything (debian pre-releases): close enough to apk and dpkg ordering
+    # for "older than" queries
+    key: List[Tuple[int, Any]] = []
+    for part in VERSION_PART_RE.findall(version):
+        if part == "~":
+            key.append((-1, ""))
+        elif part.isdigit():
+            key.append((1, int(part)))
+        else:
+            key.append((0, part))
+    return key
+
+
+def version_compare(version: Optional[str], other: Optional[str]) -> int:
+    if version is None or other is None:
+        return 0
+    for part, other_part in zip_longest(version_key(version), version_key(other), fillvalue=(0, "")):
+        if part != other_part:
+            return -1 if part < other_part else 1
+    return 0
+
+
+def license_identifiers(expression: Optional[str]) -> List[str]:
+    if not expression:
+        return []
+    return sorted({
+        token for token in LICENSE_TOKEN_RE.findall(expression)
+        if token not in LICENSE_OPERATORS and token not in ("NOASSERTION", "NONE")
+    })
+
+
+def find_sboms(paths: Iterable[str]) -> Iterator[str]:
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, _, files in os.walk(path):
+            for name in sorted(files):
+                if strip_compressed_extension(name).endswith(".spdx.json"):
+                    yield os.path.join(root, name)
+
+
+class SbomIndex:
+    def __init__(self, database: str) -> None:
+        self.connection = sqlite3.connect(database)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+        self.connection.create_function("version_compare", 2, version_compare, deterministic=True)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def ingest(self, path: str) -> bool:
+        # Documents are identified by their path, and only parsed again
+        # when their content changed since the last ingest
+        path = os.path.abspath(path)
+        digest = get_file_sha256(path)
+        row = self.connection.execute("SELECT digest FROM documents WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == digest:
+            return False
+        with open_compressed(path) as f:
+            document = json.load(f)
+        with self.connection:
+            self.connection.execute("DELETE FROM documents WHERE path = ?", (path,))
+            self.add_document(path, digest, document)
+        return True
+
+    def add_document(self, path: str, digest: str, document: Dict[str, Any]) -> None:
+        cursor = self.connection.execute(
+            "INSERT INTO documents (path, digest, name, namespace, created) VALUES (?, ?, ?, ?, ?)",
+            (path, digest, document.get("name"), document.get("documentNamespace"),
+             document.get("creationInfo", {}).get("created")),
+        )
+        document_id = cursor.lastrowid
+        for package in document.get("packages", []):
+            purl = next((reference["referenceLocator"] for reference in package.get("externalRefs", [])
+                         if reference.get("referenceType") == "purl"), None)
+            cursor = self.connection.execute(
+                "INSERT INTO packages (document_id, spdx_id, name, version, license_concluded, license_declared, purl)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (document_id, package["SPDXID"], package["name"], package.get("versionInfo"),
+                 package.get("licenseConcluded"), package.get("licenseDeclared"), purl),
+            )
+            licenses = set(license_identifiers(package.get("licenseConcluded")))
+            licenses.update(license_identifiers(package.get("licenseDeclared")))
+            for license in package.get("licenseInfoFromFiles", []):
+                licenses.update(license_identifiers(license))
+            self.connection.executemany(
+                "INSERT INTO licenses (package_id, license) VALUES (?, ?)",
+                [(cursor.lastrowid, license) for license in sorted(licenses)],
+            )
+        files = []
+        for file in document.get("files", []):
+            checksums = {checksum["algorithm"]: checksum["checksumValue"] for checksum in file.get("checksums", [])}
+            files.append((document_id, file["SPDXID"], file["fileName"],
+                          checksums.get("SHA1"), checksums.get("SHA256")))
+        self.connection.executemany(
+            "INSERT INTO files (document_id, spdx_id, name, sha1, sha256) VALUES (?, ?, ?, ?, ?)", files
+        )
+
+    def find_packages(self, name: str, version: Optional[str] = None,
+                      before: Optional[str] = None) -> List[Tuple[Any, ...]]:
+        query = ("SELECT documents.path, packages.name, packages.version, packages.license_concluded,"
+                 " packages.license_declared FROM packages JOIN documents ON documents.id = packages.document_id"
+                 " WHERE packages.name = ?")
+        parameters: List[Any] = [name]
+        if version is not None:
+            query += " AND packages.version = ?"
+            parameters.append(version)
+        if before is not None:
+            query += " AND version_compare(packages.version, ?) < 0"
+            parameters.append(before)
+        return self.connection.execute(query + " ORDER BY documents.path", parameters).fetchall()
+
+    def find_licenses(self, license: str) -> List[Tuple[Any, ...]]:
+        # GPL-3.0 also matches GPL-3.0-only, GPL-3.0-or-later and GPL-3.0+
+        return self.connection.execute(
+            "SELECT DISTINCT documents.path, packages.name, packages.version, licenses.license"
+            " FROM licenses JOIN packages ON packages.id = licenses.package_id"
+            " JOIN documents ON documents.id = packages.document_id"
+            " WHERE licenses.license = ? OR licenses.license = ? OR licenses.license LIKE ? ESCAPE '\\'"
+            " ORDER BY documents.path, packages.name",
+            (license, f"{license}+", license.replace("_", "\\_").replace("%", "\\%") + "-%"),
+        ).fetchall()
+
+    def find_files(self, name: Optional[str] = None, sha1: Optional[str] = None,
+                   sha256: Optional[str] = None) -> List[Tuple[Any, ...]]:
+        conditions = []
+        parameters = []
+        for column, value in (("files.name", name), ("files.sha1", sha1), ("files.sha256", sha256)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+        return self.connection.execute(
+            "SELECT documents.path, files.name, files.sha1, files.sha256"
+            " FROM files JOIN documents ON documents.id = files.document_id"
+            f" WHERE {' AND '.join(conditions) or '1'} ORDER BY documents.path",
+            parameters,
+        ).fetchall()
+
+
+def get_option() -> Namespace:
+    parser = ArgumentParser(description="index of generated sboms")
+    parser.add_argument(
+        "-d",
+        "--database",
+        help="sqlite index to use. Default is %(default)s",
+        default="sboms.sqlite",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest = subparsers.add_parser("ingest", help="add .spdx.json files, or the ones found in directories")
+    ingest.add_argument("paths", nargs="+")
+    package = subparsers.add_parser("package", help="list the sboms containing a package")
+    package.add_argument("name")
+    package.add_argument("--version", help="only this version")
+    package.add_argument("--before", help="only versions older than this one")
+    license = subparsers.add_parser("license", help="list the packages under a license")
+    license.add_argument("license", help="SPDX license identifier, e.g. GPL-3.0 also matches GPL-3.0-or-later")
+    file = subparsers.add_parser("file", help="list the sboms containing a file")
+    file.add_argument("--name")
+    file.add_argument("--sha1")
+    file.add_argument("--sha256")
+    return parser.parse_args()
+
+
+def main():
+    args = get_option()
+    logging.basicConfig(level=logging.INFO)
+    index = SbomIndex(args.database)
+    try:
+        if args.command == "ingest":
+            ingested = 0
+            for path in find_sboms(args.paths):
+                if index.ingest(path):
+                    ingested += 1
+                    logging.info("ingested %s", path)
+            logging.info("%d sboms ingested", ingested)
+            return
+        if args.command == "package":
+            rows = index.find_packages(args.name, args.version, args.before)
+        elif args.command == "license":
+            rows = index.find_licenses(args.license)
+        else:
+            rows = index.find_files(args.name, args.sha1, args.sha256)
+        for row in rows:
+            print("\t".join("" if value is None else str(value) for value in row))
+    finally:
+        index.close()
+    if not rows:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
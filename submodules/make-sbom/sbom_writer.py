@@ -0,0 +1,175 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# pyright: reportPrivateImportUsage=false
+
+import copy
+import gzip
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+from collections import Counter
+from contextlib import contextmanager
+from hashlib import sha256
+from typing import IO, Any, Callable, Container, Iterable, Iterator, List, TextIO, Tuple
+
+from spdx_tools.spdx.document_utils import (
+    create_document_without_duplicates,
+    create_list_without_duplicates,
+    get_contained_spdx_element_ids,
+)
+from spdx_tools.spdx.model import Document
+from spdx_tools.spdx.validation.spdx_id_validators import get_list_of_all_spdx_ids
+from spdx_tools.spdx.validation.validation_message import SpdxElementType, ValidationContext, ValidationMessage
+
+# Indentation of list elements in the document, as written by json.dump(indent=4)
+ELEMENT_INDENT = "\n" + " " * 8
+
+
+def get_element_key(element: Any) -> Tuple[str, str]:
+    # Identifies a package, file or relationship and its content: an element
+    # changed after it was validated, e.g. merged with a duplicate, is not
+    # known to be valid anymore. The dataclass repr lists every field.
+    spdx_id = element.spdx_element_id if hasattr(element, "spdx_element_id") else element.spdx_id
+    return spdx_id, sha256(repr(element).encode()).hexdigest()
+
+
+def without_duplicates(element: Any) -> Any:
+    # Same as spdx_tools create_document_without_duplicates, for a single element
+    # and without a deep copy of the whole document
+    element = copy.copy(element)
+    for key, value in element.__dict__.items():
+        if isinstance(value, list):
+            setattr(element, key, create_list_without_duplicates(value))
+    return element
+
+
+def write_elements(out: TextIO, name: str, elements: Iterable[Any], convert: Callable[[Any], dict]) -> None:
+    # Empty lists are omitted, like the spdx_tools converter does
+    first = True
+    for element in elements:
+        out.write(f',\n    "{name}": [' if first else ",")
+        first = False
+        out.write(ELEMENT_INDENT + json.dumps(convert(element), indent=4).replace("\n", ELEMENT_INDENT))
+    if not first:
+        out.write("\n    ]")
+
+
+def get_validation_document(document: Document, validated: Container[Tuple[str, str]]) -> Document:
+    # The part of the document which still needs validation: elements not
+    # validated yet, the relationships involving them (links across sources)
+    # and the validated elements they refer to, so that references resolve.
+    package_valid = [get_element_key(package) in validated for package in document.packages]
+    file_valid = [get_element_key(file) in validated for file in document.files]
+    packages = [package for package, valid in zip(document.packages, package_valid) if not valid]
+    files = [file for file, valid in zip(document.files, file_valid) if not valid]
+    new_ids = {element.spdx_id for element in [*packages, *files]}
+    relationships = [
+        relationship for relationship in document.relationships
+        if get_element_key(relationship) not in validated
+        or relationship.spdx_element_id in new_ids or relationship.related_spdx_element_id in new_ids
+    ]
+    referenced_ids = {relationship.spdx_element_id for relationship in relationships}
+    referenced_ids.update(str(relationship.related_spdx_element_id) for relationship in relationships)
+    referenced_ids.update(annotation.spdx_id for annotation in document.annotations)
+    packages += [package for package, valid in zip(document.packages, package_valid)
+                 if valid and package.spdx_id in referenced_ids]
+    files += [file for file, valid in zip(document.files, file_valid) if valid and file.spdx_id in referenced_ids]
+    return Document(
+        creation_info=document.creation_info,
+        packages=packages,
+        files=files,
+        snippets=document.snippets,
+        annotations=document.annotations,
+        relationships=relationships,
+        extracted_licensing_info=document.extracted_licensing_info,
+    )
+
+
+def validate_document(document: Document,
+                      validated: Container[Tuple[str, str]] = frozenset()) -> List[ValidationMessage]:
+    # validated holds the get_element_key() of elements known to be valid, e.g. from external sboms.
+    # Importing the validator builds the whole SPDX license database, only do it when needed
+    from spdx_tools.spdx.validation.document_validator import validate_full_spdx_document
+
+    if not validated:
+        return validate_full_spdx_document(document)
+    validation_messages = validate_full_spdx_document(get_validation_document(document, validated))
+    # ids must still be unique across the whole document
+    spdx_ids = get_list_of_all_spdx_ids(document)
+    if len(set(spdx_ids)) != len(spdx_ids):
+        duplicates = sorted({spdx_id for spdx_id, count in Counter(spdx_ids).items() if count > 1})
+        validation_messages.append(ValidationMessage(
+            f"every spdx_id must be unique within the document, but found the following duplicates: {duplicates}",
+            ValidationContext(spdx_id=document.creation_info.spdx_id, element_type=SpdxElementType.DOCUMENT),
+        ))
+    return validation_messages
+
+
+def write_document_to_stream(document: Document, out: TextIO, validate: bool = True,
+                             validated: Container[Tuple[str, str]] = frozenset()) -> None:
+    # Produces the same json as spdx_tools write_file(), but converts and writes
+    # packages, files and relationships one at a time instead of building
+    # a deduplicated copy and a dict of the whole document first.
+    if validate:
+        validation_messages = validate_document(document, validated)
+        if validation_messages:
+            raise ValueError(f"Document is not valid. The following errors were detected: {validation_messages}")
+
+    from spdx_tools.spdx.jsonschema.document_converter import DocumentConverter
+
+    converter = DocumentConverter()
+    # Everything but the element lists is small and comes first in the json
+    element_ids = set(get_contained_spdx_element_ids(document))
+    head = create_document_without_duplicates(Document(
+        creation_info=document.creation_info,
+        extracted_licensing_info=document.extracted_licensing_info,
+        annotations=[annotation for annotation in document.annotations if annotation.spdx_id not in element_ids],
+    ))
+    head_json = json.dumps(converter.convert(head), indent=4)
+    out.write(head_json[:-len("\n}")])
+
+    write_elements(out, "packages", document.packages,
+                   lambda package: converter.package_converter.convert(without_duplicates(package), document))
+    write_elements(out, "files", document.files,
+                   lambda file: converter.file_converter.convert(without_duplicates(file), document))
+    write_elements(out, "snippets", document.snippets,
+                   lambda snippet: converter.snippet_converter.convert(without_duplicates(snippet), document))
+    write_elements(out, "relationships", document.relationships, converter.relationship_converter.convert)
+    out.write("\n}")
+
+
+@contextmanager
+def open_output(file_name: str) -> Iterator[TextIO]:
+    # Compressed according to the extension, e.g. .spdx.json.gz or .spdx.json.zst
+    if file_name.endswith(".gz"):
+        # no name nor mtime in the gzip header, so that the same document gives the same file
+        with open(file_name, "wb") as f, gzip.GzipFile(filename="", mode="wb", fileobj=f, mtime=0) as compressed, \
+                io.TextIOWrapper(compressed, encoding="utf-8") as out:
+            yield out
+        return
+    if not file_name.endswith(".zst"):
+        with open(file_name, "w", encoding="utf-8") as out:
+            yield out
+        return
+    try:
+        process = subprocess.Popen(["zstd", "-qf", "-o", file_name], stdin=subprocess.PIPE)
+    except OSError:
+        logging.error("zstd is required to write %s", os.path.basename(file_name))
+        sys.exit(1)
+    stdin: IO[bytes] = process.stdin  # type: ignore
+    with io.TextIOWrapper(stdin, encoding="utf-8") as out:
+        yield out
+    if process.wait():
+        logging.error("zstd could not write %s", os.path.basename(file_name))
+        sys.exit(1)
+
+
+def write_document_to_file(document: Document, file_name: str, validate: bool = True,
+                           validated: Container[Tuple[str, str]] = frozenset()) -> None:
+    with open_output(file_name) as out:
+        write_document_to_stream(document, out, validate, validated)
@@ -0,0 +1,196 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# pyright: reportPrivateImportUsage=false
+
+import base64
+import hashlib
+import io
+import os
+import sys
+import tarfile
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spdx_tools.spdx.model import RelationshipType, SpdxNoAssertion  # noqa: E402
+
+from apk_sbom import ApkSbom, apk_checksum_to_sha1, parse_apk_installed  # noqa: E402
+from file_catalog import FileCatalog  # noqa: E402
+
+
+def apk_checksum(content):
+    return "Q1" + base64.b64encode(hashlib.sha1(content).digest()).decode()
+
+
+FILES = {
+    "bin/busybox": b"busybox",
+    "etc/securetty": b"console\n",
+    "usr/share/udhcpc/default.script": b"#!/bin/sh\n",
+    "usr/lib/libz.so.1.3.1": b"libz",
+}
+
+# The fields of a package come first, then its files: R: lines below the last F:
+# line, followed by their Z: checksum. Directories without files have no R: line.
+INSTALLED = f"""\
+C:Q1gR6DZEFQEXIeNB3kc4Z+2Ep0NLM=
+P:busybox
+V:1.36.1-r5
+A:aarch64
+S:508928
+I:925696
+T:Size optimized toolkit of many common UNIX utilities
+U:https://busybox.net/
+L:GPL2+
+o:busybox
+m:Sören Tempel <soeren+alpine@soeren-tempel.net>
+t:1700000000
+c:2a9cc3ad
+D:so:libc.musl-aarch64.so.1
+F:bin
+R:busybox
+a:0:0:755
+Z:{apk_checksum(FILES["bin/busybox"])}
+F:etc
+R:securetty
+Z:{apk_checksum(FILES["etc/securetty"])}
+F:etc/udhcpc
+M:0:0:700
+F:usr/share/udhcpc
+R:default.script
+Z:{apk_checksum(FILES["usr/share/udhcpc/default.script"])}
+R:no-checksum
+
+P:zlib
+V:1.3.1-r0
+A:aarch64
+T:A compression/decompression Library
+U:not a url
+L:Zlib AND custom:zlib
+F:usr/lib
+R:libz.so.1.3.1
+Z:{apk_checksum(FILES["usr/lib/libz.so.1.3.1"])}
+
+P:alpine-baselayout-data
+V:3.4.3-r1
+L:GPL-2.0-only
+F:etc
+"""
+
+
+def write_rootfs(filepath, installed=INSTALLED, prefix="./"):
+    with tarfile.open(filepath, "w") as tar:
+        contents = {**FILES, "lib/apk/db/installed": installed.encode(), "etc/alpine-release": b"3.19.1\n"}
+        for name, content in contents.items():
+            member = tarfile.TarInfo(prefix + name)
+            member.size = len(content)
+            tar.addfile(member, io.BytesIO(content))
+
+
+class TestParseApkInstalled(unittest.TestCase):
+    def test_packages(self):
+        packages = parse_apk_installed(INSTALLED)
+        self.assertEqual([package.fields["P"] for package in packages],
+                         ["busybox", "zlib", "alpine-baselayout-data"])
+        self.assertEqual(packages[0].fields["L"], "GPL2+")
+        self.assertEqual(packages[1].fields["U"], "not a url")
+
+    def test_files(self):
+        busybox, zlib, baselayout = parse_apk_installed(INSTALLED)
+        # R: lines are in the directory of the F: line above, with the checksum of the Z: line below
+        self.assertEqual([path for path, _ in busybox.files], [
+            "bin/busybox", "etc/securetty", "usr/share/udhcpc/default.script", "usr/share/udhcpc/no-checksum",
+        ])
+        self.assertEqual(busybox.files[0][1], apk_checksum(b"busybox"))
+        self.assertEqual(busybox.files[3][1], "")
+        # the owner and mode of files and directories are not fields of the package
+        self.assertNotIn("a", busybox.fields)
+        self.assertNotIn("M", busybox.fields)
+        self.assertEqual(zlib.files, [("usr/lib/libz.so.1.3.1", apk_checksum(b"libz"))])
+        self.assertEqual(baselayout.files, [])
+
+    def test_apk_checksum(self):
+        self.assertEqual(apk_checksum_to_sha1(apk_checksum(b"busybox")), hashlib.sha1(b"busybox").hexdigest())
+        # md5 checksums of old apk databases
+        self.assertIsNone(apk_checksum_to_sha1("0123456789abcdef0123456789abcdef"))
+
+
+class TestApkSbom(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.rootfs = os.path.join(self.tmpdir.name, "rootfs.tar")
+        write_rootfs(self.rootfs)
+        self.sbom = ApkSbom(self.rootfs)
+        self.packages = {package.name: package for package in self.sbom.packages}
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_packages(self):
+        self.assertEqual([package.name for package in self.sbom.packages],
+                         ["rootfs.tar", "busybox", "zlib", "alpine-baselayout-data"])
+        busybox = self.packages["busybox"]
+        self.assertEqual(busybox.version, "1.36.1-r5")
+        self.assertEqual(busybox.summary, "Size optimized toolkit of many common UNIX utilities")
+        self.assertEqual(busybox.download_location, "https://busybox.net/")
+        self.assertEqual(busybox.external_references[0].locator,
+                         "pkg:apk/alpine/busybox@1.36.1-r5?arch=aarch64&upstream=busybox&distro=alpine-3.19.1")
+        self.assertEqual(self.packages["zlib"].download_location, SpdxNoAssertion())
+
+    def test_licenses(self):
+        # renamed with the alpine table of license_map.yaml
+        self.assertEqual(str(self.packages["busybox"].license_declared), "GPL-2.0-or-later")
+        self.assertIsNone(self.packages["busybox"].license_comment)
+        self.assertEqual(str(self.packages["alpine-baselayout-data"].license_declared), "GPL-2.0-only")
+        # custom licenses cannot be described, the apk license is kept in a comment
+        self.assertEqual(self.packages["zlib"].license_declared, SpdxNoAssertion())
+        self.assertIn("'Zlib AND custom:zlib'", self.packages["zlib"].license_comment)
+
+    def test_files(self):
+        # files without sha1 are left out
+        self.assertEqual([file.name for file in self.sbom.files],
+                         ["busybox", "securetty", "default.script", "libz.so.1.3.1"])
+        self.assertEqual(self.sbom.files[0].checksums[0].value, hashlib.sha1(b"busybox").hexdigest())
+        self.assertTrue(self.packages["busybox"].files_analyzed)
+        self.assertIsNotNone(self.packages["busybox"].verification_code)
+        self.assertFalse(self.packages["alpine-baselayout-data"].files_analyzed)
+        # same ids as the cataloged files of the same paths
+        catalog = FileCatalog(self.rootfs)
+        self.assertLessEqual({file.spdx_id for file in self.sbom.files}, {file.spdx_id for file in catalog.files})
+
+    def test_relationships(self):
+        contains = {
+            (relationship.spdx_element_id, relationship.related_spdx_element_id)
+            for relationship in self.sbom.relationships
+            if relationship.relationship_type == RelationshipType.CONTAINS
+        }
+        root = self.sbom.target.spdx_id
+        busybox = self.packages["busybox"].spdx_id
+        for package in self.sbom.packages[1:]:
+            self.assertIn((root, package.spdx_id), contains)
+        for file in self.sbom.files[:3]:
+            self.assertIn((busybox, file.spdx_id), contains)
+        self.assertEqual(self.sbom.relationships[0].relationship_type, RelationshipType.DESCRIBES)
+
+    def test_reproducible_ids(self):
+        rootfs = os.path.join(self.tmpdir.name, "other", "rootfs.tar")
+        os.mkdir(os.path.dirname(rootfs))
+        # members without ./ are read the same way
+        write_rootfs(rootfs, prefix="")
+        sbom = ApkSbom(rootfs)
+        self.assertEqual([package.spdx_id for package in sbom.packages],
+                         [package.spdx_id for package in self.sbom.packages])
+        self.assertEqual([file.spdx_id for file in sbom.files], [file.spdx_id for file in self.sbom.files])
+
+    def test_missing_database(self):
+        rootfs = os.path.join(self.tmpdir.name, "empty.tar")
+        with tarfile.open(rootfs, "w") as tar:
+            tar.addfile(tarfile.TarInfo("etc/hostname"), io.BytesIO())
+        with self.assertRaises(SystemExit), self.assertLogs(level="ERROR"):
+            ApkSbom(rootfs)
+
+
+if __name__ == "__main__":
+    unittest.main()
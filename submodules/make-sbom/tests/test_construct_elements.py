@@ -0,0 +1,68 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# pyright: reportPrivateImportUsage=false
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from beartype.roar import BeartypeCallHintParamViolation  # noqa: E402
+from spdx_tools.spdx.model import Package, SpdxNoAssertion, SpdxNone  # noqa: E402
+
+import utility  # noqa: E402
+from license_index import parse_license  # noqa: E402
+from utility import construct_elements  # noqa: E402
+
+COLUMNS = {
+    "spdx_id": [f"SPDXRef-pkg{index}" for index in range(6)],
+    "name": ["pkg0", "pkg1", "pkg2", "pkg3", "pkg4", "pkg5"],
+    "version": ["1.0", None, "2.0", "3.0", "1.0", None],
+    "license_concluded": [
+        parse_license("MIT"), SpdxNoAssertion(), parse_license("GPL-2.0-only OR MIT"),
+        SpdxNone(), None, parse_license("MIT"),
+    ],
+    "license_info_from_files": [
+        [], [SpdxNoAssertion()], [parse_license("MIT"), parse_license("BSD-3-Clause")], [], [], [],
+    ],
+    "license_comment": [None, "unknown licenses", None, None, None, "comment"],
+    "files_analyzed": [False, True, True, False, False, False],
+}
+COMMON = {
+    "download_location": SpdxNoAssertion(),
+    "license_declared": SpdxNoAssertion(),
+    "copyright_text": SpdxNoAssertion(),
+}
+
+
+def construct_one_by_one():
+    return [Package(**COMMON, **dict(zip(COLUMNS, values))) for values in zip(*COLUMNS.values())]
+
+
+class TestConstructElements(unittest.TestCase):
+    def test_same_as_constructor(self):
+        self.assertEqual(construct_elements(Package, COLUMNS, **COMMON), construct_one_by_one())
+
+    def test_lists_not_shared(self):
+        packages = construct_elements(Package, COLUMNS, **COMMON)
+        packages[0].checksums.append(None)
+        self.assertEqual([len(package.checksums) for package in packages], [1, 0, 0, 0, 0, 0])
+        self.assertIsNot(packages[3].license_info_from_files, packages[4].license_info_from_files)
+
+    def test_type_checked(self):
+        # the copies are still checked when assigned, like constructed elements
+        package = construct_elements(Package, COLUMNS, **COMMON)[4]
+        with self.assertRaises(BeartypeCallHintParamViolation):
+            package.version = 1
+
+    def test_other_spdx_tools_version(self):
+        with mock.patch.object(utility, "spdx_tools_version", return_value="0.0.0"):
+            self.assertEqual(construct_elements(Package, COLUMNS, **COMMON), construct_one_by_one())
+
+
+if __name__ == "__main__":
+    unittest.main()
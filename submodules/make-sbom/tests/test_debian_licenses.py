@@ -0,0 +1,128 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+import io
+import os
+import sys
+import tarfile
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from debian_licenses import DebianLicenses, parse_copyright, parse_dpkg_status, resolve_path  # noqa: E402
+
+DPKG_STATUS = """\
+Package: adduser
+Status: install ok installed
+Version: 3.134
+Description: add and remove users and groups
+ This package includes the adduser and deluser commands.
+
+Package: removed
+Status: deinstall ok config-files
+Version: 1.0
+
+Package: libfoo-dev
+Status: install ok installed
+Version: 2.0-1
+"""
+
+DEP5_COPYRIGHT = """\
+Format: https://www.debian.org/doc/packaging-manuals/copyright-format/1.0/
+Upstream-Name: foo
+
+Files: *
+Copyright: 2020 Foo authors
+License: GPL-2+ with Linux-syscall-note
+
+Files: lib/*
+License: LGPL-2.1+ or MIT, BSD-3-Clause
+ The text of the license
+ License: not a field
+
+Files: debian/*
+License: GPL-2+ with Linux-syscall-note
+"""
+
+
+class TestParse(unittest.TestCase):
+    def test_dpkg_status(self):
+        self.assertEqual(parse_dpkg_status(DPKG_STATUS), [("adduser", "3.134"), ("libfoo-dev", "2.0-1")])
+
+    def test_dep5(self):
+        # licenses in order, once, operators dropped and "with" exceptions kept whole
+        self.assertEqual(parse_copyright(DEP5_COPYRIGHT),
+                         "GPL-2+ with Linux-syscall-note LGPL-2.1+ MIT BSD-3-Clause")
+
+    def test_dep5_bytes(self):
+        self.assertEqual(parse_copyright(b"Format: x\n\nFiles: *\nLicense: MIT and Apache-2.0\n"), "MIT Apache-2.0")
+
+    def test_common_licenses(self):
+        content = "On Debian systems, see /usr/share/common-licenses/GPL-2.\nand /usr/share/common-licenses/GPL-2.\n"
+        self.assertEqual(parse_copyright(content), "GPL-2")
+
+    def test_unknown(self):
+        self.assertEqual(parse_copyright("All rights reserved."), "unknown")
+        self.assertEqual(parse_copyright(""), "unknown")
+
+    def test_resolve_path(self):
+        links = {
+            "usr/share/doc/libfoo-dev": "libfoo1",
+            "usr/share/doc/libbar-dev": "/usr/share/doc/libbar1",
+            "usr/share/doc/loop": "loop",
+        }
+        self.assertEqual(resolve_path(links, "usr/share/doc/libfoo-dev/copyright"), "usr/share/doc/libfoo1/copyright")
+        self.assertEqual(resolve_path(links, "usr/share/doc/libbar-dev/copyright"), "usr/share/doc/libbar1/copyright")
+        self.assertEqual(resolve_path(links, "usr/share/doc/adduser/copyright"), "usr/share/doc/adduser/copyright")
+        # gives up on symlink loops
+        self.assertEqual(resolve_path(links, "usr/share/doc/loop/copyright"), "usr/share/doc/loop/copyright")
+
+
+class TestDebianLicenses(unittest.TestCase):
+    PACKAGES = [
+        ("adduser", "3.134", "GPL-2+ with Linux-syscall-note LGPL-2.1+ MIT BSD-3-Clause"),
+        ("libfoo-dev", "2.0-1", "GPL-2"),
+    ]
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmpdir.name, "rootfs")
+        for directory in ["var/lib/dpkg", "usr/share/doc/adduser", "usr/share/doc/libfoo1"]:
+            os.makedirs(os.path.join(self.root, directory))
+        self.write("var/lib/dpkg/status", DPKG_STATUS)
+        self.write("usr/share/doc/adduser/copyright", DEP5_COPYRIGHT)
+        self.write("usr/share/doc/libfoo1/copyright", "see /usr/share/common-licenses/GPL-2\n")
+        os.symlink("libfoo1", os.path.join(self.root, "usr/share/doc/libfoo-dev"))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, path, content):
+        with open(os.path.join(self.root, path), "w") as f:
+            f.write(content)
+
+    def test_directory(self):
+        self.assertEqual(DebianLicenses(self.root).packages, self.PACKAGES)
+
+    def test_tarball(self):
+        tarball = os.path.join(self.tmpdir.name, "rootfs.tar.gz")
+        with tarfile.open(tarball, "w:gz") as tar:
+            tar.add(self.root, arcname=".")
+        self.assertEqual(DebianLicenses(tarball, jobs=2).packages, self.PACKAGES)
+
+    def test_missing_copyright(self):
+        os.unlink(os.path.join(self.root, "usr/share/doc/libfoo1/copyright"))
+        self.assertEqual(DebianLicenses(self.root).packages[1], ("libfoo-dev", "2.0-1", "unknown"))
+
+    def test_missing_status(self):
+        tarball = os.path.join(self.tmpdir.name, "empty.tar")
+        with tarfile.open(tarball, "w") as tar:
+            tar.addfile(tarfile.TarInfo("etc/hostname"), io.BytesIO())
+        with self.assertRaises(SystemExit), self.assertLogs(level="ERROR"):
+            DebianLicenses(tarball)
+
+
+if __name__ == "__main__":
+    unittest.main()
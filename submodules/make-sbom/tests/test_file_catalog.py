@@ -0,0 +1,106 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+import hashlib
+import io
+import json
+import os
+import sys
+import tarfile
+import tempfile
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_catalog import FileCatalog  # noqa: E402
+from file_sbom import FileSbom  # noqa: E402
+from make_sbom import catalog_files  # noqa: E402
+
+ROOTFS = {
+    "./bin/busybox": b"busybox",
+    "./etc/os-release": b"NAME=Alpine Linux\n",
+    "./usr/bin/ls": b"ls",
+    "./usr/lib/libz.so.1": b"libz",
+}
+
+
+def syft_output(files):
+    # What syft lists for rootfs.tar: its root package and some of its files
+    root_id = "SPDXRef-DocumentRoot-File-rootfs.tar"
+    return json.dumps({
+        "SPDXID": "SPDXRef-DOCUMENT",
+        "spdxVersion": "SPDX-2.2",
+        "name": "rootfs.tar",
+        "dataLicense": "CC0-1.0",
+        "documentNamespace": "https://example.org/rootfs.tar",
+        "creationInfo": {"created": "1970-01-01T00:00:00Z", "creators": ["Tool: syft-1.6.0"]},
+        "packages": [{
+            "SPDXID": root_id,
+            "name": "rootfs.tar",
+            "downloadLocation": "NOASSERTION",
+            "filesAnalyzed": False,
+        }],
+        "files": [
+            {
+                "SPDXID": f"SPDXRef-File-{index}",
+                "fileName": name,
+                "checksums": [{"algorithm": "SHA1", "checksumValue": hashlib.sha1(ROOTFS[f".{name}"]).hexdigest()}],
+            }
+            for index, name in enumerate(files)
+        ],
+        "relationships": [
+            {"spdxElementId": "SPDXRef-DOCUMENT", "relationshipType": "DESCRIBES", "relatedSpdxElement": root_id},
+        ],
+    }).encode()
+
+
+class TestFileCatalog(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tarball = os.path.join(self.tmpdir.name, "rootfs.tar")
+        with tarfile.open(self.tarball, "w") as tar:
+            directory = tarfile.TarInfo("./usr/bin")
+            directory.type = tarfile.DIRTYPE
+            tar.addfile(directory)
+            for name, content in ROOTFS.items():
+                member = tarfile.TarInfo(name)
+                member.size = len(content)
+                tar.addfile(member, io.BytesIO(content))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def scan(self, files):
+        @contextmanager
+        def run_syft(self, filepath):
+            yield io.BytesIO(syft_output(files))
+
+        with mock.patch.object(FileSbom, "run_syft", run_syft):
+            return FileSbom(self.tarball)
+
+    def test_catalog(self):
+        catalog = FileCatalog(self.tarball, jobs=2)
+        self.assertEqual([file.name for file in catalog.files], ["busybox", "os-release", "ls", "libz.so.1"])
+        self.assertEqual(sorted(catalog.paths.values()), ["bin/busybox", "etc/os-release", "usr/bin/ls",
+                                                          "usr/lib/libz.so.1"])
+        self.assertEqual(catalog.files[2].checksums[1].value, hashlib.sha256(b"ls").hexdigest())
+        # reproducible ids
+        self.assertEqual([file.spdx_id for file in catalog.files],
+                         [file.spdx_id for file in FileCatalog(self.tarball).files])
+
+    def test_files_listed_by_syft(self):
+        file_sbom = self.scan(["/usr/bin/ls", "/etc/os-release"])
+        self.assertEqual(file_sbom.get_file_paths(), {"usr/bin/ls", "etc/os-release"})
+        graph = catalog_files(self.tarball, file_sbom, 1)
+        self.assertEqual(sorted(file.name for file in graph.files), ["busybox", "libz.so.1"])
+        names = [file.name for file in file_sbom.graph.files + graph.files]
+        self.assertEqual(sorted(names), ["busybox", "libz.so.1", "ls", "os-release"])
+        self.assertTrue(file_sbom.target.files_analyzed)
+        self.assertEqual(len(graph.relationships), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
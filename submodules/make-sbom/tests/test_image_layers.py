@@ -0,0 +1,93 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+import io
+import os
+import sys
+import tarfile
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_layers import LayerPaths, normalize_path  # noqa: E402
+
+
+def write_layer(filepath, files=(), directories=()):
+    with tarfile.open(filepath, "w") as tar:
+        for name in directories:
+            member = tarfile.TarInfo(name)
+            member.type = tarfile.DIRTYPE
+            tar.addfile(member)
+        for name in files:
+            tar.addfile(tarfile.TarInfo(name), io.BytesIO())
+
+
+class TestLayerPaths(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def from_tarball(self, files=(), directories=()):
+        filepath = os.path.join(self.tmpdir.name, "layer.tar")
+        write_layer(filepath, files, directories)
+        return LayerPaths.from_tarball(filepath)
+
+    def test_normalize_path(self):
+        for path in ["./usr/bin/ls", "/usr/bin/ls", "usr//bin/./ls", "usr/lib/../bin/ls"]:
+            self.assertEqual(normalize_path(path), "usr/bin/ls")
+
+    def test_from_tarball(self):
+        layer = self.from_tarball(
+            files=["./etc/os-release", "usr/bin/.wh.vi", "./var/cache/.wh..wh..opq"],
+            directories=["./etc", "./usr/bin"],
+        )
+        self.assertEqual(layer.paths, {"etc/os-release"})
+        self.assertEqual(layer.deleted, {"usr/bin/vi"})
+        self.assertEqual(layer.opaque, {"var/cache"})
+
+    def test_overwritten(self):
+        layer = LayerPaths(paths=["etc/os-release"])
+        self.assertTrue(layer.hides("/etc/os-release"))
+        self.assertFalse(layer.hides("/etc/hostname"))
+
+    def test_whiteout(self):
+        # .wh.<name> deletes the file or the whole directory below
+        layer = LayerPaths(deleted=["usr/bin/vi", "usr/share/doc"])
+        self.assertTrue(layer.hides("usr/bin/vi"))
+        self.assertTrue(layer.hides("/usr/share/doc/busybox/copyright"))
+        self.assertFalse(layer.hides("usr/bin/vim"))
+        self.assertFalse(layer.hides("usr/share/docs"))
+
+    def test_opaque_whiteout(self):
+        # .wh..wh..opq hides the lower contents of the directory, not the directory itself
+        layer = LayerPaths(opaque=["var/cache"])
+        self.assertTrue(layer.hides("var/cache/apk/APKINDEX.tar.gz"))
+        self.assertFalse(layer.hides("var/cache"))
+        self.assertFalse(layer.hides("var/lib/apk"))
+        self.assertTrue(LayerPaths(opaque=[""]).hides("etc/os-release"))
+
+    def test_whiteout_files(self):
+        # the whiteout files themselves are not files of the image
+        self.assertTrue(LayerPaths().hides("usr/bin/.wh.vi"))
+        self.assertTrue(LayerPaths().hides("var/cache/.wh..wh..opq"))
+
+    def test_update(self):
+        # the paths of the layers above a layer, merged
+        above = LayerPaths(paths=["etc/os-release"])
+        above.update(LayerPaths(deleted=["usr/bin/vi"], opaque=["var/cache"]))
+        self.assertTrue(above.hides("etc/os-release"))
+        self.assertTrue(above.hides("usr/bin/vi"))
+        self.assertTrue(above.hides("var/cache/x"))
+
+    def test_json(self):
+        layer = LayerPaths(paths=["b", "a"], deleted=["c"], opaque=["d"])
+        copy = LayerPaths.from_json(layer.to_json())
+        self.assertEqual((copy.paths, copy.deleted, copy.opaque), (layer.paths, layer.deleted, layer.opaque))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# pyright: reportPrivateImportUsage=false
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spdx_tools.spdx.model import Actor, ActorType, CreationInfo, Document  # noqa: E402
+
+from incremental_sbom import PreviousSbom, get_license_data_comment  # noqa: E402
+from packages_sbom import PackagesSbom  # noqa: E402
+from sbom_writer import write_document_to_file  # noqa: E402
+
+PACKAGE_LIST = """\
+abos-base-2.0-r1 aarch64 {abos-base} (MIT) [installed]
+busybox-1.36.1-r5 aarch64 {busybox} (GPL-2.0-only) [installed]
+openssl-3.1.4-r1 aarch64 {openssl} (Apache-2.0) [installed]
+"""
+
+
+class TestPreviousSbom(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.previous = self.write_sbom("previous", PACKAGE_LIST, get_license_data_comment())
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_package_list(self, name, content):
+        filepath = os.path.join(self.tmpdir.name, f"{name}.package_list.txt")
+        with open(filepath, "w") as f:
+            f.write(content)
+        return filepath
+
+    def write_sbom(self, name, package_list, creator_comment):
+        packages_sbom = PackagesSbom(self.write_package_list(name, package_list))
+        creation_info = CreationInfo(
+            spdx_version="SPDX-2.2",
+            spdx_id="SPDXRef-DOCUMENT",
+            name=name,
+            document_namespace=f"https://example.org/{name}",
+            creators=[Actor(ActorType.TOOL, "make-sbom")],
+            created=datetime(1970, 1, 1),
+            creator_comment=creator_comment,
+        )
+        document = Document(creation_info, packages=packages_sbom.packages,
+                            relationships=packages_sbom.get_relationships("SPDXRef-DOCUMENT"))
+        filepath = os.path.join(self.tmpdir.name, f"{name}.spdx.json")
+        write_document_to_file(document, filepath, validate=False)
+        return filepath
+
+    def previous_ids(self):
+        with open(self.previous) as f:
+            return {package["name"]: package["SPDXID"] for package in json.load(f)["packages"]}
+
+    def test_reuse(self):
+        previous = PreviousSbom(self.previous)
+        package_list = PACKAGE_LIST.replace("openssl-3.1.4-r1", "openssl-3.1.4-r2") \
+            + "musl-1.2.4-r2 aarch64 {musl} (MIT) [installed]\n"
+        packages = PackagesSbom(self.write_package_list("current", package_list), previous=previous).packages
+        self.assertEqual(previous.reused, 2)
+        previous_ids = self.previous_ids()
+        ids = {package.name: package.spdx_id for package in packages}
+        self.assertEqual(ids["abos-base"], previous_ids["abos-base"])
+        self.assertEqual(ids["busybox"], previous_ids["busybox"])
+        self.assertNotEqual(ids["openssl"], previous_ids["openssl"])
+        self.assertEqual([package.name for package in packages], ["abos-base", "busybox", "openssl", "musl"])
+
+    def test_delta(self):
+        previous = PreviousSbom(self.previous)
+        package_list = PACKAGE_LIST.replace("openssl-3.1.4-r1", "openssl-3.1.4-r2")
+        packages_sbom = PackagesSbom(self.write_package_list("current", package_list), previous=previous)
+        delta = previous.get_delta(packages_sbom.get_graph("SPDXRef-DOCUMENT"))
+        self.assertEqual(delta["packages"], {
+            "added": ["openssl@3.1.4-r2"], "removed": ["openssl@3.1.4-r1"], "unchanged": 2, "reused": 2,
+        })
+        self.assertEqual(delta["relationships"], {"added": 1, "removed": 1, "unchanged": 2})
+
+    def test_license_data_changed(self):
+        # licenses resolved with another license map or license database are not reused
+        self.previous = self.write_sbom("previous", PACKAGE_LIST, "license data: " + "0" * 64)
+        previous = PreviousSbom(self.previous)
+        PackagesSbom(self.write_package_list("current", PACKAGE_LIST), previous=previous)
+        self.assertEqual(previous.reused, 0)
+
+    def test_license_data_appended(self):
+        # the license data is added after the creator comment of the config
+        self.previous = self.write_sbom("previous", PACKAGE_LIST, "built by CI\n" + get_license_data_comment())
+        previous = PreviousSbom(self.previous)
+        PackagesSbom(self.write_package_list("current", PACKAGE_LIST), previous=previous)
+        self.assertEqual(previous.reused, 3)
+
+    def test_no_license_data(self):
+        self.previous = self.write_sbom("previous", PACKAGE_LIST, None)
+        previous = PreviousSbom(self.previous)
+        PackagesSbom(self.write_package_list("current", PACKAGE_LIST), previous=previous)
+        self.assertEqual(previous.reused, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,204 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# pyright: reportPrivateImportUsage=false
+
+import io
+import json
+import os
+import sys
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spdx_tools.spdx.model import SpdxNoAssertion  # noqa: E402
+from spdx_tools.spdx.parser.jsonlikedict.json_like_dict_parser import JsonLikeDictParser  # noqa: E402
+
+import utility  # noqa: E402
+from file_sbom import SYFT_ELEMENT_ARRAYS, FileSbom  # noqa: E402
+from utility import iter_json_members  # noqa: E402
+
+# escapes, multi-byte characters and surrogate pairs, to be split by chunk boundaries
+TEXT = "café \"quoted\" back\\slash\ttab\nnew line \U0001f600   /\\/"
+
+SYFT_OUTPUT = {
+    "spdxVersion": "SPDX-2.2",
+    "dataLicense": "CC0-1.0",
+    "SPDXID": "SPDXRef-DOCUMENT",
+    "name": "rootfs.tar",
+    "documentNamespace": "https://example.org/syft/rootfs.tar-0123",
+    "creationInfo": {
+        "licenseListVersion": "3.24",
+        "creators": ["Organization: Anchore, Inc", "Tool: syft-1.6.0"],
+        "created": "2024-05-01T12:34:56Z",
+        "comment": TEXT,
+    },
+    "packages": [
+        {
+            "name": "rootfs.tar",
+            "SPDXID": "SPDXRef-DocumentRoot-File-rootfs.tar",
+            "downloadLocation": "NOASSERTION",
+            "filesAnalyzed": False,
+            "licenseConcluded": "NOASSERTION",
+            "licenseDeclared": "NOASSERTION",
+            "copyrightText": "NOASSERTION",
+        },
+        {
+            "name": "busybox",
+            "SPDXID": "SPDXRef-Package-apk-busybox-6f1c5d2e",
+            "versionInfo": "1.36.1-r5",
+            "supplier": "Person: Sören Tempel (soeren+alpine@soeren-tempel.net)",
+            "downloadLocation": "https://busybox.net/",
+            "filesAnalyzed": True,
+            "packageVerificationCode": {"packageVerificationCodeValue": "a" * 40},
+            "sourceInfo": "acquired package info from installed apk DB: /lib/apk/db/installed",
+            "licenseConcluded": "NOASSERTION",
+            "licenseDeclared": "GPL-2.0-only AND LicenseRef-busybox",
+            "copyrightText": TEXT,
+            "description": TEXT * 3,
+            "externalRefs": [{
+                "referenceCategory": "PACKAGE-MANAGER",
+                "referenceType": "purl",
+                "referenceLocator": "pkg:apk/alpine/busybox@1.36.1-r5?arch=aarch64&distro=alpine-3.19.1",
+            }],
+        },
+    ],
+    "files": [
+        {
+            "fileName": "/bin/busybox",
+            "SPDXID": "SPDXRef-File-bin-busybox-5c2f",
+            "checksums": [
+                {"algorithm": "SHA1", "checksumValue": "2c0a1e5f" * 5},
+                {"algorithm": "SHA256", "checksumValue": "9f86d081" * 8},
+            ],
+            "licenseConcluded": "NOASSERTION",
+            "licenseInfoInFiles": ["NOASSERTION"],
+            "copyrightText": "",
+            "comment": TEXT,
+        },
+        {
+            "fileName": "/etc/café \\\"x\\\"",
+            "SPDXID": "SPDXRef-File-etc-cafe-1234",
+            "checksums": [{"algorithm": "SHA1", "checksumValue": "0123456789" * 4}],
+            "licenseConcluded": "NOASSERTION",
+            "copyrightText": "NOASSERTION",
+        },
+    ],
+    "hasExtractedLicensingInfos": [
+        {"licenseId": "LicenseRef-busybox", "extractedText": TEXT, "name": "busybox"},
+    ],
+    "relationships": [
+        {
+            "spdxElementId": "SPDXRef-DOCUMENT",
+            "relatedSpdxElement": "SPDXRef-DocumentRoot-File-rootfs.tar",
+            "relationshipType": "DESCRIBES",
+        },
+        {
+            "spdxElementId": "SPDXRef-DocumentRoot-File-rootfs.tar",
+            "relatedSpdxElement": "SPDXRef-Package-apk-busybox-6f1c5d2e",
+            "relationshipType": "CONTAINS",
+        },
+        {
+            "spdxElementId": "SPDXRef-Package-apk-busybox-6f1c5d2e",
+            "relatedSpdxElement": "SPDXRef-File-bin-busybox-5c2f",
+            "relationshipType": "CONTAINS",
+        },
+        {
+            "spdxElementId": "SPDXRef-File-bin-busybox-5c2f",
+            "relatedSpdxElement": "SPDXRef-File-etc-cafe-1234",
+            "relationshipType": "OTHER",
+            "comment": TEXT,
+        },
+    ],
+}
+
+# Chunk sizes splitting the document everywhere, inside strings, escapes and characters
+CHUNK_SIZES = [1, 2, 3, 5, 7, 64, utility.CHUNK_SIZE]
+
+
+def syft_bytes(indent=None):
+    return json.dumps(SYFT_OUTPUT, indent=indent, ensure_ascii=False).encode()
+
+
+class TestIterJsonMembers(unittest.TestCase):
+    def members(self, data, arrays=(), chunk_size=utility.CHUNK_SIZE):
+        with mock.patch.object(utility, "CHUNK_SIZE", chunk_size):
+            return list(iter_json_members(io.BytesIO(data), arrays))
+
+    def test_same_as_json_load(self):
+        for indent in (None, 1):
+            data = syft_bytes(indent)
+            for chunk_size in CHUNK_SIZES:
+                with self.subTest(indent=indent, chunk_size=chunk_size):
+                    members = self.members(data, SYFT_ELEMENT_ARRAYS, chunk_size)
+                    document = {}
+                    for name, value in members:
+                        if name in SYFT_ELEMENT_ARRAYS:
+                            document.setdefault(name, []).append(value)
+                        else:
+                            document[name] = value
+                    self.assertEqual(document, json.loads(data))
+
+    def test_escaped_output(self):
+        # ascii only output, with \\u escapes of characters and surrogate pairs
+        data = json.dumps(SYFT_OUTPUT).encode()
+        for chunk_size in CHUNK_SIZES:
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(dict(self.members(data, chunk_size=chunk_size)), json.loads(data))
+
+    def test_numbers(self):
+        # a number at the end of a chunk may go on in the next one
+        data = b'{"a": 1234567, "b": [1.5e10, -0.25, 100], "c": true, "d": null}'
+        for chunk_size in CHUNK_SIZES:
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.members(data, ["b"], chunk_size), [
+                    ("a", 1234567), ("b", 1.5e10), ("b", -0.25), ("b", 100), ("c", True), ("d", None),
+                ])
+
+    def test_empty(self):
+        self.assertEqual(self.members(b' {"packages": [], "files": {}} ', ["packages", "files"]),
+                         [("files", {})])
+        self.assertEqual(self.members(b"{}"), [])
+
+    def test_invalid(self):
+        for data in [b'{"a": 1', b'{"a": 1} x', b'{"a" 1}', b'[1]', b'{"a": [1, 2}', b'']:
+            with self.subTest(data=data), self.assertRaises(json.JSONDecodeError):
+                self.members(data, ["a"], 2)
+
+
+class TestFileSbomParse(unittest.TestCase):
+    def parse(self, data, chunk_size):
+        @contextmanager
+        def run_syft(self, filepath):
+            yield io.BytesIO(data)
+
+        with mock.patch.object(FileSbom, "run_syft", run_syft), mock.patch.object(utility, "CHUNK_SIZE", chunk_size):
+            return FileSbom("/tmp/rootfs.tar").document
+
+    def expected_document(self, data):
+        # json.load() of the whole output parsed by spdx-tools, with what FileSbom changes
+        document = JsonLikeDictParser().parse(json.loads(data))
+        for file in document.files:
+            file.name = os.path.basename(file.name)
+            file.license_info_in_file = [SpdxNoAssertion()]
+        return document
+
+    def test_same_as_json_load(self):
+        for indent in (None, 1):
+            data = syft_bytes(indent)
+            expected = self.expected_document(data)
+            for chunk_size in CHUNK_SIZES:
+                with self.subTest(indent=indent, chunk_size=chunk_size):
+                    document = self.parse(data, chunk_size)
+                    self.assertEqual(document.creation_info, expected.creation_info)
+                    self.assertEqual(document.packages, expected.packages)
+                    self.assertEqual(document.files, expected.files)
+                    self.assertEqual(document.relationships, expected.relationships)
+                    self.assertEqual(document.extracted_licensing_info, expected.extracted_licensing_info)
+
+
+if __name__ == "__main__":
+    unittest.main()
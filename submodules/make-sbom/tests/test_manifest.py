@@ -0,0 +1,70 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from make_sbom import read_manifest  # noqa: E402
+
+MANIFEST = """\
+- input: baseos.tar.zst
+  package: baseos.package_list.txt
+  file: [baseos.tar.zst]
+  external_sbom: [imx-boot.spdx.json]
+- file: [2024.tar]
+"""
+
+
+class TestReadManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read(self, content):
+        manifest = os.path.join(self.tmpdir.name, "manifest.yaml")
+        with open(manifest, "w") as f:
+            f.write(content)
+        return read_manifest(manifest, False, True, "syft", False)
+
+    def assertInvalid(self, content, message):
+        with self.assertRaises(SystemExit) as exit, self.assertLogs(level="ERROR") as logs:
+            self.read(content)
+        self.assertEqual(exit.exception.code, 1)
+        self.assertIn(message, logs.output[0])
+
+    def test_jobs(self):
+        jobs = self.read(MANIFEST)
+        self.assertEqual(jobs[0].input, os.path.join(self.tmpdir.name, "baseos.tar.zst"))
+        self.assertEqual(jobs[0].external_sbom, [os.path.join(self.tmpdir.name, "imx-boot.spdx.json")])
+        self.assertEqual(jobs[0].output, None)
+        self.assertTrue(jobs[0].reproducible)
+        # yaml reads this file name as a number
+        self.assertEqual((jobs[1].input, jobs[1].file), (None, [os.path.join(self.tmpdir.name, "2024.tar")]))
+
+    def test_not_a_list(self):
+        self.assertInvalid("input: baseos.tar.zst\n", "must be a list")
+
+    def test_not_a_mapping(self):
+        self.assertInvalid("- baseos.tar.zst\n", "entry 1: not a mapping")
+
+    def test_unknown_key(self):
+        self.assertInvalid("- input: a.tar\n  files: [a.tar]\n", "unknown keys files")
+
+    def test_path_list(self):
+        # not iterated character by character
+        self.assertInvalid("- input: a.tar\n  file: a.tar\n", "entry 1: file must be a list of paths")
+        self.assertInvalid("- input: [a.tar]\n", "input must be a path")
+
+    def test_no_input(self):
+        self.assertInvalid(MANIFEST + "- package: a.package_list.txt\n", "entry 3: input or file is required")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from packages_sbom import PackagesSbom  # noqa: E402
+from utility import with_occurrences  # noqa: E402
+
+PACKAGE_LIST = """\
+abos-base-2.0-r1 aarch64 {abos-base} (MIT) [installed]
+busybox-1.36.1-r5 aarch64 {busybox} (GPL-2.0-only) [installed]
+openssl-3.1.4-r1 aarch64 {openssl} (Apache-2.0) [installed]
+"""
+
+
+class TestReproducibleIds(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def get_ids(self, content, reproducible=True):
+        filepath = os.path.join(self.tmpdir.name, "rootfs.package_list.txt")
+        with open(filepath, "w") as f:
+            f.write(content)
+        return [package.spdx_id for package in PackagesSbom(filepath, reproducible=reproducible).packages]
+
+    def test_same_list(self):
+        self.assertEqual(self.get_ids(PACKAGE_LIST), self.get_ids(PACKAGE_LIST))
+        self.assertNotEqual(self.get_ids(PACKAGE_LIST, False), self.get_ids(PACKAGE_LIST, False))
+
+    def test_other_packages_changed(self):
+        # ids do not depend on the position of the package in the list
+        ids = self.get_ids(PACKAGE_LIST)
+        inserted = self.get_ids("musl-1.2.4-r2 aarch64 {musl} (MIT) [installed]\n" + PACKAGE_LIST)
+        self.assertEqual(inserted[1:], ids)
+        removed = self.get_ids(PACKAGE_LIST.split("\n", 1)[1])
+        self.assertEqual(removed, ids[1:])
+
+    def test_duplicates(self):
+        ids = self.get_ids(PACKAGE_LIST + PACKAGE_LIST.splitlines(keepends=True)[1])
+        self.assertEqual(len(set(ids)), 4)
+        self.assertEqual(ids[:3], self.get_ids(PACKAGE_LIST))
+
+    def test_with_occurrences(self):
+        self.assertEqual(with_occurrences([["a"], ["b"], ["a"], ["a", "b"]]),
+                         [["a", "0"], ["b", "0"], ["a", "1"], ["a", "b", "0"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# pyright: reportPrivateImportUsage=false
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spdx_tools.spdx.model import SpdxNoAssertion  # noqa: E402
+
+from packages_sbom import PackagesSbom  # noqa: E402
+from rename_license import LicenseNormalizer  # noqa: E402
+
+
+class TestLicenseNormalizer(unittest.TestCase):
+    def setUp(self):
+        self.normalizer = LicenseNormalizer()
+
+    def test_alpine(self):
+        licenses, unmapped = self.normalizer.normalize("alpine", [
+            "GPL2+", "MIT", "GPL2 AND (LGPL2.1+ OR MIT)", "GPL-2.0-or-later", "GPL3+ WITH GCC-exception-3.1",
+        ])
+        self.assertEqual(licenses, [
+            "GPL-2.0-or-later", "MIT", "GPL-2.0-only AND (LGPL-2.1-or-later OR MIT)", "GPL-2.0-or-later",
+            "GPL-3.0-or-later WITH GCC-exception-3.1",
+        ])
+        self.assertEqual(unmapped, {})
+
+    def test_alpine_unmapped(self):
+        # unmapped names are kept as is, with the positions of the packages using them
+        licenses, unmapped = self.normalizer.normalize("alpine", [
+            "custom:multiple", "MIT", "GPL2+ AND custom:foo", "custom:multiple",
+        ])
+        self.assertEqual(licenses, ["custom:multiple", "MIT", "GPL-2.0-or-later AND custom:foo", "custom:multiple"])
+        self.assertEqual(unmapped, {"custom:multiple": [0, 3], "custom:foo": [2]})
+
+    def test_debian(self):
+        licenses, unmapped = self.normalizer.normalize("debian", [
+            "GPL-2+", "BSD3", "GPL-2 LGPL-2.1", "MIT", "GPL-2+ with Linux-syscall-note",
+        ])
+        self.assertEqual(licenses, [
+            "GPL-2.0-or-later", "BSD-3-Clause", ["GPL-2.0-only", "LGPL-2.1-only"], "MIT",
+            # "with" exceptions are not split
+            ["GPL-2+ with Linux-syscall-note"],
+        ])
+        self.assertEqual(unmapped, {"GPL-2+ with Linux-syscall-note": [4]})
+
+    def test_debian_unmapped(self):
+        licenses, unmapped = self.normalizer.normalize("debian", ["public-domain", "GPL-2+ public-domain"])
+        self.assertEqual(licenses, ["public-domain", ["GPL-2.0-or-later", "public-domain"]])
+        self.assertEqual(unmapped, {"public-domain": [0, 1]})
+
+    def test_license_map(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".yaml") as license_map:
+            license_map.write("alpine:\n  custom:multiple: MIT AND BSD-2-Clause\n")
+            license_map.flush()
+            normalizer = LicenseNormalizer(license_map=license_map.name)
+        self.assertEqual(normalizer.normalize("alpine", ["custom:multiple", "GPL2+"]),
+                         (["MIT AND BSD-2-Clause", "GPL2+"], {"GPL2+": [1]}))
+        self.assertEqual(normalizer.normalize("debian", ["GPL-2+"]), (["GPL-2+"], {"GPL-2+": [0]}))
+
+
+class TestUnmappedLicenses(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_reported(self):
+        filepath = os.path.join(self.tmpdir.name, "rootfs.package_list.txt")
+        with open(filepath, "w") as f:
+            f.write("busybox-1.36.1-r5 aarch64 {busybox} (GPL2+) [installed]\n"
+                    "tzdata-2024a-r0 aarch64 {tzdata} (custom:public-domain) [installed]\n")
+        with self.assertLogs(level="INFO") as logs:
+            packages_sbom = PackagesSbom(filepath)
+        self.assertIn("licenses not mapped to SPDX (see license_map.yaml): custom:public-domain",
+                      "\n".join(logs.output))
+        self.assertEqual(packages_sbom.unmapped_licenses, {"custom:public-domain": ["tzdata"]})
+        busybox, tzdata = packages_sbom.packages
+        self.assertEqual(str(busybox.license_concluded), "GPL-2.0-or-later")
+        self.assertIsNone(busybox.license_comment)
+        # the license of the package list is kept in the comment
+        self.assertEqual(tzdata.license_concluded, SpdxNoAssertion())
+        self.assertEqual(tzdata.license_comment,
+                         "The following licenses could not be estimated 'custom:public-domain'")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sbom_cache import SbomCache  # noqa: E402
+
+
+class TestSbomCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = SbomCache(self.tmpdir.name, "test", max_size=300)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def put(self, key, data, mtime):
+        # mtimes are set explicitly: several writes can happen within the
+        # timestamp resolution of the filesystem
+        self.cache.put(key, data)
+        os.utime(self.cache.path(key), (mtime, mtime))
+
+    def test_get_put(self):
+        key = self.cache.key("input digest", "syft 1.6.0")
+        self.assertNotEqual(key, self.cache.key("input digest", "syft 1.7.0"))
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, b"scan")
+        self.assertEqual(self.cache.get(key), b"scan")
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_writer_failure(self):
+        key = self.cache.key("partial")
+        with self.assertRaises(RuntimeError):
+            with self.cache.writer(key) as f:
+                f.write(b"partial")
+                raise RuntimeError()
+        self.assertIsNone(self.cache.get(key))
+        self.assertEqual(self.cache.entries(), [])
+
+    def test_evict_oldest(self):
+        keys = [self.cache.key(str(index)) for index in range(3)]
+        for index, key in enumerate(keys):
+            self.put(key, b"x" * 100, 1000 + index)
+        # a fourth entry goes over max_size: the oldest one is dropped
+        self.cache.put(self.cache.key("new"), b"x" * 100)
+        self.assertIsNone(self.cache.get(keys[0]))
+        self.assertIsNotNone(self.cache.get(keys[1]))
+        self.assertIsNotNone(self.cache.get(keys[2]))
+
+    def test_evict_least_recently_used(self):
+        keys = [self.cache.key(str(index)) for index in range(3)]
+        for index, key in enumerate(keys):
+            self.put(key, b"x" * 100, 1000 + index)
+        # reading an entry makes it the most recently used
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.cache.put(self.cache.key("new"), b"x" * 100)
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.assertIsNone(self.cache.get(keys[1]))
+
+    def test_evict_large_entry(self):
+        # entries larger than max_size are not kept
+        key = self.cache.key("large")
+        self.cache.put(key, b"x" * 400)
+        self.assertIsNone(self.cache.get(key))
+
+
+if __name__ == "__main__":
+    unittest.main()
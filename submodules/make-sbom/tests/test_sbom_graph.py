@@ -0,0 +1,174 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# pyright: reportPrivateImportUsage=false
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spdx_tools.spdx.model import (  # noqa: E402
+    Checksum,
+    ChecksumAlgorithm,
+    ExternalPackageRef,
+    ExternalPackageRefCategory,
+    File,
+    Package,
+    Relationship,
+    RelationshipType,
+    SpdxNoAssertion,
+)
+
+from sbom_graph import SbomGraph  # noqa: E402
+
+
+def make_package(spdx_id, name="pkg", **kwargs):
+    return Package(spdx_id=spdx_id, name=name, download_location=SpdxNoAssertion(), **kwargs)
+
+
+def make_file(spdx_id):
+    return File(name=spdx_id, spdx_id=spdx_id, checksums=[Checksum(ChecksumAlgorithm.SHA1, "0" * 40)])
+
+
+def purl(locator):
+    return [ExternalPackageRef(ExternalPackageRefCategory.PACKAGE_MANAGER, "purl", locator)]
+
+
+def sha1(value):
+    return [Checksum(ChecksumAlgorithm.SHA1, value * 40)]
+
+
+def contains(spdx_id, related_spdx_id):
+    return Relationship(spdx_id, RelationshipType.CONTAINS, related_spdx_id)
+
+
+def triples(graph):
+    return sorted((relationship.spdx_element_id, relationship.related_spdx_element_id)
+                  for relationship in graph.relationships)
+
+
+class TestSbomGraph(unittest.TestCase):
+    def setUp(self):
+        self.graph = SbomGraph(
+            packages=[make_package("SPDXRef-root"), make_package("SPDXRef-a"), make_package("SPDXRef-b")],
+            files=[make_file("SPDXRef-file1"), make_file("SPDXRef-file2")],
+            relationships=[
+                contains("SPDXRef-root", "SPDXRef-a"),
+                contains("SPDXRef-root", "SPDXRef-b"),
+                contains("SPDXRef-a", "SPDXRef-file1"),
+                contains("SPDXRef-a", "SPDXRef-file2"),
+                contains("SPDXRef-b", "SPDXRef-file2"),
+            ],
+        )
+
+    def test_duplicate_package(self):
+        with self.assertRaises(ValueError):
+            self.graph.add_packages([make_package("SPDXRef-a")])
+
+    def test_duplicate_file(self):
+        with self.assertRaises(ValueError):
+            self.graph.merge(SbomGraph(files=[make_file("SPDXRef-file1")]))
+
+    def test_relationships_from(self):
+        related = [relationship.related_spdx_element_id for relationship in self.graph.relationships_from("SPDXRef-a")]
+        self.assertEqual(related, ["SPDXRef-file1", "SPDXRef-file2"])
+        self.assertEqual(self.graph.relationships_from("SPDXRef-a", RelationshipType.DESCRIBES), [])
+
+    def test_remove_file(self):
+        self.graph.remove_file("SPDXRef-file2")
+        self.assertIsNone(self.graph.get_file("SPDXRef-file2"))
+        self.assertEqual(triples(self.graph), [
+            ("SPDXRef-a", "SPDXRef-file1"), ("SPDXRef-root", "SPDXRef-a"), ("SPDXRef-root", "SPDXRef-b"),
+        ])
+        self.assertEqual(self.graph.relationships_to("SPDXRef-file2"), [])
+        self.assertEqual(len(self.graph.relationships_from("SPDXRef-b")), 0)
+
+    def test_remove_package(self):
+        # relationships from the package are kept, only dangling ones go
+        self.graph.remove_package("SPDXRef-b")
+        self.assertIsNone(self.graph.get_package("SPDXRef-b"))
+        self.assertNotIn(("SPDXRef-root", "SPDXRef-b"), triples(self.graph))
+        self.assertIn(("SPDXRef-b", "SPDXRef-file2"), triples(self.graph))
+
+    def test_replace_package(self):
+        self.graph.replace_package("SPDXRef-b", "SPDXRef-a")
+        self.assertIsNone(self.graph.get_package("SPDXRef-b"))
+        # root CONTAINS b and b CONTAINS file2 become duplicates of a's relationships
+        self.assertEqual(triples(self.graph), [
+            ("SPDXRef-a", "SPDXRef-file1"), ("SPDXRef-a", "SPDXRef-file2"), ("SPDXRef-root", "SPDXRef-a"),
+        ])
+        self.assertEqual(len(self.graph.relationships_to("SPDXRef-a")), 1)
+
+    def test_update_document(self):
+        class Document:
+            pass
+
+        document = Document()
+        self.graph.remove_file("SPDXRef-file1")
+        self.graph.update_document(document)
+        self.assertEqual([file.spdx_id for file in document.files], ["SPDXRef-file2"])
+        self.assertEqual(len(document.relationships), 4)
+
+
+class TestDeduplicatePackages(unittest.TestCase):
+    def deduplicate(self, *packages):
+        graph = SbomGraph(
+            packages=[make_package("SPDXRef-root"), *packages],
+            relationships=[contains("SPDXRef-root", package.spdx_id) for package in packages],
+        )
+        with mock.patch("sbom_graph.logging.info") as info:
+            duplicates = graph.deduplicate_packages()
+        return graph, duplicates, [call.args[0] % call.args[1:] for call in info.call_args_list]
+
+    def test_same_purl(self):
+        graph, duplicates, logs = self.deduplicate(
+            make_package("SPDXRef-list", "busybox", version="1.36.1-r5"),
+            make_package("SPDXRef-syft", "busybox", external_references=purl("pkg:apk/alpine/busybox@1.36.1-r5")),
+            make_package("SPDXRef-ext", "busybox-static",
+                         external_references=purl("pkg:apk/alpine/busybox@1.36.1-r5")),
+        )
+        self.assertEqual(duplicates, {"SPDXRef-ext": "SPDXRef-syft"})
+        self.assertEqual(len(logs), 1)
+        self.assertIn("SPDXRef-ext into SPDXRef-syft", logs[0])
+        # the relationship to the duplicate now points to the kept package, once
+        self.assertEqual(triples(graph), [("SPDXRef-root", "SPDXRef-list"), ("SPDXRef-root", "SPDXRef-syft")])
+
+    def test_same_name_and_version(self):
+        graph, duplicates, logs = self.deduplicate(
+            make_package("SPDXRef-list", "busybox", version="1.36.1-r5"),
+            make_package("SPDXRef-syft", "busybox", version="1.36.1-r5",
+                         external_references=purl("pkg:apk/alpine/busybox@1.36.1-r5")),
+        )
+        self.assertEqual(duplicates, {"SPDXRef-syft": "SPDXRef-list"})
+        # what the duplicate knows is kept
+        self.assertEqual(graph.get_package("SPDXRef-list").external_references[0].locator,
+                         "pkg:apk/alpine/busybox@1.36.1-r5")
+
+    def test_same_checksum(self):
+        graph, duplicates, logs = self.deduplicate(
+            make_package("SPDXRef-a", "empty", checksums=sha1("a")),
+            make_package("SPDXRef-b", "other", checksums=sha1("a")),
+            make_package("SPDXRef-c", "empty", checksums=sha1("a")),
+        )
+        # a checksum alone does not make packages of different names the same
+        self.assertEqual(duplicates, {"SPDXRef-c": "SPDXRef-a"})
+        self.assertEqual(len(logs), 1)
+
+    def test_different_packages(self):
+        graph, duplicates, logs = self.deduplicate(
+            make_package("SPDXRef-a", "busybox", version="1.36.1-r5"),
+            make_package("SPDXRef-b", "busybox", version="1.36.1-r6"),
+            make_package("SPDXRef-c", "busybox"),
+            make_package("SPDXRef-d", "busybox"),
+        )
+        self.assertEqual(duplicates, {})
+        self.assertEqual(logs, [])
+        self.assertEqual(len(graph.packages), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sbom_index import SbomIndex, license_identifiers, version_compare  # noqa: E402
+
+
+def make_document(name, packages):
+    return {
+        "name": name,
+        "documentNamespace": f"https://example.org/{name}",
+        "creationInfo": {"created": "1970-01-01T00:00:00Z"},
+        "packages": [
+            {
+                "SPDXID": f"SPDXRef-{package_name}",
+                "name": package_name,
+                "versionInfo": version,
+                "licenseConcluded": license,
+                "licenseDeclared": "NOASSERTION",
+            }
+            for package_name, version, license in packages
+        ],
+        "files": [
+            {
+                "SPDXID": "SPDXRef-File-os-release",
+                "fileName": "./etc/os-release",
+                "checksums": [{"algorithm": "SHA1", "checksumValue": "0" * 40}],
+            },
+        ],
+    }
+
+
+class TestVersionCompare(unittest.TestCase):
+    def assertOlder(self, version, other):
+        self.assertEqual(version_compare(version, other), -1, f"{version} < {other}")
+        self.assertEqual(version_compare(other, version), 1, f"{other} > {version}")
+
+    def test_numbers(self):
+        self.assertOlder("1.2.9", "1.2.10")
+        self.assertOlder("1.9", "10.0")
+        self.assertEqual(version_compare("1.02", "1.2"), 0)
+
+    def test_revisions(self):
+        self.assertOlder("3.1.4-r1", "3.1.4-r2")
+        self.assertOlder("3.1.4-r9", "3.1.4-r10")
+        self.assertOlder("2.36-9", "2.36-9+deb12u4")
+
+    def test_suffixes(self):
+        self.assertOlder("1.0", "1.0a")
+        self.assertOlder("1.0~rc1", "1.0")
+        self.assertOlder("1.0~rc1", "1.0~rc2")
+
+    def test_unknown(self):
+        self.assertEqual(version_compare(None, "1.0"), 0)
+        self.assertEqual(version_compare("1.0", None), 0)
+
+
+class TestLicenseIdentifiers(unittest.TestCase):
+    def test_expression(self):
+        self.assertEqual(license_identifiers("(MIT OR Apache-2.0) AND GPL-2.0-only WITH Linux-syscall-note"),
+                         ["Apache-2.0", "GPL-2.0-only", "Linux-syscall-note", "MIT"])
+
+    def test_no_license(self):
+        self.assertEqual(license_identifiers("NOASSERTION"), [])
+        self.assertEqual(license_identifiers(None), [])
+
+
+class TestSbomIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = SbomIndex(":memory:")
+        self.index.add_document("a.spdx.json", "a", make_document("a", [
+            ("openssl", "3.1.4-r1", "Apache-2.0"),
+            ("bash", "5.2", "GPL-3.0-or-later"),
+            ("readline", "8.2", "GPL-3.0+"),
+        ]))
+        self.index.add_document("b.spdx.json", "b", make_document("b", [
+            ("openssl", "3.1.4-r10", "Apache-2.0"),
+            ("libgcc", "13.2", "GPL-3.0 WITH GCC-exception-3.1"),
+            ("libreadline", "8.2", "LGPL-3.0-only"),
+            ("gpl", "1", "GPL-3.0.1-custom"),
+        ]))
+
+    def tearDown(self):
+        self.index.close()
+
+    def test_find_packages(self):
+        self.assertEqual([row[0] for row in self.index.find_packages("openssl")], ["a.spdx.json", "b.spdx.json"])
+        self.assertEqual([row[2] for row in self.index.find_packages("openssl", before="3.1.4-r2")], ["3.1.4-r1"])
+        self.assertEqual([row[2] for row in self.index.find_packages("openssl", version="3.1.4-r10")],
+                         ["3.1.4-r10"])
+
+    def test_find_licenses(self):
+        # GPL-3.0 matches its -only, -or-later and + variants, not LGPL-3.0 nor other versions
+        self.assertEqual([(row[1], row[3]) for row in self.index.find_licenses("GPL-3.0")], [
+            ("bash", "GPL-3.0-or-later"), ("readline", "GPL-3.0+"), ("libgcc", "GPL-3.0"),
+        ])
+        self.assertEqual([row[1] for row in self.index.find_licenses("GCC-exception-3.1")], ["libgcc"])
+        self.assertEqual(self.index.find_licenses("GPL_3.0"), [])
+
+    def test_find_files(self):
+        self.assertEqual(len(self.index.find_files(name="./etc/os-release")), 2)
+        self.assertEqual(self.index.find_files(sha256="0" * 64), [])
+
+    def test_ingest(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "c.spdx.json")
+            with open(path, "w") as f:
+                json.dump(make_document("c", [("musl", "1.2.4-r2", "MIT")]), f)
+            self.assertTrue(self.index.ingest(path))
+            # not parsed again while unchanged
+            self.assertFalse(self.index.ingest(path))
+            with open(path, "w") as f:
+                json.dump(make_document("c", [("musl", "1.2.4-r10", "MIT")]), f)
+            self.assertTrue(self.index.ingest(path))
+        self.assertEqual([row[2] for row in self.index.find_packages("musl")], ["1.2.4-r10"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,203 @@
+#  SPDX-FileCopyrightText: 2023 Atmark Techno contributors
+#
+#  SPDX-License-Identifier: MIT
+
+# pyright: reportPrivateImportUsage=false
+
+import gzip
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spdx_tools.spdx.model import (  # noqa: E402
+    Actor,
+    ActorType,
+    Annotation,
+    AnnotationType,
+    Checksum,
+    ChecksumAlgorithm,
+    CreationInfo,
+    Document,
+    ExternalPackageRef,
+    ExternalPackageRefCategory,
+    ExtractedLicensingInfo,
+    File,
+    Package,
+    PackageVerificationCode,
+    Relationship,
+    RelationshipType,
+    SpdxNoAssertion,
+)
+from spdx_tools.spdx.writer.write_anything import write_file  # noqa: E402
+
+from license_index import parse_license  # noqa: E402
+from sbom_writer import (  # noqa: E402
+    get_element_key,
+    get_validation_document,
+    validate_document,
+    write_document_to_file,
+)
+
+
+def make_document():
+    purl = ExternalPackageRef(ExternalPackageRefCategory.PACKAGE_MANAGER, "purl", "pkg:apk/alpine/busybox@1.36.1-r5")
+    packages = [
+        Package(
+            spdx_id="SPDXRef-image.bin",
+            name="image.bin",
+            version="1",
+            download_location="https://example.com/image.bin",
+            files_analyzed=False,
+            checksums=[Checksum(ChecksumAlgorithm.SHA256, "9f86d081" * 8)],
+            license_concluded=parse_license("MIT"),
+            license_declared=parse_license("MIT"),
+            copyright_text="Copyright Atmark Techno",
+        ),
+        Package(
+            spdx_id="SPDXRef-busybox",
+            name="busybox",
+            version="1.36.1-r5",
+            download_location=SpdxNoAssertion(),
+            verification_code=PackageVerificationCode("a" * 40),
+            license_concluded=SpdxNoAssertion(),
+            license_declared=parse_license("GPL-2.0-or-later AND LicenseRef-busybox"),
+            license_info_from_files=[parse_license("GPL-2.0-only"), parse_license("GPL-2.0-only")],
+            license_comment="café \"quoted\" \U0001f600",
+            copyright_text=SpdxNoAssertion(),
+            # written once, like spdx_tools does
+            external_references=[purl, purl],
+        ),
+    ]
+    files = [
+        File(
+            name="busybox",
+            spdx_id="SPDXRef-File-busybox",
+            checksums=[Checksum(ChecksumAlgorithm.SHA1, "2c0a1e5f" * 5)],
+            license_concluded=SpdxNoAssertion(),
+            license_info_in_file=[SpdxNoAssertion()],
+            copyright_text=SpdxNoAssertion(),
+        ),
+    ]
+    relationships = [
+        Relationship("SPDXRef-DOCUMENT", RelationshipType.DESCRIBES, "SPDXRef-image.bin"),
+        Relationship("SPDXRef-image.bin", RelationshipType.CONTAINS, "SPDXRef-busybox"),
+        Relationship("SPDXRef-busybox", RelationshipType.CONTAINS, "SPDXRef-File-busybox"),
+    ]
+    creation_info = CreationInfo(
+        spdx_version="SPDX-2.2",
+        spdx_id="SPDXRef-DOCUMENT",
+        name="image.bin",
+        document_namespace="https://example.com/image.bin.spdx.json",
+        creators=[Actor(ActorType.ORGANIZATION, "Atmark Techno"), Actor(ActorType.TOOL, "make-sbom")],
+        created=datetime(2024, 1, 1),
+        creator_comment="license data: 0",
+    )
+    annotations = [
+        Annotation("SPDXRef-busybox", AnnotationType.REVIEW, Actor(ActorType.PERSON, "reviewer"),
+                   datetime(2024, 1, 2), "checked"),
+        Annotation("SPDXRef-DOCUMENT", AnnotationType.OTHER, Actor(ActorType.TOOL, "make-sbom"),
+                   datetime(2024, 1, 2), "document"),
+    ]
+    extracted_licensing_info = [ExtractedLicensingInfo("LicenseRef-busybox", "busybox license text", "busybox")]
+    return Document(creation_info, packages=packages, files=files, relationships=relationships,
+                    annotations=annotations, extracted_licensing_info=extracted_licensing_info)
+
+
+class TestWriteDocument(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.expected = os.path.join(self.tmpdir.name, "expected.spdx.json")
+        write_file(make_document(), self.expected)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read_expected(self):
+        with open(self.expected, "rb") as f:
+            return f.read()
+
+    def test_same_as_spdx_tools(self):
+        output = os.path.join(self.tmpdir.name, "image.bin.spdx.json")
+        write_document_to_file(make_document(), output)
+        with open(output, "rb") as f:
+            self.assertEqual(f.read(), self.read_expected())
+
+    def test_gzip(self):
+        output = os.path.join(self.tmpdir.name, "image.bin.spdx.json.gz")
+        write_document_to_file(make_document(), output)
+        with gzip.open(output, "rb") as f:
+            self.assertEqual(f.read(), self.read_expected())
+        # the same document always gives the same file
+        with open(output, "rb") as f:
+            compressed = f.read()
+        write_document_to_file(make_document(), output)
+        with open(output, "rb") as f:
+            self.assertEqual(f.read(), compressed)
+
+    def test_empty_lists(self):
+        document = make_document()
+        document.files = []
+        document.relationships.pop()
+        document.annotations = []
+        write_file(document, self.expected)
+        output = os.path.join(self.tmpdir.name, "image.bin.spdx.json")
+        write_document_to_file(document, output)
+        with open(output, "rb") as f:
+            self.assertEqual(f.read(), self.read_expected())
+
+    def test_invalid(self):
+        document = make_document()
+        document.relationships.append(Relationship("SPDXRef-busybox", RelationshipType.CONTAINS, "SPDXRef-missing"))
+        with self.assertRaises(ValueError):
+            write_document_to_file(document, os.path.join(self.tmpdir.name, "invalid.spdx.json"))
+
+
+class TestValidatedElements(unittest.TestCase):
+    def setUp(self):
+        self.document = make_document()
+        # the elements of busybox were validated on their own, e.g. in an external sbom
+        self.validated = {get_element_key(element) for element in [
+            self.document.packages[1], self.document.files[0], self.document.relationships[2],
+        ]}
+
+    def ids(self, document):
+        return ([package.spdx_id for package in document.packages], [file.spdx_id for file in document.files],
+                [(relationship.spdx_element_id, relationship.related_spdx_element_id)
+                 for relationship in document.relationships])
+
+    def test_validation_document(self):
+        # busybox is only kept as the relationship from image.bin refers to it
+        self.assertEqual(self.ids(get_validation_document(self.document, self.validated)), (
+            ["SPDXRef-image.bin", "SPDXRef-busybox"],
+            [],
+            [("SPDXRef-DOCUMENT", "SPDXRef-image.bin"), ("SPDXRef-image.bin", "SPDXRef-busybox")],
+        ))
+        self.assertEqual(validate_document(self.document, self.validated), [])
+
+    def test_changed_after_validation(self):
+        self.document.files[0].comment = "merged"
+        packages, files, relationships = self.ids(get_validation_document(self.document, self.validated))
+        self.assertEqual(files, ["SPDXRef-File-busybox"])
+        self.assertIn(("SPDXRef-busybox", "SPDXRef-File-busybox"), relationships)
+
+    def test_validated_elements_not_checked(self):
+        self.document.files[0].checksums = [Checksum(ChecksumAlgorithm.SHA1, "not a sha1")]
+        self.assertNotEqual(validate_document(self.document), [])
+        # validated with another content
+        self.assertNotEqual(validate_document(self.document, self.validated), [])
+        self.validated.add(get_element_key(self.document.files[0]))
+        self.assertEqual(validate_document(self.document, self.validated), [])
+
+    def test_duplicate_ids(self):
+        self.document.files[0].spdx_id = "SPDXRef-busybox"
+        self.validated.add(get_element_key(self.document.files[0]))
+        messages = validate_document(self.document, self.validated)
+        self.assertTrue(any("SPDXRef-busybox" in message.validation_message for message in messages))
+
+
+if __name__ == "__main__":
+    unittest.main()
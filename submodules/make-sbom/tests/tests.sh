@@ -57,4 +57,7 @@ fixup_spdx imx-boot_armadillo_x2_2020.04-at21.spdx.json.spdx.json
     -o a6e-gw-container-2.4.1.swu.spdx.json.spdx.json || exit
 fixup_spdx a6e-gw-container-2.4.1.swu.spdx.json.spdx.json
 
+# unit tests, with the python deps installed by make_sbom.sh
+PYTHONPATH=../deps python3 -m unittest discover -s . || exit
+
 # check git diff output manually for now!!
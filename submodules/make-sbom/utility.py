@@ -2,9 +2,319 @@
 #
 #  SPDX-License-Identifier: MIT
 
-from uuid import uuid4
+import codecs
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import tarfile
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, BinaryIO, Container, Dict, IO, Iterable, Iterator, List, Optional, Sequence, Tuple
+from uuid import UUID, uuid4, uuid5
 
+CHUNK_SIZE = 1024 * 1024
 
-def get_spdx_id(name: str, uuid=False) -> str:
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# Extensions of the compressed files that can be read and written
+COMPRESSED_EXTENSIONS = [".gz", ".zst"]
+
+JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+NUMBER_CONTINUATION = re.compile(r"[0-9.eE+-]*")
+
+# construct_elements() sets the fields as stored by this spdx-tools version
+# (_<name> behind type-checked properties), others go through the constructor
+CONSTRUCT_ELEMENTS_SPDX_TOOLS = "0.8.2"
+
+# Namespace of the uuids derived from the content of an element in reproducible mode
+SPDX_ID_NAMESPACE = UUID("5b0e5c3e-4a34-4b0c-9d0c-6c2a1f1e7a3d")
+
+
+def get_spdx_id(name: str, uuid=False, content: Optional[Sequence[str]] = None) -> str:
     spdx_id = f"SPDXRef-{name.replace('_', '-').replace('+', 'p')}"
-    return f"{spdx_id}-{uuid4()}" if uuid else spdx_id
+    if not uuid:
+        return spdx_id
+    # The same content always gives the same id, otherwise ids are random.
+    # content starts with where the element was read from, and identical
+    # elements of a list are told apart with with_occurrences()
+    if content is None:
+        return f"{spdx_id}-{uuid4()}"
+    content_id = uuid5(SPDX_ID_NAMESPACE, "\0".join(content))
+    return f"{spdx_id}-{content_id}"
+
+
+def with_occurrences(contents: Iterable[Sequence[str]]) -> List[List[str]]:
+    # Each content followed by the number of identical contents before it
+    occurrences: Dict[Tuple[str, ...], int] = {}
+    result = []
+    for content in contents:
+        occurrence = occurrences.get(tuple(content), 0)
+        occurrences[tuple(content)] = occurrence + 1
+        result.append([*content, str(occurrence)])
+    return result
+
+
+def get_source_date() -> Optional[datetime]:
+    # https://reproducible-builds.org/specs/source-date-epoch/
+    epoch = os.environ.get("SOURCE_DATE_EPOCH")
+    if not epoch:
+        return None
+    return datetime.fromtimestamp(int(epoch), timezone.utc).replace(tzinfo=None)
+
+
+def get_stream_checksums(f: BinaryIO, algorithms: Iterable[str]) -> Dict[str, str]:
+    # Feed every digest from a single read pass over a fixed size buffer,
+    # so that memory usage does not depend on the file size
+    digests = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    while True:
+        size = f.readinto(buffer)  # type: ignore
+        if not size:
+            break
+        for digest in digests.values():
+            digest.update(view[:size])
+    return {algorithm: digest.hexdigest() for algorithm, digest in digests.items()}
+
+
+def get_file_checksums(filepath: str, algorithms: Iterable[str]) -> Dict[str, str]:
+    with open(filepath, "rb", buffering=0) as f:
+        return get_stream_checksums(f, algorithms)
+
+
+def get_verification_code(sha1s: Iterable[str]) -> str:
+    # SPDX 2.2 package verification code
+    return hashlib.sha1("".join(sorted(sha1s)).encode()).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _get_file_sha256(filepath: str, size: int, mtime: int) -> str:
+    return get_file_checksums(filepath, ["sha256"])["sha256"]
+
+
+def get_file_sha256(filepath: str) -> str:
+    # The same file is often hashed several times per run (cache keys...),
+    # only read it again if it changed
+    st = os.stat(filepath)
+    return _get_file_sha256(os.path.abspath(filepath), st.st_size, st.st_mtime_ns)
+
+
+def value_shape(value: Any) -> Any:
+    # Types the spdx-tools checks depend on, including the items of lists
+    value_type = type(value)
+    if value_type is list:
+        return list, frozenset(map(type, value))
+    return value_type
+
+
+@lru_cache(maxsize=None)
+def spdx_tools_version() -> Optional[str]:
+    # Only looked up by the first construct_elements(), reading package metadata is slow
+    from importlib import metadata
+
+    try:
+        version: Optional[str] = metadata.version("spdx-tools")
+    except metadata.PackageNotFoundError:
+        version = None
+    if version != CONSTRUCT_ELEMENTS_SPDX_TOOLS:
+        logging.debug("spdx-tools %s is not %s, elements are constructed one by one",
+                      version, CONSTRUCT_ELEMENTS_SPDX_TOOLS)
+    return version
+
+
+def construct_elements(cls: type, columns: Dict[str, Sequence[Any]], **common: Any) -> List[Any]:
+    # spdx-tools elements check the type of every field when constructed,
+    # which is most of the time spent building tens of thousands of them.
+    # The constructor checks the first element of each shape of values,
+    # the others are copies of its fields with the values of the column.
+    # Fields set differently from the values given (e.g. None turned
+    # into an empty list) always go through the constructor.
+    names = list(columns)
+    if spdx_tools_version() != CONSTRUCT_ELEMENTS_SPDX_TOOLS:
+        return [cls(**common, **dict(zip(names, values))) for values in zip(*columns.values())]
+    fields = [f"_{name}" for name in names]
+    templates: Dict[Tuple[Any, ...], Optional[Tuple[Dict[str, Any], List[str]]]] = {}
+    elements = []
+    for values in zip(*columns.values()):
+        shape = tuple(map(value_shape, values))
+        if shape not in templates:
+            element = cls(**common, **dict(zip(names, values)))
+            elements.append(element)
+            state = vars(element)
+            if all(field in state and state[field] is value for field, value in zip(fields, values)):
+                # lists of the template are copied, not shared between elements
+                templates[shape] = (state, [
+                    field for field, value in state.items() if isinstance(value, list) and field not in fields
+                ])
+            else:
+                templates[shape] = None
+            continue
+        template = templates[shape]
+        if template is None:
+            elements.append(cls(**common, **dict(zip(names, values))))
+            continue
+        state, lists = template
+        element = cls.__new__(cls)
+        element.__dict__.update(state)
+        element.__dict__.update({field: list(state[field]) for field in lists})
+        element.__dict__.update(zip(fields, values))
+        elements.append(element)
+    return elements
+
+
+def strip_compressed_extension(filepath: str) -> str:
+    for extension in COMPRESSED_EXTENSIONS:
+        if filepath.endswith(extension):
+            return filepath[:-len(extension)]
+    return filepath
+
+
+@contextmanager
+def open_compressed(filepath: str) -> Iterator[BinaryIO]:
+    # Plain, gzip or zstd files are all read as a decompressed stream,
+    # zstd goes through the zstd command
+    with open(filepath, "rb") as f:
+        magic = f.read(len(ZSTD_MAGIC))
+    if magic.startswith(GZIP_MAGIC):
+        with gzip.open(filepath, "rb") as f:
+            yield f  # type: ignore
+        return
+    if magic != ZSTD_MAGIC:
+        with open(filepath, "rb") as f:
+            yield f
+        return
+    try:
+        process = subprocess.Popen(["zstd", "-dcq", filepath], stdout=subprocess.PIPE)
+    except OSError:
+        logging.error("zstd is required to read %s", os.path.basename(filepath))
+        sys.exit(1)
+    stdout: IO[bytes] = process.stdout  # type: ignore
+    try:
+        yield stdout  # type: ignore
+    finally:
+        stdout.close()
+        process.wait()
+
+
+@contextmanager
+def open_tarball_stream(filepath: str) -> Iterator[tarfile.TarFile]:
+    # Members can only be read in order, nothing is extracted to disk.
+    # tarfile handles bzip2 and xz itself
+    with open_compressed(filepath) as f, tarfile.open(fileobj=f, mode="r|*") as tar:
+        yield tar
+
+
+class JsonStreamReader:
+    # Decodes the values of a json document one at a time while reading it,
+    # keeping only the text of the value being decoded in memory
+    def __init__(self, stream: IO[bytes]) -> None:
+        self.stream = stream
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+
+    def fill(self) -> bool:
+        # Appends the next chunk of the stream to the buffer, False at the end
+        data = self.stream.read(CHUNK_SIZE)
+        self.buffer = self.buffer[self.pos:] + self.text_decoder.decode(data, final=not data)
+        self.pos = 0
+        return bool(data)
+
+    def error(self, message: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(message, self.buffer, self.pos)
+
+    def peek(self) -> str:
+        # Next character which is not whitespace, "" at the end of the stream
+        while True:
+            self.pos = JSON_WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, characters: str) -> str:
+        character = self.peek()
+        if not character or character not in characters:
+            raise self.error(f"Expecting one of '{characters}'")
+        self.pos += 1
+        return character
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number ending the buffer may go on in the next chunk, e.g. "1." of "1.5"
+            if NUMBER_CONTINUATION.match(self.buffer, end).end() == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def members(self, arrays: Container[str]) -> Iterator[Tuple[str, Any]]:
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+        else:
+            while True:
+                name = self.value()
+                if not isinstance(name, str):
+                    raise self.error("Expecting property name")
+                self.expect(":")
+                if name in arrays and self.peek() == "[":
+                    self.pos += 1
+                    if self.peek() == "]":
+                        self.pos += 1
+                    else:
+                        while True:
+                            yield name, self.value()
+                            if self.expect(",]") == "]":
+                                break
+                else:
+                    yield name, self.value()
+                if self.expect(",}") == "}":
+                    break
+        if self.peek():
+            raise self.error("Extra data")
+
+
+def iter_json_members(stream: IO[bytes], arrays: Container[str] = ()) -> Iterator[Tuple[str, Any]]:
+    # (name, value) of each member of the json object read from stream.
+    # The arrays named in arrays are not decoded as a whole: each of their
+    # elements is yielded as (name, element) instead.
+    return JsonStreamReader(stream).members(arrays)
+
+
+def parse_spdx_file(filepath: str) -> Any:
+    # spdx_tools parse_file() for files that may be compressed,
+    # the format is given by the extension without the compression one.
+    # spdx_tools is imported here as sbom_index.py only needs the standard library
+    from spdx_tools.spdx.parser.jsonlikedict.json_like_dict_parser import JsonLikeDictParser
+    from spdx_tools.spdx.parser.parse_anything import parse_file
+
+    name = strip_compressed_extension(filepath)
+    if name == filepath:
+        return parse_file(filepath)
+    with open_compressed(filepath) as f:
+        if name.endswith(".json"):
+            return JsonLikeDictParser().parse(json.load(f))
+        # other formats are only parsed from files
+        with tempfile.NamedTemporaryFile(suffix=os.path.basename(name)) as plain:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                plain.write(data)
+            plain.flush()
+            return parse_file(plain.name)
@@ -7,11 +7,9 @@
 import logging
 from box import Box
 from datetime import datetime
-from hashlib import sha1, sha256
 from typing import List
 from yaml import safe_load
 
-from license_expression import get_spdx_licensing
 from spdx_tools.spdx.model import (
     Actor,
     ActorType,
@@ -26,7 +24,17 @@ from spdx_tools.spdx.model import (
     SpdxNoAssertion,
 )
 
-from utility import get_spdx_id
+from license_index import parse_license
+from sbom_graph import SbomGraph
+from utility import get_file_checksums, get_source_date, get_spdx_id
+
+
+def set_file_checksums(package: Package, file: str) -> None:
+    checksums = get_file_checksums(file, ["sha1", "sha256"])
+    package.verification_code = PackageVerificationCode(value=checksums["sha1"])
+    package.checksums = [
+        Checksum(ChecksumAlgorithm.SHA256, checksums["sha256"]),
+    ]
 
 
 class YamlSbom:
@@ -34,23 +42,35 @@ class YamlSbom:
         self,
         file: str,
         yaml: str = "config.yaml",
+        reproducible: bool = False,
+        checksums: bool = True,
     ) -> None:
         self.spdx_id = get_spdx_id(file)
+        self.reproducible = reproducible
 
         with open(yaml) as f:
             self.yaml = Box(safe_load(f), default_box=True)
         self.document = self.make_document(file, self.yaml)
         self.packages = self.make_packages(file, self.yaml)
+        # Without checksums, the file does not need to exist yet:
+        # set_file_checksums() must be called on the main package once it does
+        if checksums:
+            for package in self.packages:
+                if package.spdx_id == self.spdx_id:
+                    set_file_checksums(package, file)
+
+    def get_graph(self) -> SbomGraph:
+        return SbomGraph(packages=self.packages, relationships=self.document.relationships)
 
     def check_no_assertion(self, value):
         return value if value else SpdxNoAssertion()
 
     def check_license_no_assertion(self, value):
-        return get_spdx_licensing().parse(value) if value else SpdxNoAssertion()
+        return parse_license(value) if value else SpdxNoAssertion()
 
     def make_document(self, file: str, yaml: Box) -> Document:
         # Format to match pyspdxtools datetime format
-        date = datetime.now()
+        date = (self.reproducible and get_source_date()) or datetime.now()
         date = datetime(
             date.year, date.month, date.day, date.hour, date.minute, date.second
         )
@@ -80,11 +100,6 @@ class YamlSbom:
 
     def make_packages(self, file: str, yaml: Box) -> List[Package]:
         packages = []
-        with open(file, "rb") as f:
-            text = f.read()
-            file_sha1 = sha1(text).hexdigest()
-            file_sha256 = sha256(text).hexdigest()
-
         for key in yaml.Package.keys():
             package = yaml.Package[key]
 
@@ -93,17 +108,11 @@ class YamlSbom:
                 spdx_id = self.spdx_id
                 file_name = f"./{file}"
                 files_analyzed = True
-                verification_code = PackageVerificationCode(value=file_sha1)
-                checksum = [
-                    Checksum(ChecksumAlgorithm.SHA256, file_sha256),
-                ]
             else:
                 spdx_id = get_spdx_id(key)
                 name = key
                 file_name = None
                 files_analyzed = False
-                verification_code = None
-                checksum = []
                 self.document.relationships += [
                     Relationship(
                         spdx_id,
@@ -127,8 +136,6 @@ class YamlSbom:
                     version=str(package.version),
                     file_name=file_name,
                     files_analyzed=files_analyzed,
-                    verification_code=verification_code,
-                    checksums=checksum,
                     license_concluded=license_concluded,
                     license_declared=license_declared,
                     copyright_text=copyright,